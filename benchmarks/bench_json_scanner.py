@@ -0,0 +1,207 @@
+"""JSON提取的离线基准测试
+
+对比json_scanner单遍扫描与原先的正则级联(通用JSON提取 -> 数组正则 -> 对象正则 -> Input/Result块配对)
+在典型大模型输出语料上的耗时和提取到的数据对数量。原级联中的数组正则存在重叠分支，
+遇到未闭合的数组时回溯次数随其中对象数量指数增长(见pathological_unbalanced样本)。语料位于benchmarks/json_corpus，
+每个文件重复多次拼接成长文本，以观察两种方法随输入长度的增长情况。
+
+用法:
+    python benchmarks/bench_json_scanner.py --repeat 1,10,50
+    python benchmarks/bench_json_scanner.py --corpus my_outputs/ --chunk 4   # 同时测量按4字符分段的流式扫描
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_scanner import JsonScanner
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "json_corpus")
+# 正则级联单次运行超过该时间(秒)后不再测量更长的输入
+LEGACY_TIME_LIMIT = 10.0
+# 对象块前紧邻的 "Input": / "Result": 键名
+BLOCK_LABEL_PATTERN = re.compile(r'"(Input|Result)"\s*:\s*$')
+
+# 原正则级联使用的模式
+LEGACY_CODE_BLOCK_PATTERNS = [
+    r'```json\s*(\{.*?\})\s*```',
+    r'```json\s*(\[.*?\])\s*```',
+    r'```\s*(\{.*?\})\s*```',
+    r'```\s*(\[.*?\])\s*```',
+]
+LEGACY_JSON_PATTERNS = [
+    r'\{(?:[^{}"]|"(?:[^"\\]|\\.)*")*\}',
+    r'\{(?:[^{}"]|"(?:[^"\\]|\\.)*"|\{(?:[^{}"]|"(?:[^"\\]|\\.)*")*\})*\}',
+    r'\[(?:[^\[\]"]|"(?:[^"\\]|\\.)*"|\{(?:[^{}"]|"(?:[^"\\]|\\.)*")*\})*\]',
+]
+LEGACY_ARRAY_PATTERNS = [
+    r'\[(?:[^\[\]]|\{[^{}]*\})*\]',
+    r'\[(?:[^\[\]]|\{(?:[^{}]|\{[^{}]*\})*\})*\]',
+]
+LEGACY_OBJECT_PATTERNS = [
+    r'\{[^{}]*"Input"[^{}]*"Result"[^{}]*\}',
+    r'\{(?:[^{}]|\{[^{}]*\})*"Input"(?:[^{}]|\{[^{}]*\})*"Result"(?:[^{}]|\{[^{}]*\})*\}',
+    r'\{(?:[^{}]|\{(?:[^{}]|\{[^{}]*\})*\})*"Input"(?:[^{}]|\{(?:[^{}]|\{[^{}]*\})*\})*"Result"(?:[^{}]|\{(?:[^{}]|\{[^{}]*\})*\})*\}',
+]
+LEGACY_BLOCK_PATTERNS = [
+    r'"{}"\s*:\s*(\{{[^{{}}]*(?:\{{[^{{}}]*\}}[^{{}}]*)*\}})',
+    r'"{}"\s*:\s*(\{{(?:[^{{}}]|\{{[^{{}}]*\}})*\}})',
+]
+
+
+def _pairs_of(value):
+    """收集值中同时包含Input和Result的对象"""
+    if isinstance(value, dict):
+        if "Input" in value and "Result" in value:
+            return [value]
+        return [pair for child in value.values() for pair in _pairs_of(child)]
+    if isinstance(value, list):
+        return [pair for child in value for pair in _pairs_of(child)]
+    return []
+
+
+def _loads_all(pattern, text):
+    values = []
+    for match in re.findall(pattern, text, re.DOTALL):
+        try:
+            values.append(json.loads(match))
+        except ValueError:
+            continue
+    return values
+
+
+def legacy_extract_json(text):
+    """原extract_json_from_llm_response的复现：返回第一个能解析的(非空)JSON值"""
+    try:
+        return json.loads(text.strip())
+    except ValueError:
+        pass
+    for pattern in LEGACY_CODE_BLOCK_PATTERNS:
+        match = re.search(pattern, text, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(1))
+            except ValueError:
+                continue
+    for pattern in LEGACY_JSON_PATTERNS:
+        for value in _loads_all(pattern, text):
+            if isinstance(value, (dict, list)) and value:
+                return value
+    return None
+
+
+def legacy_extract_pairs(text):
+    """原正则级联的复现：通用提取 -> 数组正则 -> 对象正则 -> Input/Result块配对，某一步提取到数据对即返回"""
+    value = legacy_extract_json(text)
+    if isinstance(value, dict) and "Input" in value and "Result" in value:
+        return [value]
+    if isinstance(value, list):
+        pairs = [item for item in value if isinstance(item, dict) and "Input" in item and "Result" in item]
+        if pairs:
+            return pairs
+    for patterns in (LEGACY_ARRAY_PATTERNS, LEGACY_OBJECT_PATTERNS):
+        for pattern in patterns:
+            pairs = [pair for value in _loads_all(pattern, text) for pair in _pairs_of(value)]
+            if pairs:
+                return pairs
+    blocks = {}
+    for label in ("Input", "Result"):
+        blocks[label] = []
+        for pattern in LEGACY_BLOCK_PATTERNS:
+            blocks[label] = _loads_all(pattern.format(label), text)
+            if blocks[label]:
+                break
+    return [{"Input": i, "Result": r} for i, r in zip(blocks["Input"], blocks["Result"])]
+
+
+def scanner_extract_pairs(text, chunk=0):
+    """单遍扫描提取数据对(与数据生成页面的逻辑一致)；chunk>0时按该长度分段送入，模拟流式输出"""
+    labeled = {"Input": [], "Result": []}
+
+    def record_labeled_block(start, end):
+        if text[start] == "{":
+            label = BLOCK_LABEL_PATTERN.search(text[max(0, start - 40):start])
+            if label:
+                labeled[label.group(1)].append((start, end))
+
+    scanner = JsonScanner(on_close=record_labeled_block)
+    step = chunk if chunk > 0 else len(text) or 1
+    values = []
+    for i in range(0, len(text), step):
+        values.extend(scanner.feed(text[i:i + step]))
+    values.extend(scanner.finish())
+    pairs = [pair for item in values for pair in _pairs_of(item.value)]
+    if pairs:
+        return pairs
+    blocks = {label: [json.loads(text[start:end]) for start, end in spans] for label, spans in labeled.items()}
+    return [{"Input": i, "Result": r} for i, r in zip(blocks["Input"], blocks["Result"])]
+
+
+def measure(func, text, rounds):
+    """返回(平均耗时秒, 提取结果数)"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = func(text)
+    elapsed = (time.perf_counter() - start) / rounds
+    return elapsed, len(result)
+
+
+def load_corpus(path):
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        if name.endswith((".txt", ".md", ".json")):
+            with open(os.path.join(path, name), "r", encoding="utf-8") as f:
+                corpus.append((os.path.splitext(name)[0], f.read()))
+    return corpus
+
+
+def print_table(results):
+    columns = ["sample", "repeat", "chars", "legacy_ms", "legacy_pairs", "scanner_ms", "scanner_pairs",
+               "stream_ms", "speedup"]
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in results)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for r in results:
+        print("  ".join(str(r.get(c, "")).ljust(widths[c]) for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON提取基准测试")
+    parser.add_argument("--corpus", default=CORPUS_DIR, help="语料目录")
+    parser.add_argument("--repeat", default="1,10,50", help="每个样本重复拼接的次数列表，逗号分隔")
+    parser.add_argument("--rounds", type=int, default=5, help="每种情况的测量轮数")
+    parser.add_argument("--chunk", type=int, default=0, help="大于0时额外测量按该长度分段的流式扫描")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    results = []
+    for name, sample in load_corpus(args.corpus):
+        legacy_slow = False
+        for repeat in [int(r) for r in args.repeat.split(",")]:
+            text = "\n\n".join([sample] * repeat)
+            row = {"sample": name, "repeat": repeat, "chars": len(text)}
+            scanner_time, row["scanner_pairs"] = measure(scanner_extract_pairs, text, args.rounds)
+            row["scanner_ms"] = round(scanner_time * 1000, 3)
+            if args.chunk > 0:
+                stream_time, _ = measure(lambda t: scanner_extract_pairs(t, args.chunk), text, args.rounds)
+                row["stream_ms"] = round(stream_time * 1000, 3)
+            if legacy_slow:
+                row["legacy_ms"] = "skipped"
+            else:
+                legacy_time, row["legacy_pairs"] = measure(legacy_extract_pairs, text, 1)
+                row["legacy_ms"] = round(legacy_time * 1000, 3)
+                row["speedup"] = f"{legacy_time / scanner_time:.1f}x" if scanner_time else ""
+                legacy_slow = legacy_time > LEGACY_TIME_LIMIT
+            results.append(row)
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
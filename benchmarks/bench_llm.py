@@ -0,0 +1,211 @@
+"""大模型调用路径的离线压测
+
+在本地启动模拟大模型服务(mock_llm_server)，测量语义过滤和数据生成流程的端到端吞吐量、
+单次调用延迟分位数(p50/p95/p99，包含限流等待和重试)以及注入错误后的失败处理情况。
+
+用法:
+    python benchmarks/bench_llm.py --rows 500 --workers 1,8,16 --batch-size 1,20 \\
+        --latency lognormal:0.3,0.5 --error-rate 0.02 --throttle-rate 0.02 --cache
+    python benchmarks/bench_llm.py --base-url http://127.0.0.1:8000   # 使用已启动的模拟服务
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm
+from mock_llm_server import MockLLMServer, MockResponder
+from generation_engine import GenerationJob
+
+PROJECT_NAME = "bench"
+WORDS = ["综艺", "健身", "音乐", "电影", "纪录片", "动漫", "体育", "新闻", "搞笑", "美食", "旅行", "科技"]
+
+
+class RecordingClient(llm.LLMClient):
+    """记录每次调用耗时和失败次数的客户端"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latencies = []
+            self.failures = 0
+
+    def generate(self, prompt, api_key, model="qwen-max", **params):
+        start = time.perf_counter()
+        try:
+            return super().generate(prompt, api_key, model=model, **params)
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            with self._lock:
+                self.latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, p):
+    """最近秩法分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def server_stats(base_url):
+    response = llm.get_default_client().session.get(base_url + "/stats", timeout=5)
+    return response.json()
+
+
+def make_manager(rows, seed=0):
+    """在临时目录中创建压测项目并写入合成数据"""
+    from data_manager import UniversalDataManager
+    os.chdir(tempfile.mkdtemp(prefix="bench_llm_"))
+    manager = UniversalDataManager(api_key="mock")
+    manager.create_project(PROJECT_NAME,
+                           {"type": "object", "properties": {"query": {"type": "string"}}},
+                           {"type": "object", "properties": {"intent": {"type": "string"}}})
+    manager.set_project(PROJECT_NAME)
+    rng = random.Random(seed)
+    manager.add_generated_data([
+        {"Input": {"query": f"我想看{rng.choice(WORDS)}相关的{rng.choice(WORDS)}视频"},
+         "Result": {"intent": rng.choice(WORDS)}}
+        for _ in range(rows)
+    ])
+    return manager
+
+
+def run_case(client, base_url, name, items, func):
+    """执行一个压测场景，返回统计结果"""
+    client.reset()
+    before = server_stats(base_url)
+    start = time.perf_counter()
+    error = None
+    try:
+        output = func()
+    except Exception as e:
+        output, error = None, str(e)
+    elapsed = time.perf_counter() - start
+    after = server_stats(base_url)
+    latencies = list(client.latencies)
+    result = {
+        "case": name,
+        "items": items,
+        "seconds": round(elapsed, 3),
+        "items_per_sec": round(items / elapsed, 2) if elapsed else 0.0,
+        "calls": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "failed_calls": client.failures,
+        "http_requests": after["requests"] - before["requests"],
+        "throttled": after["throttled"] - before["throttled"],
+        "server_errors": after["errors"] - before["errors"],
+    }
+    if error:
+        result["error"] = error
+    if isinstance(output, list):
+        result["output"] = len(output)
+    return result
+
+
+def bench_filter(manager, client, base_url, workers, batch_size, use_cache, label):
+    data = manager.train_data
+    return run_case(
+        client, base_url, f"filter w={workers} batch={batch_size} {label}", len(data),
+        lambda: manager.filter_by_llm("train", "和音乐相关的内容", data=data, max_workers=workers,
+                                      batch_size=batch_size, use_cache=use_cache),
+    )
+
+
+def bench_generate(manager, client, base_url, workers, count):
+    """用批量生成任务生成count条Self-instruct数据(输出到审核队列，不写入数据集)"""
+    def generate_all():
+        job = GenerationJob(manager, mode="self_instruct", target=count, system_prompt="你是视频搜索助手的数据生成器。",
+                            max_workers=workers, destination="review")
+        job.start().join()
+        return job.take_review()
+
+    return run_case(client, base_url, f"self_instruct w={workers}", count, generate_all)
+
+
+def print_table(results):
+    columns = ["case", "items", "seconds", "items_per_sec", "calls", "p50_ms", "p95_ms", "p99_ms",
+               "failed_calls", "http_requests", "throttled", "server_errors", "output"]
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in results)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for r in results:
+        print("  ".join(str(r.get(c, "")).ljust(widths[c]) for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大模型调用路径离线压测")
+    parser.add_argument("--rows", type=int, default=200, help="语义过滤的数据条数")
+    parser.add_argument("--generate", type=int, default=50, help="批量生成的Self-instruct数据条数，0表示跳过")
+    parser.add_argument("--workers", default="1,8", help="并发数列表，逗号分隔")
+    parser.add_argument("--batch-size", default="1,20", help="每个请求判断的数据条数列表，逗号分隔")
+    parser.add_argument("--cache", action="store_true", help="额外测量启用响应缓存时的冷/热两次运行")
+    parser.add_argument("--base-url", help="使用已启动的模拟服务，不指定时在进程内启动")
+    parser.add_argument("--latency", default="lognormal:0.2,0.5", help="进程内模拟服务的延迟分布")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=llm.DEFAULT_RPM)
+    parser.add_argument("--tpm", type=int, default=llm.DEFAULT_TPM)
+    parser.add_argument("--timeout", type=float, default=5.0, help="客户端请求超时(秒)")
+    parser.add_argument("--backoff-base", type=float, default=0.2, help="重试退避基数(秒)")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="显示数据管理器和客户端的日志输出")
+    args = parser.parse_args()
+    # 压测项目建在临时目录中，输出路径需要提前转换为绝对路径
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server = MockLLMServer(latency=args.latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                               hang_rate=args.hang_rate, hang_seconds=args.timeout * 2,
+                               responder=MockResponder())
+        base_url = server.start()
+    client = RecordingClient(base_url=base_url, rpm=args.rpm, tpm=args.tpm, timeout=args.timeout,
+                             backoff_base=args.backoff_base, backoff_max=5.0)
+    llm.set_default_client(client)
+
+    results = []
+    # 默认屏蔽过程中的逐条日志，只输出压测结果
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    try:
+        with quiet:
+            manager = make_manager(args.rows)
+            for workers in [int(w) for w in args.workers.split(",")]:
+                for batch_size in [int(b) for b in args.batch_size.split(",")]:
+                    results.append(bench_filter(manager, client, base_url, workers, batch_size, False, "no-cache"))
+                    if args.cache:
+                        manager.clear_llm_cache()
+                        results.append(bench_filter(manager, client, base_url, workers, batch_size, True, "cache-cold"))
+                        results.append(bench_filter(manager, client, base_url, workers, batch_size, True, "cache-warm"))
+                if args.generate:
+                    results.append(bench_generate(manager, client, base_url, workers, args.generate))
+    finally:
+        if server:
+            server.stop()
+
+    print_table(results)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
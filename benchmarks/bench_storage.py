@@ -0,0 +1,143 @@
+"""JSONL与SQLite存储引擎的对比压测
+
+在临时目录中为每种存储引擎创建相同的合成数据集，测量冷启动打开、按id读取、修改并保存、
+追加数据、标签/正则/字段过滤和全量遍历的耗时，并核对两种引擎的过滤结果条数是否一致。
+
+用法:
+    python benchmarks/bench_storage.py --rows 10000,100000
+    python benchmarks/bench_storage.py --rows 200000 --backends sqlite --modify 500 --json storage.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_manager import UniversalDataManager
+from dataset_registry import get_registry
+from sqlite_store import STORAGE_BACKENDS
+
+WORDS = ["综艺", "健身", "音乐", "电影", "纪录片", "动漫", "体育", "新闻", "搞笑", "美食", "旅行", "科技"]
+TAG_FILTER = ["音乐", "综艺"]
+REGEX_FILTER = r"想看电影相关的\w+视频"
+FIELD_FILTER = ("intent", "音乐")
+
+
+def make_records(rows, seed=0):
+    rng = random.Random(seed)
+    return [
+        {"Input": {"query": f"我想看{rng.choice(WORDS)}相关的{rng.choice(WORDS)}视频",
+                   "history": [{"role": "user", "content": rng.choice(WORDS)}]},
+         "Result": {"intent": rng.choice(WORDS), "response": "好的" * rng.randint(1, 20)}}
+        for _ in range(rows)
+    ]
+
+
+def timed(func):
+    start = time.perf_counter()
+    output = func()
+    return time.perf_counter() - start, output
+
+
+def bench_backend(backend, rows, lookups, modify, append, seed=0):
+    """在当前目录下创建一个项目并依次执行各场景，返回结果行列表"""
+    name = f"bench_{backend}_{rows}"
+    results = []
+
+    def add(case, seconds, ops=1, output=""):
+        results.append({"backend": backend, "rows": rows, "case": case, "seconds": round(seconds, 4),
+                        "ms_per_op": round(seconds * 1000 / ops, 3), "output": output})
+
+    creator = UniversalDataManager(api_key="mock")
+    creator.create_project(name, {"type": "object"}, {"type": "object"}, storage_backend=backend)
+    data_dir = os.path.join(creator.projects_root, name)
+    manager = UniversalDataManager(project_name=name, api_key="mock")
+    seconds, _ = timed(lambda: manager.append_to_store(make_records(rows, seed), "train"))
+    add("import", seconds, rows)
+    size = sum(os.path.getsize(os.path.join(data_dir, f)) for f in os.listdir(data_dir)
+               if f.startswith("train_data."))
+
+    # 冷启动：丢弃进程内共享的快照后重新打开项目
+    get_registry().forget(data_dir)
+    seconds, manager = timed(lambda: UniversalDataManager(project_name=name, api_key="mock"))
+    add("open", seconds, output=f"{size / 1024 / 1024:.1f}MB")
+
+    rng = random.Random(seed)
+    ids = [rng.randint(1, rows) for _ in range(lookups)]
+    seconds, found = timed(lambda: sum(manager.get_item(item_id) is not None for item_id in ids))
+    add("get_item", seconds, lookups, found)
+
+    def modify_and_save():
+        for item_id in ids[:modify]:
+            manager.modify_item("train", item_id, {"Result.intent": rng.choice(WORDS)})
+            manager.save_data()
+    seconds, _ = timed(modify_and_save)
+    add("modify+save", seconds, modify)
+
+    seconds, _ = timed(lambda: manager.add_generated_data(make_records(append, seed + 1)))
+    add("add_generated_data", seconds, append)
+
+    seconds, output = timed(lambda: len(manager.filter_by_tags("train", TAG_FILTER)))
+    add("filter_tags", seconds, output=output)
+    seconds, output = timed(lambda: len(manager.filter_by_regex("train", REGEX_FILTER)))
+    add("filter_regex", seconds, output=output)
+    seconds, output = timed(lambda: len(manager.filter_by_field("train", *FIELD_FILTER)))
+    add("filter_field", seconds, output=output)
+    seconds, output = timed(lambda: sum(1 for _ in manager.train_data))
+    add("iterate", seconds, output=output)
+    return results
+
+
+def print_table(results):
+    columns = ["backend", "rows", "case", "seconds", "ms_per_op", "output"]
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in results)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for r in results:
+        print("  ".join(str(r.get(c, "")).ljust(widths[c]) for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSONL与SQLite存储引擎对比压测")
+    parser.add_argument("--rows", default="10000,100000", help="数据条数列表，逗号分隔")
+    parser.add_argument("--backends", default=",".join(STORAGE_BACKENDS), help="存储引擎列表，逗号分隔")
+    parser.add_argument("--lookups", type=int, default=1000, help="按id读取的次数")
+    parser.add_argument("--modify", type=int, default=100, help="逐条修改并保存的次数")
+    parser.add_argument("--append", type=int, default=1000, help="追加的数据条数")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="显示数据管理器的日志输出")
+    args = parser.parse_args()
+    # 压测项目建在临时目录中，输出路径需要提前转换为绝对路径
+    json_path = os.path.abspath(args.json) if args.json else None
+    os.chdir(tempfile.mkdtemp(prefix="bench_storage_"))
+
+    results = []
+    # 默认屏蔽过程中的逐条日志，只输出压测结果
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with quiet:
+        for rows in [int(r) for r in args.rows.split(",")]:
+            for backend in args.backends.split(","):
+                results.append(bench_backend(backend, rows, args.lookups, min(args.modify, args.lookups),
+                                             args.append))
+    rows_by_case = {}
+    for backend_results in results:
+        for row in backend_results:
+            if row["case"].startswith("filter_") or row["case"] == "iterate":
+                rows_by_case.setdefault((row["rows"], row["case"]), set()).add(row["output"])
+    results = [row for backend_results in results for row in backend_results]
+
+    print_table(results)
+    mismatched = [f"{rows}条/{case}" for (rows, case), outputs in rows_by_case.items() if len(outputs) > 1]
+    if mismatched:
+        print(f"警告: 各存储引擎的结果条数不一致: {', '.join(mismatched)}")
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import os
+import gzip
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from storage import atomic_open
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet导出是可选功能
+    pa = None
+    pq = None
+
+# 支持的导出格式：原始数据JSONL、对话格式JSONL、Parquet
+EXPORT_FORMATS = ("jsonl", "chat", "parquet")
+# 每个编码任务包含的条数
+EXPORT_BATCH_SIZE = 2000
+# 默认的编码进程数，1表示在当前进程中编码
+DEFAULT_EXPORT_WORKERS = max(1, min(4, os.cpu_count() or 1))
+# 对话格式中用于构造最后一轮用户消息和助手回复的字段(按顺序取第一个存在的)
+CHAT_QUERY_FIELDS = ("current_query", "query", "user_input")
+CHAT_RESPONSE_FIELDS = ("response",)
+# 历史对话中可能出现的用户/助手字段名
+_HISTORY_USER_KEYS = ("user", "query", "question", "input")
+_HISTORY_ASSISTANT_KEYS = ("assistant", "response", "answer", "output")
+
+
+def _first_text(data, fields):
+    for field in fields:
+        value = data.get(field) if isinstance(data, dict) else None
+        if isinstance(value, str) and value:
+            return value
+    return None
+
+
+def history_to_messages(history) -> List[Dict[str, str]]:
+    """把Input.history转换为消息列表
+
+    支持 {"role", "content"} 消息、{"user"/"query": ..., "assistant"/"response": ...} 问答对，
+    以及按用户/助手交替排列的字符串列表。
+    """
+    messages = []
+    if not isinstance(history, list):
+        return messages
+    for position, turn in enumerate(history):
+        if isinstance(turn, str):
+            messages.append({"role": "user" if position % 2 == 0 else "assistant", "content": turn})
+        elif isinstance(turn, dict):
+            if "role" in turn and "content" in turn:
+                messages.append({"role": str(turn["role"]), "content": turn["content"]})
+                continue
+            user = _first_text(turn, _HISTORY_USER_KEYS)
+            assistant = _first_text(turn, _HISTORY_ASSISTANT_KEYS)
+            if user:
+                messages.append({"role": "user", "content": user})
+            if assistant:
+                messages.append({"role": "assistant", "content": assistant})
+    return messages
+
+
+def has_chat_fields(record, query_fields=CHAT_QUERY_FIELDS, response_fields=CHAT_RESPONSE_FIELDS) -> bool:
+    """数据是否同时有查询和回复，可以转换为对话格式"""
+    return (_first_text(record.get("Input", {}), query_fields) is not None
+            and _first_text(record.get("Result", {}), response_fields) is not None)
+
+
+def to_chat_record(record, system_prompt="", query_fields=CHAT_QUERY_FIELDS,
+                   response_fields=CHAT_RESPONSE_FIELDS) -> Optional[Dict[str, Any]]:
+    """把一条数据转换为对话格式 {"messages": [...]}，缺少查询或回复时返回None"""
+    input_data = record.get("Input", {})
+    result_data = record.get("Result", {})
+    query = _first_text(input_data, query_fields)
+    response = _first_text(result_data, response_fields)
+    if query is None or response is None:
+        return None
+    messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+    messages.extend(history_to_messages(input_data.get("history")))
+    messages.append({"role": "user", "content": query})
+    messages.append({"role": "assistant", "content": response})
+    return {"messages": messages}
+
+
+def encode_batch(records, fmt, options):
+    """编码一批数据，在编码进程中执行
+
+    JSONL/对话格式返回(字节串, 写出条数, 跳过条数)，compress=True时字节串为独立的gzip成员，
+    多个成员直接拼接仍是合法的gzip文件；Parquet返回(列数据字典, 写出条数, 0)。
+    """
+    if fmt == "parquet":
+        columns = {"id": [], "input": [], "result": []}
+        for record in records:
+            result = record.get("Result", {})
+            columns["id"].append(json.dumps(result.get("id"), ensure_ascii=False))
+            columns["input"].append(json.dumps(record.get("Input", {}), ensure_ascii=False))
+            columns["result"].append(json.dumps(result, ensure_ascii=False))
+        return columns, len(records), 0
+    lines = []
+    skipped = 0
+    for record in records:
+        if fmt == "chat":
+            record = to_chat_record(record, options.get("system_prompt", ""),
+                                    options.get("query_fields", CHAT_QUERY_FIELDS),
+                                    options.get("response_fields", CHAT_RESPONSE_FIELDS))
+            if record is None:
+                skipped += 1
+                continue
+        lines.append(json.dumps(record, ensure_ascii=False))
+    data = ("\n".join(lines) + "\n").encode("utf-8") if lines else b""
+    if options.get("compress") and data:
+        data = gzip.compress(data, compresslevel=options.get("compresslevel", 6))
+    return data, len(lines), skipped
+
+
+class _ShardWriter:
+    """按条数切分输出文件，每个分片通过临时文件原子写入；导出失败时删除已写完的分片"""
+
+    def __init__(self, output_dir, name, fmt, shard_size, compress, parquet_compression):
+        self.output_dir = output_dir
+        self.name = name
+        self.fmt = fmt
+        self.shard_size = shard_size
+        self.compress = compress
+        self.parquet_compression = parquet_compression
+        self.files = []
+        self.bytes = 0
+        self._shard = -1
+        self._context = None
+        self._file = None
+        self._parquet_writer = None
+
+    def path_for(self, shard):
+        ext = ".parquet" if self.fmt == "parquet" else ".jsonl"
+        if self.compress and self.fmt != "parquet":
+            ext += ".gz"
+        suffix = f"-{shard:05d}" if self.shard_size else ""
+        return os.path.join(self.output_dir, f"{self.name}{suffix}{ext}")
+
+    def write(self, shard, payload, count):
+        if shard != self._shard:
+            self.close()
+            self._shard = shard
+            path = self.path_for(shard)
+            self._context = atomic_open(path, 'wb')
+            self._file = self._context.__enter__()
+            self.files.append({"path": path, "records": 0})
+        if self.fmt == "parquet":
+            table = pa.table(payload)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self._file, table.schema,
+                                                        compression=self.parquet_compression)
+            self._parquet_writer.write_table(table)
+        else:
+            self._file.write(payload)
+        self.files[-1]["records"] += count
+
+    def close(self, error=None):
+        if self._context is None:
+            return
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+        context, self._context = self._context, None
+        if error is None:
+            context.__exit__(None, None, None)
+            self.files[-1]["bytes"] = os.path.getsize(self.files[-1]["path"])
+            self.bytes += self.files[-1]["bytes"]
+        else:
+            context.__exit__(type(error), error, error.__traceback__)
+
+    def abort(self, error):
+        """丢弃正在写的分片，并删除之前已写完的分片，不留下不完整的导出结果"""
+        self.close(error=error)
+        removed = 0
+        for file in self.files:
+            if "bytes" in file and os.path.exists(file["path"]):
+                os.remove(file["path"])
+                removed += 1
+        if removed:
+            print(f"导出失败，已删除已写完的{removed}个分片文件")
+        self.files = []
+        self.bytes = 0
+
+
+def _skip_unconvertible(records, query_fields, response_fields, report):
+    """对话格式导出时在切分前去掉缺少查询或回复的数据(计入report["skipped"])，分片按实际写出的条数切分"""
+    for record in records:
+        if has_chat_fields(record, query_fields, response_fields):
+            yield record
+        else:
+            report["skipped"] += 1
+
+
+def _iter_batches(records, batch_size, shard_size):
+    """把数据流切成(分片号, 批次)；批次不跨越分片边界"""
+    shard, in_shard, batch = 0, 0, []
+    for record in records:
+        batch.append(record)
+        in_shard += 1
+        if shard_size and in_shard >= shard_size:
+            yield shard, batch
+            shard, in_shard, batch = shard + 1, 0, []
+        elif len(batch) >= batch_size:
+            yield shard, batch
+            batch = []
+    if batch:
+        yield shard, batch
+
+
+def export_records(records, output_dir, name="export", fmt="jsonl", compress=False, shard_size=0,
+                   workers=DEFAULT_EXPORT_WORKERS, batch_size=EXPORT_BATCH_SIZE, system_prompt="",
+                   query_fields=CHAT_QUERY_FIELDS, response_fields=CHAT_RESPONSE_FIELDS,
+                   parquet_compression="snappy", total=None,
+                   callback: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+    """把数据流导出为文件
+
+    records为任意数据迭代器(如manager.iter_records)，按batch_size分批交给workers个进程并行编码(和压缩)，
+    主进程按原顺序写入；同时在途的批次不超过workers的两倍，内存占用与导出总量无关。
+    fmt: "jsonl"原样导出，"chat"导出为 {"messages": [...]} 对话格式(由Input.history、查询字段和Result.response构造，
+    缺少查询或回复的数据跳过)，"parquet"导出为id/input/result三列(JSON字符串，需要pyarrow)。
+    compress=True时JSONL以gzip压缩；Parquet使用parquet_compression指定的列压缩。
+    shard_size>0时每shard_size条写一个文件(name-00000.jsonl、name-00001.jsonl…)，按写出的条数计，跳过的数据不占分片名额。
+    导出中途失败时删除本次已写出的全部分片后再抛出异常。
+    total为预计条数，仅用于估算进度。
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    if fmt == "parquet" and pa is None:
+        raise ValueError("导出Parquet文件需要安装pyarrow: pip install pyarrow")
+    os.makedirs(output_dir, exist_ok=True)
+    options = {"system_prompt": system_prompt, "query_fields": tuple(query_fields),
+               "response_fields": tuple(response_fields), "compress": compress}
+    writer = _ShardWriter(output_dir, name, fmt, shard_size, compress, parquet_compression)
+    report = {"records": 0, "skipped": 0, "format": fmt}
+    started = time.time()
+
+    def write_result(shard, result):
+        payload, written, skipped = result
+        if written:
+            writer.write(shard, payload, written)
+        report["records"] += written
+        report["skipped"] += skipped
+        if callback:
+            done = report["records"] + report["skipped"]
+            callback(f"已导出{report['records']}条", min(1.0, done / total) if total else 0.0)
+
+    if fmt == "chat":
+        records = _skip_unconvertible(records, options["query_fields"], options["response_fields"], report)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        pending = deque()
+        for shard, batch in _iter_batches(records, batch_size, shard_size):
+            if executor is None:
+                write_result(shard, encode_batch(batch, fmt, options))
+                continue
+            pending.append((shard, executor.submit(encode_batch, batch, fmt, options)))
+            # 按提交顺序写出，限制在途批次数量
+            while len(pending) >= workers * 2 or (pending and pending[0][1].done()):
+                shard_done, future = pending.popleft()
+                write_result(shard_done, future.result())
+        while pending:
+            shard_done, future = pending.popleft()
+            write_result(shard_done, future.result())
+        writer.close()
+    except BaseException as e:
+        writer.abort(e)
+        raise
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    report["files"] = writer.files
+    report["bytes"] = writer.bytes
+    report["elapsed"] = time.time() - started
+    report["rate"] = report["records"] / report["elapsed"] if report["elapsed"] > 0 else 0.0
+    if callback:
+        callback("导出完成", 1.0)
+    print(f"导出完成: {report['records']}条(跳过{report['skipped']}条)，{len(writer.files)}个文件，"
+          f"{report['bytes'] / 1024 / 1024:.1f}MB，耗时{report['elapsed']:.2f}秒")
+    return report
+
+
+def export_dataset(manager, output_dir, data_type="train", filters: Optional[List[Dict[str, Any]]] = None,
+                   name=None, callback=None, **kwargs) -> Dict[str, Any]:
+    """按过滤条件(格式同filter_combined)导出当前项目的数据集，其余参数见export_records"""
+    records = manager.iter_records(data_type, filters)
+    total = len(manager.train_data if data_type == "train" else manager.val_data)
+    name = name or f"{manager.current_project or 'data'}_{data_type}"
+    return export_records(records, output_dir, name=name, total=None if filters else total,
+                          callback=callback, **kwargs)
@@ -0,0 +1,401 @@
+import io
+import os
+import csv
+import gzip
+import json
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from schema_migration import coerce_value
+from schema_validator import count_errors, top_errors
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet导入是可选功能
+    pq = None
+
+# 支持的导入格式
+IMPORT_FORMATS = ("jsonl", "json", "csv", "parquet")
+# 每攒够这么多条校验并追加一次
+IMPORT_CHUNK_SIZE = 5000
+# 流式解析JSON数组时每次读取的字符数
+JSON_READ_SIZE = 1 << 16
+# 导入报告中保留的不合法行明细数
+IMPORT_SAMPLE_ERRORS = 100
+# 不合法行的处理方式：跳过，或照常导入
+INVALID_POLICIES = ("skip", "keep")
+
+
+class _CountingReader(io.RawIOBase):
+    """统计已读取字节数的二进制流包装，用于按字节估算导入进度"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self.bytes_read += n
+        return n
+
+
+def detect_format(name: str) -> str:
+    """根据文件名判断导入格式(忽略.gz后缀)"""
+    base = name[:-3] if name.endswith(".gz") else name
+    ext = os.path.splitext(base)[1].lower()
+    if ext in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if ext == ".json":
+        return "json"
+    if ext in (".csv", ".tsv"):
+        return "csv"
+    if ext == ".parquet":
+        return "parquet"
+    raise ValueError(f"无法识别的文件格式: {name}，支持 .jsonl/.json/.csv/.parquet(可加.gz)")
+
+
+def iter_jsonl_rows(stream) -> Iterator[Dict[str, Any]]:
+    """逐行读取JSONL"""
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"第{line_no}行不是合法的JSON: {str(e)}")
+
+
+def iter_json_array_rows(stream) -> Iterator[Any]:
+    """增量解析顶层JSON数组，每次只在内存中保留当前元素所在的一段文本"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    started = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(JSON_READ_SIZE)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    skip_whitespace()
+    if pos >= len(buffer) or buffer[pos] != "[":
+        raise ValueError("JSON文件的顶层必须是数组")
+    pos += 1
+    while True:
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise ValueError("JSON数组没有结束")
+        if buffer[pos] == "]":
+            return
+        if started:
+            if buffer[pos] != ",":
+                raise ValueError(f"JSON数组元素之间缺少逗号: {buffer[pos:pos + 20]!r}")
+            pos += 1
+            skip_whitespace()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                # 元素跨越了已读取的文本，继续读取；读到文件末尾仍无法解析说明格式错误
+                if eof:
+                    raise ValueError(f"JSON数组元素不合法: {buffer[pos:pos + 50]!r}")
+                fill()
+                continue
+            # 数字可能被读取边界截断(如12|34)，未到文件末尾时多读一段再解析
+            if end == len(buffer) and not eof:
+                fill()
+                continue
+            break
+        pos = end
+        started = True
+        yield value
+        if pos > JSON_READ_SIZE:
+            buffer = buffer[pos:]
+            pos = 0
+
+
+def iter_csv_rows(stream) -> Iterator[Dict[str, Any]]:
+    """按表头读取CSV(制表符分隔也可)，值为字符串，由列映射中的类型转换处理"""
+    sample = stream.read(4096)
+    delimiter = "\t" if sample.count("\t") > sample.count(",") else ","
+    reader = csv.DictReader(_prepend(sample, stream), delimiter=delimiter)
+    for row in reader:
+        yield row
+
+
+def _prepend(text, stream):
+    """把已读取的样本文本和流的剩余部分重新拼成按行迭代的对象"""
+    buffer = io.StringIO(text)
+    while True:
+        line = buffer.readline()
+        if not line:
+            break
+        if not line.endswith("\n"):
+            line += stream.readline()
+        yield line
+    yield from stream
+
+
+def iter_parquet_rows(source, batch_size=IMPORT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """按行组批量读取Parquet，需要安装pyarrow"""
+    if pq is None:
+        raise ValueError("导入Parquet文件需要安装pyarrow: pip install pyarrow")
+    parquet_file = pq.ParquetFile(source)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+_MISSING = object()
+
+
+class ImportMapping:
+    """把源数据的一行映射为 {"Input": ..., "Result": ...} 条目
+
+    columns为 {源列名: 目标字段路径}，目标路径以Input.或Result.开头(可嵌套，如Input.env.device)，
+    源列名可以用.访问嵌套字段；types为 {目标字段路径: 类型}，按schema_migration.coerce_value转换。
+    未提供columns时，源数据的每行必须已经是包含Input和Result的对象。Result.id总是由项目重新分配。
+    """
+
+    def __init__(self, columns: Optional[Dict[str, str]] = None, types: Optional[Dict[str, str]] = None):
+        self.columns = []
+        for source, target in (columns or {}).items():
+            parts = target.split(".")
+            if len(parts) < 2 or parts[0] not in ("Input", "Result") or not all(parts):
+                raise ValueError(f"目标字段路径必须以Input.或Result.开头: {target}")
+            self.columns.append((source, source.split("."), parts))
+        self.types = []
+        for target, type_name in (types or {}).items():
+            if type_name not in ("string", "integer", "number", "boolean", "array", "object"):
+                raise ValueError(f"不支持的目标类型: {type_name}")
+            self.types.append((target.split("."), type_name))
+
+    def apply(self, row) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+        """返回(条目, 错误列表)；行结构无法映射时条目为None"""
+        if not isinstance(row, dict):
+            return None, [f"行不是对象: {type(row).__name__}"]
+        if self.columns:
+            entry = {"Input": {}, "Result": {}}
+            for source, source_parts, target_parts in self.columns:
+                value = row.get(source, _MISSING)
+                if value is _MISSING:
+                    value = _get_path(row, source_parts)
+                if value is _MISSING:
+                    continue
+                _set_path(entry, target_parts, value)
+        else:
+            if not isinstance(row.get("Input"), dict) or not isinstance(row.get("Result"), dict):
+                return None, ["行中缺少Input/Result对象，请配置列映射"]
+            entry = {"Input": row["Input"], "Result": row["Result"]}
+        errors = []
+        for parts, type_name in self.types:
+            value = _get_path(entry, parts)
+            if value is _MISSING:
+                continue
+            try:
+                _set_path(entry, parts, coerce_value(value, type_name))
+            except ValueError as e:
+                errors.append(f"{'.'.join(parts)}: {str(e)}")
+        entry["Result"].pop("id", None)
+        return entry, errors
+
+
+def _get_path(obj, parts):
+    for part in parts:
+        if not isinstance(obj, dict) or part not in obj:
+            return _MISSING
+        obj = obj[part]
+    return obj
+
+
+def _set_path(obj, parts, value):
+    for part in parts[:-1]:
+        child = obj.get(part)
+        if not isinstance(child, dict):
+            child = obj[part] = {}
+        obj = child
+    obj[parts[-1]] = value
+
+
+def open_rows(source, fmt: Optional[str] = None, name: Optional[str] = None):
+    """打开导入源，返回(行迭代器, 已读字节数函数, 总字节数)
+
+    source可以是文件路径，也可以是二进制文件对象(如Streamlit上传的文件，需同时提供name)；
+    文件名以.gz结尾时按gzip解压读取，进度按压缩后的字节数计算。
+    """
+    if isinstance(source, str):
+        name = name or source
+        raw = open(source, "rb")
+        total = os.path.getsize(source)
+    else:
+        raw = source
+        total = getattr(source, "size", None)
+        if total is None:
+            position = raw.tell()
+            raw.seek(0, os.SEEK_END)
+            total = raw.tell() - position
+            raw.seek(position)
+    if not name:
+        raise ValueError("无法确定导入文件的格式，请提供文件名")
+    fmt = fmt or detect_format(name)
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"不支持的导入格式: {fmt}")
+    counter = _CountingReader(raw)
+    binary = io.BufferedReader(counter, buffer_size=JSON_READ_SIZE)
+    if name.endswith(".gz"):
+        binary = gzip.GzipFile(fileobj=binary)
+
+    def rows():
+        try:
+            if fmt == "parquet":
+                # Parquet需要随机访问，直接使用原始文件对象
+                yield from iter_parquet_rows(raw)
+                counter.bytes_read = total
+                return
+            text = io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+            if fmt == "jsonl":
+                yield from iter_jsonl_rows(text)
+            elif fmt == "json":
+                yield from iter_json_array_rows(text)
+            else:
+                yield from iter_csv_rows(text)
+        finally:
+            if isinstance(source, str):
+                raw.close()
+
+    return rows(), lambda: counter.bytes_read, total or 1
+
+
+def preview_rows(source, fmt: Optional[str] = None, name: Optional[str] = None, count=5) -> List[Any]:
+    """读取导入源的前count行原始数据，用于配置列映射；文件对象读取后恢复到原位置"""
+    position = None if isinstance(source, str) else source.tell()
+    rows, _, _ = open_rows(source, fmt, name)
+    preview = []
+    try:
+        for row in rows:
+            preview.append(row)
+            if len(preview) >= count:
+                break
+    finally:
+        rows.close()
+        if position is not None:
+            source.seek(position)
+    return preview
+
+
+def suggest_columns(row) -> Dict[str, str]:
+    """根据一行源数据生成列映射草稿：已是Input/Result结构时不需要映射，否则每列映射到Input下的同名字段"""
+    if not isinstance(row, dict) or ("Input" in row and "Result" in row):
+        return {}
+    return {column: f"Input.{column}" for column in row}
+
+
+def import_dataset(manager, source, fmt: Optional[str] = None, name: Optional[str] = None,
+                   columns: Optional[Dict[str, str]] = None, types: Optional[Dict[str, str]] = None,
+                   data_type="train", on_invalid="skip", chunk_size=IMPORT_CHUNK_SIZE, dry_run=False,
+                   limit: Optional[int] = None, callback: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+    """把外部数据集流式导入当前项目
+
+    逐行读取源文件并按列映射转换为条目，每攒够chunk_size条按项目Schema批量校验，
+    再一次性分配id并直接追加到数据文件，内存中只保留当前这一块。
+    on_invalid="skip"时跳过映射失败或不符合Schema的行，"keep"时只跳过无法映射的行，不合法的条目照常导入。
+    dry_run=True时只映射和校验，不写入；limit限制读取的行数(用于预览)。
+    导入前会先保存内存中未保存的修改，导入后重新加载数据。
+    callback(message, progress)接收进度消息和进度值(0-1，按已读取的字节数估算)。
+    """
+    if on_invalid not in INVALID_POLICIES:
+        raise ValueError(f"不支持的不合法数据处理方式: {on_invalid}")
+    if not dry_run and not manager.current_project:
+        raise ValueError("请先选择项目")
+    mapping = ImportMapping(columns, types)
+    rows, bytes_read, total_bytes = open_rows(source, fmt, name)
+    split = "train" if data_type == "train" else "val"
+
+    report = {"rows": 0, "imported": 0, "skipped": 0, "invalid": 0, "chunks": 0, "dry_run": dry_run,
+              "data_type": split, "samples": [], "summary": []}
+    # 不合法行按错误类型累计的次数，不保留每一行的错误
+    error_counts = {}
+    # 当前块中的条目、对应的源文件行号和类型转换错误
+    chunk, chunk_rows, chunk_errors = [], [], []
+    started = time.time()
+
+    def record_invalid(row_no, errors):
+        report["invalid"] += 1
+        count_errors(error_counts, errors)
+        if len(report["samples"]) < IMPORT_SAMPLE_ERRORS:
+            report["samples"].append({"row": row_no, "errors": errors})
+
+    def flush():
+        if not chunk:
+            return
+        invalid = manager.validate_entries(chunk)
+        accepted = []
+        for position, entry in enumerate(chunk):
+            errors = chunk_errors[position] + invalid.get(position, [])
+            if errors:
+                record_invalid(chunk_rows[position], errors)
+                if on_invalid == "skip":
+                    report["skipped"] += 1
+                    continue
+            accepted.append(entry)
+        if accepted and not dry_run:
+            manager.append_to_store(accepted, data_type=split)
+        report["imported"] += len(accepted)
+        report["chunks"] += 1
+        report["summary"] = top_errors(error_counts)
+        chunk.clear()
+        chunk_rows.clear()
+        chunk_errors.clear()
+        if callback:
+            callback(f"已读取{report['rows']}行，{'可导入' if dry_run else '已导入'}{report['imported']}条",
+                     min(1.0, bytes_read() / total_bytes))
+
+    if not dry_run:
+        manager.save_data()
+    try:
+        for row in rows:
+            report["rows"] += 1
+            entry, errors = mapping.apply(row)
+            if entry is None or (errors and on_invalid == "skip"):
+                record_invalid(report["rows"], errors)
+                report["skipped"] += 1
+            else:
+                chunk.append(entry)
+                chunk_rows.append(report["rows"])
+                chunk_errors.append(errors)
+                if len(chunk) >= chunk_size:
+                    flush()
+            if limit is not None and report["rows"] >= limit:
+                break
+        flush()
+    finally:
+        if not dry_run and report["imported"]:
+            manager.load_data()
+
+    report["elapsed"] = time.time() - started
+    report["rate"] = report["rows"] / report["elapsed"] if report["elapsed"] > 0 else 0.0
+    report["summary"] = top_errors(error_counts)
+    if callback:
+        callback("导入预览完成" if dry_run else "导入完成", 1.0)
+    print(f"{'预览' if dry_run else '完成'}数据导入: 读取{report['rows']}行，"
+          f"{'可导入' if dry_run else '导入'}{report['imported']}条，跳过{report['skipped']}条，"
+          f"耗时{report['elapsed']:.2f}秒")
+    return report
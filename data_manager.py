@@ -1,84 +1,143 @@
 import os
 import json
 import re
+import copy
+import time
 import shutil
-from llm import call_llm
-from typing import List, Dict, Any, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from llm import call_llm, estimate_tokens, GENERATION_PARAMS
+from llm_cache import get_default_cache, make_cache_key
+from json_scanner import scan_json
+from indexes import NGramIndex, SerializedTextCache, extract_tag_text, required_literals
+from schema_validator import EntryValidator, SchemaError, summarize_errors
+from dataset_registry import get_registry
+from lazy_records import LazyRecordList
+from sqlite_store import SqliteRecordList, SqliteSplitStore, open_split_store, storage_backend
+from storage import (JsonlSplitStore, WriteAheadLog, record_key, atomic_write_json, atomic_write_text,
+                     load_project_meta, save_project_meta, meta_lock, load_project_stats, save_project_stats, schema_hash)
+from typing import List, Dict, Any, Iterator, Optional
+
+# trigram预筛的候选超过完整数据集的该比例时，直接扫描拼接缓冲区更快
+REGEX_PREFILTER_MAX_RATIO = 0.25
+# 组合过滤规划时各类过滤的单条相对代价：索引过滤最便宜，大模型过滤每条都要调用一次接口
+FILTER_ROW_COST = {"tags": 1, "field": 1, "regex": 5, "llm": 100000}
+# 无法估算时假定的保留比例
+DEFAULT_SELECTIVITY = 0.5
+# 可以先在数据行文本上粗筛的标签：不含空白、引号、反斜杠和控制字符(这些字符序列化后会变化或跨越字段)
+RAW_SAFE_TAG = re.compile(r'[^\s"\\\x00-\x1f]+')
+# 大模型语义过滤默认的最大并发请求数
+DEFAULT_LLM_CONCURRENCY = 8
+# 批量语义过滤时单个请求中数据部分的token预算
+LLM_BATCH_TOKEN_BUDGET = 6000
+# 批量语义过滤中未得到判断的数据最多重新询问的轮数
+LLM_BATCH_MAX_RETRIES = 2
+
 
 def extract_json_from_llm_response(response_text: str) -> dict:
-    """从LLM响应中提取JSON对象的通用函数"""
-    result_json = None
-    
-    # 方法1: 尝试直接解析（如果整个响应就是JSON）
+    """从LLM响应中提取JSON的通用函数
+
+    整个响应就是JSON时直接解析；否则用json_scanner单遍扫描出文本中所有顶层JSON值
+    (代码块、说明文字中的JSON都能找到)，优先返回第一个非空对象，其次返回第一个非空数组。
+    """
     try:
-        result_json = json.loads(response_text.strip())
-        return result_json
-    except:
+        return json.loads(response_text.strip())
+    except ValueError:
         pass
-    
-    # 方法2: 尝试提取代码块中的JSON
-    code_block_patterns = [
-        r'```json\s*(\{.*?\})\s*```',
-        r'```json\s*(\[.*?\])\s*```',
-        r'```\s*(\{.*?\})\s*```',
-        r'```\s*(\[.*?\])\s*```',
-    ]
-    for pattern in code_block_patterns:
-        match = re.search(pattern, response_text, re.DOTALL)
-        if match:
-            try:
-                result_json = json.loads(match.group(1))
-                return result_json
-            except:
-                continue
-    
-    # 方法3: 使用改进的正则表达式提取JSON对象
-    json_patterns = [
-        r'\{(?:[^{}"]|"(?:[^"\\]|\\.)*")*\}',  # 简单模式
-        r'\{(?:[^{}"]|"(?:[^"\\]|\\.)*"|\{(?:[^{}"]|"(?:[^"\\]|\\.)*")*\})*\}',  # 支持一层嵌套
-        r'\[(?:[^\[\]"]|"(?:[^"\\]|\\.)*"|\{(?:[^{}"]|"(?:[^"\\]|\\.)*")*\})*\]',  # 数组模式
-    ]
-    
-    for pattern in json_patterns:
-        matches = re.findall(pattern, response_text, re.DOTALL)
-        for match in matches:
-            try:
-                candidate = json.loads(match)
-                # 验证JSON是否包含有意义的内容
-                if isinstance(candidate, dict) and len(candidate) > 0:
-                    return candidate
-                elif isinstance(candidate, list) and len(candidate) > 0:
-                    return candidate
-            except:
-                continue
-    
-    # 方法4: 逐行查找JSON对象
-    lines = response_text.split('\n')
-    json_lines = []
-    brace_count = 0
-    in_json = False
-    
-    for line in lines:
-        if '{' in line and not in_json:
-            in_json = True
-            json_lines = [line]
-            brace_count = line.count('{') - line.count('}')
-        elif in_json:
-            json_lines.append(line)
-            brace_count += line.count('{') - line.count('}')
-            if brace_count <= 0:
-                try:
-                    json_text = '\n'.join(json_lines)
-                    result_json = json.loads(json_text)
-                    return result_json
-                except:
-                    in_json = False
-                    json_lines = []
-                    brace_count = 0
-    
+
+    first_list = None
+    for item in scan_json(response_text):
+        if isinstance(item.value, dict) and item.value:
+            return item.value
+        if first_list is None and isinstance(item.value, list) and item.value:
+            first_list = item.value
+    if first_list is not None:
+        return first_list
+
     # 如果所有方法都失败，抛出异常
     raise Exception(f"无法从LLM响应中提取有效的JSON。响应内容：{response_text[:500]}...")
 
+
+def collect_data_pairs(value, data_pairs=None) -> List[Dict[str, Any]]:
+    """递归收集JSON值中同时包含Input和Result的对象，返回{"Input", "Result"}数据对列表"""
+    if data_pairs is None:
+        data_pairs = []
+    if isinstance(value, dict):
+        if "Input" in value and "Result" in value:
+            data_pairs.append({
+                "Input": value["Input"],
+                "Result": value["Result"]
+            })
+            return data_pairs
+        for child in value.values():
+            collect_data_pairs(child, data_pairs)
+    elif isinstance(value, list):
+        for child in value:
+            collect_data_pairs(child, data_pairs)
+    return data_pairs
+
+
+def _parse_verdict(value) -> Optional[bool]:
+    """把大模型返回的判断值解析为布尔值，无法识别时返回None"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in ("true", "yes", "是", "相关", "1"):
+            return True
+        if text in ("false", "no", "否", "不相关", "0"):
+            return False
+    return None
+
+
+def _parse_batch_id(key, count) -> Optional[int]:
+    """把批内编号(从1开始)解析为下标，超出范围时返回None"""
+    try:
+        number = int(str(key).strip().strip("[]#编号 "))
+    except ValueError:
+        return None
+    return number - 1 if 1 <= number <= count else None
+
+
+def parse_llm_batch_verdicts(response_text: str, count: int) -> Dict[int, bool]:
+    """解析批量相关性判断的响应，返回 {批内下标: 是否相关}
+
+    期望的格式为 {"1": true, "2": false, ...}；也兼容 [{"id": 1, "relevant": true}, ...]、
+    只列出相关编号的数组(视为全部已判断)以及逐行的"1: true"文本。缺失或无法识别的编号不出现在结果中。
+    """
+    verdicts = {}
+    try:
+        parsed = extract_json_from_llm_response(response_text)
+    except Exception:
+        parsed = None
+
+    if isinstance(parsed, dict):
+        for key, value in parsed.items():
+            index = _parse_batch_id(key, count)
+            verdict = _parse_verdict(value)
+            if index is not None and verdict is not None:
+                verdicts[index] = verdict
+    elif isinstance(parsed, list):
+        if all(isinstance(entry, dict) for entry in parsed):
+            for entry in parsed:
+                index = _parse_batch_id(entry.get("id"), count)
+                verdict = _parse_verdict(entry.get("relevant", entry.get("match")))
+                if index is not None and verdict is not None:
+                    verdicts[index] = verdict
+        else:
+            matched = {_parse_batch_id(entry, count) for entry in parsed}
+            verdicts = {index: index in matched for index in range(count)}
+
+    if not verdicts:
+        for key, value in re.findall(r'\[?(\d+)\]?\s*[:：]\s*"?(true|false)"?', response_text, re.IGNORECASE):
+            index = _parse_batch_id(key, count)
+            if index is not None:
+                verdicts[index] = value.lower() == "true"
+    return verdicts
+
+
 class UniversalDataManager:
     def __init__(self, project_name=None, api_key=None):
         self.api_key = api_key
@@ -87,6 +146,15 @@ class UniversalDataManager:
         self.input_schema = {}
         self.result_schema = {}
         self.current_project = project_name
+        # 本管理器内的写入互斥，保证ID分配和索引一致；跨会话的互斥由数据集写锁(split_lock)和meta_lock保证
+        self._write_lock = threading.RLock()
+        # 按项目Schema编译的校验器，加载配置时编译、保存配置时更新
+        self._validator = None
+        # 当前数据基于的数据文件版本(字节数, 修改时间)，以及本会话已复制、可以直接修改的条目
+        self._base_signature = {"train": None, "val": None}
+        self._owned = {"train": {}, "val": {}}
+        self._reset_dirty()
+        self._reset_indexes()
         
         # 项目根目录
         self.projects_root = "data"
@@ -99,7 +167,8 @@ class UniversalDataManager:
             self.system_prompts_dir = "system_prompts"
             if not os.path.exists(self.system_prompts_dir):
                 os.makedirs(self.system_prompts_dir)
-            if os.path.exists(os.path.join(self.data_dir, "train_data.json")):
+            self._init_stores()
+            if self.stores["train"].exists():
                 self.load_data()
 
     def set_project(self, project_name):
@@ -117,11 +186,31 @@ class UniversalDataManager:
         # 加载项目配置
         self.load_project_config()
         # 加载数据
-        if os.path.exists(os.path.join(self.data_dir, "train_data.json")):
-            self.load_data()
+        self._init_stores()
+        self.load_data()
+
+    def open_session(self):
+        """创建绑定到当前项目的独立管理器，供后台任务使用
+
+        新管理器与本管理器共享进程内的数据快照，但有自己的内存数据、索引和写锁；
+        本管理器之后切换项目(set_project原地修改)不会影响它。
+        """
+        if self.current_project:
+            return UniversalDataManager(project_name=self.current_project, api_key=self.api_key)
+        return UniversalDataManager(api_key=self.api_key)
+
+    def _init_stores(self):
+        """初始化训练集和验证集的存储引擎"""
+        self.stores = {
+            "train": open_split_store(self.data_dir, "train"),
+            "val": open_split_store(self.data_dir, "val")
+        }
+        self.wal = WriteAheadLog(self.data_dir)
 
-    def create_project(self, project_name, input_schema, result_schema):
-        """创建新项目"""
+    def create_project(self, project_name, input_schema, result_schema, storage_backend="jsonl"):
+        """创建新项目，storage_backend为数据存储引擎(jsonl/sqlite，见sqlite_store)"""
+        if storage_backend not in ("jsonl", "sqlite"):
+            raise ValueError(f"不支持的存储引擎: {storage_backend}")
         project_dir = os.path.join(self.projects_root, project_name)
         
         if os.path.exists(project_dir):
@@ -138,14 +227,21 @@ class UniversalDataManager:
             "created_at": json.dumps({"timestamp": "auto"})
         }
         
-        with open(os.path.join(project_dir, "config.json"), 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+        atomic_write_json(os.path.join(project_dir, "config.json"), config)
             
-        # 初始化空数据文件
-        with open(os.path.join(project_dir, "train_data.json"), 'w', encoding='utf-8') as f:
-            json.dump([], f)
-        with open(os.path.join(project_dir, "val_data.json"), 'w', encoding='utf-8') as f:
-            json.dump([], f)
+        # JSONL数据文件(train_data.jsonl/val_data.jsonl)在首次写入时创建；SQLite数据库立即创建，之后按文件识别存储引擎
+        stores = {}
+        for split in ("train", "val"):
+            if storage_backend == "sqlite":
+                stores[split] = SqliteSplitStore(project_dir, split)
+                stores[split].create()
+            else:
+                stores[split] = JsonlSplitStore(project_dir, split)
+        save_project_stats(project_dir, {
+            "train": stores["train"].stats(),
+            "val": stores["val"].stats(),
+            "schema_hash": schema_hash(input_schema, result_schema)
+        })
             
         print(f"项目 {project_name} 创建成功")
 
@@ -157,11 +253,34 @@ class UniversalDataManager:
                 if os.path.isdir(os.path.join(self.projects_root, d)) and 
                 os.path.exists(os.path.join(self.projects_root, d, "config.json"))]
 
+    def get_project_stats(self, project_name) -> Dict[str, Any]:
+        """读取项目的统计信息(各数据集条数、文件大小、修改时间和Schema哈希)，不加载数据
+
+        返回 {"train": {"count", "lines", "bytes", "mtime_ns"}, "val": {...}, "schema_hash", "updated_at"}。
+        """
+        return load_project_stats(os.path.join(self.projects_root, project_name), store_factory=open_split_store)
+
+    def read_project_config(self, project_name) -> Dict[str, Any]:
+        """读取项目的config.json，不加载数据"""
+        with open(os.path.join(self.projects_root, project_name, "config.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _update_stats(self):
+        """数据文件或Schema变化后更新meta.json中的统计信息(内容未变时不写入)"""
+        with self._write_lock:
+            save_project_stats(self.data_dir, {
+                "train": self.stores["train"].stats(),
+                "val": self.stores["val"].stats(),
+                "schema_hash": schema_hash(self.input_schema, self.result_schema)
+            })
+
     def delete_project(self, project_name):
         """删除项目"""
         project_dir = os.path.join(self.projects_root, project_name)
         if os.path.exists(project_dir):
             shutil.rmtree(project_dir)
+            get_registry().forget(project_dir)
+            get_default_cache().clear(project_name)
             print(f"项目 {project_name} 已删除")
         else:
             raise ValueError(f"项目 {project_name} 不存在")
@@ -177,113 +296,340 @@ class UniversalDataManager:
                 config = json.load(f)
                 self.input_schema = config.get("input_schema", {})
                 self.result_schema = config.get("result_schema", {})
+        self._compile_validator()
+
+    def _compile_validator(self):
+        """编译当前Schema的校验器；Schema无法编译时不做校验"""
+        try:
+            self._validator = EntryValidator(self.input_schema, self.result_schema)
+        except SchemaError as e:
+            self._validator = None
+            print(f"项目Schema无法编译，跳过数据校验: {str(e)}")
+
+    @property
+    def ignored_schema_keywords(self):
+        """当前Schema中不支持、不参与校验的关键字位置，如 Input.$ref"""
+        return self._validator.ignored_keywords if self._validator is not None else []
 
     def save_project_config(self, input_schema=None, result_schema=None):
-        """保存项目配置"""
+        """保存项目配置，Schema结构不合法时抛出SchemaError
+
+        不支持的关键字(如$ref)不阻止保存，按注解处理、不参与校验，见ignored_schema_keywords。
+        """
         if not self.current_project:
             return False
             
-        if input_schema:
-            self.input_schema = input_schema
-        if result_schema:
-            self.result_schema = result_schema
+        new_input_schema = input_schema if input_schema else self.input_schema
+        new_result_schema = result_schema if result_schema else self.result_schema
+        # 先编译，保证保存的Schema可以用于校验
+        validator = EntryValidator(new_input_schema, new_result_schema)
+        self.input_schema = new_input_schema
+        self.result_schema = new_result_schema
             
         config = {
             "input_schema": self.input_schema,
             "result_schema": self.result_schema
         }
         
-        config_path = os.path.join(self.data_dir, "config.json")
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+        atomic_write_json(os.path.join(self.data_dir, "config.json"), config)
+        self._validator = validator
+        self._update_stats()
         return True
 
     def load_data(self):
-        """加载训练和验证数据"""
+        """加载训练和验证数据，并回放预写日志中尚未持久化的修改
+
+        数据来自进程内共享的快照(见dataset_registry)，文件未变化时不重新解析；
+        本会话持有快照列表的浅拷贝，修改条目前先复制(见_own_item)。
+        大数据文件得到的是按需解析的LazyRecordList，不构建标签/正则倒排索引，过滤时直接扫描数据行。
+        """
         try:
-            with open(os.path.join(self.data_dir, "train_data.json"), 'r', encoding='utf-8') as f:
-                self.train_data = json.load(f)
-            with open(os.path.join(self.data_dir, "val_data.json"), 'r', encoding='utf-8') as f:
-                self.val_data = json.load(f)
+            registry = get_registry()
+            snapshots = {split: registry.load(self.stores[split]) for split in ("train", "val")}
+            self.train_data = snapshots["train"].records.copy()
+            self.val_data = snapshots["val"].records.copy()
+            self._base_signature = {split: snapshot.signature for split, snapshot in snapshots.items()}
+            self._owned = {"train": {}, "val": {}}
+            self._reset_dirty()
+            self._reset_indexes()
+            self._snapshot = snapshots
+            # 统计信息缺失或与文件不一致(外部修改、写入统计前崩溃)时顺便修正
+            self._update_stats()
             print(f"成功加载数据: 训练集{len(self.train_data)}条, 验证集{len(self.val_data)}条")
         except Exception as e:
             print(f"加载数据时出错: {str(e)}")
             raise
+        self._replay_wal()
 
-    def save_data(self):
-        """保存数据到文件"""
-        try:
-            with open(os.path.join(self.data_dir, "train_data.json"), 'w', encoding='utf-8') as f:
-                json.dump(self.train_data, f, ensure_ascii=False, indent=2)
-            with open(os.path.join(self.data_dir, "val_data.json"), 'w', encoding='utf-8') as f:
-                json.dump(self.val_data, f, ensure_ascii=False, indent=2)
-            print("数据保存成功")
-        except Exception as e:
-            print(f"保存数据时出错: {str(e)}")
-            raise
-
-    def filter_by_tags(self, data_type="train", tags=None):
-        """通过标签过滤数据 - 基于项目配置动态适配数据结构"""
-        if tags is None or not tags:
-            return self.train_data if data_type == "train" else self.val_data
+    def _replay_wal(self):
+        """回放本会话的预写日志(包括接管的遗留日志)并立即保存；日志中的修改都是幂等的，重复回放不会改变结果"""
+        self.wal.adopt_orphans()
+        entries = self.wal.entries()
+        if not entries:
+            return
+        for entry in entries:
+            if entry.get("op") == "modify":
+                pos = self._find_position(entry["split"], entry["id"])
+                if pos is not None:
+                    self._apply_changes(entry["split"], self._own_item(entry["split"], pos), entry["changes"])
+            elif entry.get("op") == "delete":
+                self._remove_item(entry["split"], entry["id"])
+            else:
+                print(f"未知的预写日志操作: {entry.get('op')}")
+        print(f"已回放预写日志中的{len(entries)}条修改")
+        self.save_data()
 
-        data = self.train_data if data_type == "train" else self.val_data
-        filtered_data = []
+    def refresh_if_stale(self):
+        """数据文件被其他会话或进程修改后重新加载，有未保存的修改时不刷新；返回是否重新加载"""
+        if any(dirty["full"] or dirty["updated"] or dirty["deleted"] for dirty in self._dirty.values()):
+            return False
+        registry = get_registry()
+        if all(registry.is_current(self.stores[split], self._base_signature[split]) for split in ("train", "val")):
+            return False
+        if storage_backend(self.data_dir) != ("sqlite" if isinstance(self.stores["train"], SqliteSplitStore) else "jsonl"):
+            # 其他会话迁移了存储引擎
+            self._init_stores()
+        self.load_data()
+        return True
 
-        for item in data:
-            # 获取主要文本字段进行搜索
-            search_texts = []
-            
-            # 从Input中提取文本字段
-            if "Input" in item:
-                input_data = item["Input"]
-                # 根据配置或常见字段名提取文本
-                text_fields = ["current_query", "query", "processed_query", "user_input"]
-                for field in text_fields:
-                    if field in input_data and isinstance(input_data[field], str):
-                        search_texts.append(input_data[field])
-                
-                # 处理历史对话
-                if "history" in input_data and isinstance(input_data["history"], list):
-                    for msg in input_data["history"]:
-                        if isinstance(msg, dict) and "content" in msg:
-                            search_texts.append(msg["content"])
-            
-            # 从Result中提取文本字段
-            if "Result" in item:
-                result_data = item["Result"]
-                text_fields = ["intent", "response", "processed_query", "target"]
-                for field in text_fields:
-                    if field in result_data and isinstance(result_data[field], str):
-                        search_texts.append(result_data[field])
-            
-            # 在所有提取的文本中搜索标签
-            combined_text = " ".join(search_texts).lower()
-            if all(tag.lower() in combined_text for tag in tags):
-                filtered_data.append(item)
+    def _after_write(self, split, before_signature, share=True):
+        """数据文件写入后更新本会话的基准版本；share=True时把当前数据发布为共享快照
 
-        print(f"标签过滤结果: {len(filtered_data)}条数据")
-        return filtered_data
+        调用方需从读取before_signature起持有该数据集的写锁(store.lock())。
+        """
+        data = self.train_data if split == "train" else self.val_data
+        self._base_signature[split], snapshot = get_registry().publish(
+            self.stores[split], data, self._base_signature[split], before_signature, share)
+        if share:
+            # 发布后本会话的条目也被其他会话共享，再修改时需要重新复制
+            self._owned[split] = {}
+        if snapshot is not None:
+            # 新快照接管本会话的文本缓存和索引(它们正对应发布的数据)，本会话改为共享快照上的
+            self._detach(split)
+            snapshot.adopt(self._text_cache[split], {"tag": self._tag_index[split], "trigram": self._trigram_index[split]})
+            self._snapshot[split] = snapshot
+            self._text_cache[split] = SerializedTextCache()
+            self._tag_index[split] = None
+            self._trigram_index[split] = None
+
+    def _own_item(self, data_type, pos):
+        """写时复制：返回位置pos处本会话私有的条目，必要时先复制共享快照中的条目"""
+        split = "train" if data_type == "train" else "val"
+        data = self.train_data if split == "train" else self.val_data
+        if isinstance(data, LazyRecordList) and not data.is_loaded(pos):
+            # 从文件新解析出的条目只属于本会话，无需复制
+            owned = data.materialize(pos)
+            self._owned[split][id(owned)] = owned
+            return owned
+        item = data[pos]
+        if id(item) in self._owned[split]:
+            return item
+        self._detach(split)
+        owned = copy.deepcopy(item)
+        data[pos] = owned
+        # 保存对象引用，避免id被回收后复用
+        self._owned[split][id(owned)] = owned
+        # 副本沿用原条目的文档号，文档号的顺序与数据集顺序保持一致(正则过滤按文档号排序输出)
+        self._text_cache[split].invalidate(item)
+        for index in (self._tag_index[split], self._trigram_index[split]):
+            if index is not None:
+                index.replace(item, owned)
+        return owned
+
+    def _reset_dirty(self):
+        """清空未保存修改的记录"""
+        self._dirty = {
+            "train": {"full": False, "updated": {}, "deleted": []},
+            "val": {"full": False, "updated": {}, "deleted": []}
+        }
 
-    def filter_by_regex(self, data_type="train", pattern=""):
-        """通过正则表达式过滤数据"""
-        if not pattern:
-            return self.train_data if data_type == "train" else self.val_data
+    def _reset_indexes(self):
+        """清空内存索引，下次使用时重新构建
 
-        data = self.train_data if data_type == "train" else self.val_data
-        filtered_data = []
-        regex = re.compile(pattern)
+        本会话数据与共享快照一致时(_snapshot[split]不为None)，文本缓存和倒排索引使用快照上共享的，
+        以下私有的只在修改数据后(_detach)使用。
+        """
+        # 本会话数据未修改时所基于的共享快照
+        self._snapshot = {"train": None, "val": None}
+        # id -> 位置索引(同一id以首次出现的条目为准)
+        self._id_index = {"train": None, "val": None}
+        # 下一个可分配的id，首次分配时结合meta.json与现有数据计算
+        self._next_id = {"train": None, "val": None}
+        # 标签过滤使用的字符bigram倒排索引
+        self._tag_index = {"train": None, "val": None}
+        # 正则过滤使用的序列化文本缓存
+        self._text_cache = {"train": SerializedTextCache(), "val": SerializedTextCache()}
+        # 正则预筛使用的序列化文本trigram倒排索引
+        self._trigram_index = {"train": None, "val": None}
+
+    def _get_id_index(self, data_type):
+        """获取数据集的id索引，必要时构建"""
+        split = "train" if data_type == "train" else "val"
+        index = self._id_index[split]
+        if index is None:
+            index = {}
+            data = self.train_data if split == "train" else self.val_data
+            for pos, item in enumerate(data):
+                key = record_key(item)
+                if key is not None and key not in index:
+                    index[key] = pos
+            self._id_index[split] = index
+        return index
+
+    def _detach(self, split):
+        """本会话即将修改数据集：把共享快照上的文本缓存和已构建的索引fork为私有副本，之后只修改副本"""
+        snapshot = self._snapshot[split]
+        if snapshot is None:
+            return
+        self._text_cache[split] = snapshot.text_cache.fork()
+        tag_index = snapshot.peek("tag")
+        self._tag_index[split] = tag_index.fork() if tag_index is not None else None
+        trigram_index = snapshot.peek("trigram")
+        self._trigram_index[split] = trigram_index.fork() if trigram_index is not None else None
+        self._snapshot[split] = None
+
+    def _get_text_cache(self, split):
+        """获取数据集的序列化文本缓存，数据未修改时为共享快照上的"""
+        snapshot = self._snapshot[split]
+        return snapshot.text_cache if snapshot is not None else self._text_cache[split]
+
+    @staticmethod
+    def _build_tag_index(data):
+        index = NGramIndex(n=2)
+        for item in data:
+            index.add(item, extract_tag_text(item))
+        return index
 
+    @staticmethod
+    def _build_trigram_index(data, text_cache):
+        index = NGramIndex(n=3)
         for item in data:
-            # 搜索Input和Result中的文本
-            item_str = json.dumps(item, ensure_ascii=False)
-            if regex.search(item_str):
-                filtered_data.append(item)
+            index.add(item, text_cache.text(item))
+        return index
+
+    def _get_tag_index(self, data_type):
+        """获取数据集的标签倒排索引，必要时构建；数据未修改时使用共享快照上的(同一版本只构建一次)"""
+        split = "train" if data_type == "train" else "val"
+        snapshot = self._snapshot[split]
+        if snapshot is not None:
+            return snapshot.index("tag", lambda: self._build_tag_index(snapshot.records))
+        index = self._tag_index[split]
+        if index is None:
+            index = self._tag_index[split] = self._build_tag_index(self.train_data if split == "train" else self.val_data)
+        return index
+
+    def _get_trigram_index(self, data_type):
+        """获取数据集序列化文本的trigram倒排索引，必要时构建；数据未修改时使用共享快照上的"""
+        split = "train" if data_type == "train" else "val"
+        snapshot = self._snapshot[split]
+        if snapshot is not None:
+            return snapshot.index("trigram", lambda: self._build_trigram_index(snapshot.records, snapshot.text_cache))
+        index = self._trigram_index[split]
+        if index is None:
+            index = self._trigram_index[split] = self._build_trigram_index(
+                self.train_data if split == "train" else self.val_data, self._text_cache[split])
+        return index
+
+    def _index_item(self, data_type, item, removed=False):
+        """条目新增、修改或删除后增量更新已构建的文本索引"""
+        split = "train" if data_type == "train" else "val"
+        self._detach(split)
+        text_cache = self._text_cache[split]
+        text_cache.invalidate(item)
+        tag_index = self._tag_index[split]
+        trigram_index = self._trigram_index[split]
+        if removed:
+            if tag_index is not None:
+                tag_index.remove(item)
+            if trigram_index is not None:
+                trigram_index.remove(item)
+            return
+        if tag_index is not None:
+            tag_index.update(item, extract_tag_text(item))
+        if trigram_index is not None:
+            trigram_index.update(item, text_cache.text(item))
+
+    def _ensure_next_id(self, split):
+        """首次使用时根据现有数据的最大整数id初始化分配器(删除条目前也必须调用)"""
+        if self._next_id[split] is None:
+            data = self.train_data if split == "train" else self.val_data
+            if isinstance(data, LazyRecordList):
+                largest = data.max_int_key()
+                self._next_id[split] = largest + 1 if largest is not None else 1
+                return
+            int_ids = [item["Result"].get("id") for item in data]
+            int_ids = [i for i in int_ids if isinstance(i, int) and not isinstance(i, bool)]
+            self._next_id[split] = max(int_ids) + 1 if int_ids else 1
+
+    def _allocate_ids(self, data_type, count):
+        """一次性分配count个连续的新id，并将分配器状态持久化到meta.json
+
+        已删除条目的id不会被重新分配。多个会话(各自的管理器)同时分配时，读-改-写meta.json在
+        项目级的meta_lock内完成，以meta.json中的next_id为准，不会分配出相同的id。
+        """
+        split = "train" if data_type == "train" else "val"
+        self._ensure_next_id(split)
+        with meta_lock(self.data_dir):
+            meta = load_project_meta(self.data_dir)
+            first_id = max(self._next_id[split], meta.get("next_id", {}).get(split, 1))
+            self._next_id[split] = first_id + count
+            meta.setdefault("next_id", {})[split] = self._next_id[split]
+            save_project_meta(self.data_dir, meta)
+        return range(first_id, first_id + count)
+
+    def mark_dirty(self, data_type="train", item=None):
+        """标记数据集中有未保存的修改
+
+        指定item时只记录该条目，保存时以操作行追加到文件；未指定时下次保存将重写整个数据集。
+        必须在修改条目之前调用，以便记录条目修改前的id。
+        """
+        dirty = self._dirty["train" if data_type == "train" else "val"]
+        key = record_key(item) if item is not None else None
+        if key is None:
+            dirty["full"] = True
+        elif id(item) not in dirty["updated"]:
+            dirty["updated"][id(item)] = (key, item)
+
+    def _mark_deleted(self, data_type, item):
+        """记录被删除的条目，保存时以删除操作行追加到文件"""
+        dirty = self._dirty["train" if data_type == "train" else "val"]
+        dirty["updated"].pop(id(item), None)
+        key = record_key(item)
+        if key is None:
+            dirty["full"] = True
+        else:
+            dirty["deleted"].append(key)
 
-        print(f"正则过滤结果: {len(filtered_data)}条数据")
-        return filtered_data
+    def save_data(self, full=False):
+        """保存数据到文件
 
-   
+        默认只持久化自上次加载/保存以来修改过的数据集和条目；
+        full=True时重写(压缩)全部数据文件。
+        """
+        try:
+            for split, data in (("train", self.train_data), ("val", self.val_data)):
+                store = self.stores[split]
+                dirty = self._dirty[split]
+                if not (full or dirty["full"] or dirty["updated"] or dirty["deleted"]):
+                    continue
+                # 从读取写入前的签名到发布快照都持有写锁，其他会话的写入不会夹在中间
+                with store.lock():
+                    before = store.signature()
+                    if full or dirty["full"]:
+                        store.rewrite(data)
+                    else:
+                        store.write_updates(list(dirty["updated"].values()), dirty["deleted"])
+                        if store.needs_compaction():
+                            store.rewrite(data)
+                    self._after_write(split, before)
+            self._reset_dirty()
+            self._update_stats()
+            # 修改已写入数据文件，预写日志可以清空
+            self.wal.clear()
+            print("数据保存成功")
+        except Exception as e:
+            print(f"保存数据时出错: {str(e)}")
+            raise
 
     def modify_item(self, data_type="train", item_id=None, changes=None):
         """修改数据条目"""
@@ -291,32 +637,90 @@ class UniversalDataManager:
             print("缺少必要参数")
             return False
 
+        pos = self._find_position(data_type, item_id)
+        if pos is None:
+            print(f"未找到ID为{item_id}的数据条目")
+            return False
+
+        # 先写预写日志，再修改内存中的数据(条目可能与其他会话共享，先复制)
+        self.wal.append({"op": "modify", "split": "train" if data_type == "train" else "val", "id": item_id, "changes": changes})
+        self._apply_changes(data_type, self._own_item(data_type, pos), changes)
+        print(f"成功修改ID为{item_id}的数据条目")
+        return True
+
+    def _find_position(self, data_type, item_id):
+        """通过id索引查找数据条目的位置，找不到时返回None"""
         data = self.train_data if data_type == "train" else self.val_data
+        if isinstance(data, LazyRecordList):
+            # 按需读取的数据集直接在偏移索引的id数组上查找
+            return data.find(item_id)
+        try:
+            return self._get_id_index(data_type).get(item_id)
+        except TypeError:
+            # id不可哈希(如列表)，不可能存在于索引中
+            return None
 
-        for item in data:
-            if item["Result"].get("id") == item_id:
-                # 应用更改
-                for key, value in changes.items():
-                    # 支持嵌套路径，如 "Result.processed_query"
-                    parts = key.split('.')
-                    current = item
-                    for part in parts[:-1]:
-                        if part not in current:
-                            current[part] = {}
-                        current = current[part]
-                    current[parts[-1]] = value
-                print(f"成功修改ID为{item_id}的数据条目")
-                return True
-
-        print(f"未找到ID为{item_id}的数据条目")
-        return False
+    def _find_item(self, data_type, item_id):
+        """按Result.id查找数据条目"""
+        pos = self._find_position(data_type, item_id)
+        if pos is None:
+            return None
+        data = self.train_data if data_type == "train" else self.val_data
+        return data[pos]
+
+    def get_item(self, item_id, data_type="train"):
+        """按Result.id获取数据条目，找不到时返回None"""
+        return self._find_item(data_type, item_id)
+
+    def delete_item(self, item_id, data_type="train"):
+        """按Result.id删除数据条目"""
+        if self._find_position(data_type, item_id) is None:
+            print(f"未找到ID为{item_id}的数据条目")
+            return False
+        self.wal.append({"op": "delete", "split": "train" if data_type == "train" else "val", "id": item_id})
+        self._remove_item(data_type, item_id)
+        print(f"成功删除ID为{item_id}的数据条目")
+        return True
+
+    def _remove_item(self, data_type, item_id):
+        """从内存数据中移除条目并记录未保存的删除"""
+        pos = self._find_position(data_type, item_id)
+        if pos is None:
+            return
+        split = "train" if data_type == "train" else "val"
+        # 删除前初始化id分配器，保证被删除的最大id不会被重新分配
+        self._ensure_next_id(split)
+        data = self.train_data if split == "train" else self.val_data
+        item = data.pop(pos)
+        self._mark_deleted(data_type, item)
+        self._index_item(split, item, removed=True)
+        # 删除后其后条目的位置整体前移，索引在下次使用时重建
+        self._id_index[split] = None
+
+    def _apply_changes(self, data_type, item, changes):
+        """将修改应用到数据条目，并记录未保存的修改"""
+        # 修改id时重写整个数据集并重建id索引，其余修改只记录该条目
+        if any(key in ("Result", "Result.id") for key in changes):
+            self.mark_dirty(data_type)
+            self._id_index["train" if data_type == "train" else "val"] = None
+        else:
+            self.mark_dirty(data_type, item)
+        for key, value in changes.items():
+            # 支持嵌套路径，如 "Result.processed_query"
+            parts = key.split('.')
+            current = item
+            for part in parts[:-1]:
+                if part not in current:
+                    current[part] = {}
+                current = current[part]
+            current[parts[-1]] = value
+        self._index_item(data_type, item)
 
     def save_system_prompt(self, prompt_name, prompt_content):
         """保存system prompt到文件"""
         prompt_path = os.path.join(self.system_prompts_dir, f"{prompt_name}.txt")
         try:
-            with open(prompt_path, 'w', encoding='utf-8') as f:
-                f.write(prompt_content)
+            atomic_write_text(prompt_path, prompt_content)
             print(f"成功保存system prompt到 {prompt_path}")
             return True
         except Exception as e:
@@ -343,64 +747,135 @@ class UniversalDataManager:
                 prompts.append(filename[:-4])  # 移除.txt后缀
         return prompts
 
+    def generate_query(self, model="qwen-max"):
+        """生成一条用户查询(generate_new_data的第一阶段)"""
+        if not self.api_key:
+            raise ValueError("API密钥未设置，请先设置API密钥")
+        query_prompt = "生成一个关于视频搜索的用户查询，主题可以是综艺、健身、音乐等，内容要具体。"
+        return call_llm(query_prompt, self.api_key, model=model).strip()
+
+    def generate_result(self, query, model="qwen-max"):
+        """为用户查询生成Result并构建完整条目(generate_new_data的第二阶段)"""
+        if not self.api_key:
+            raise ValueError("API密钥未设置，请先设置API密钥")
+        result_prompt = f"用户查询: '{query}'\n\n请生成一个符合现有数据格式的Result字段，包括id、turn、query_independent、target、processed_query和search。"
+        result = call_llm(result_prompt, self.api_key, model=model).strip()
+        result_json = extract_json_from_llm_response(result)
+        if not isinstance(result_json, dict):
+            raise Exception("无法从LLM响应中提取JSON")
+
+        return {
+            "Input": {
+                "history": [],
+                "query": query,
+                "env": "",
+                "search_results": ""
+            },
+            "Result": result_json
+        }
+
     def generate_new_data(self, num_entries=10, model="qwen-max"):
-        """通过大模型生成新数据"""
+        """通过大模型生成新数据(逐条串行，大批量生成见generation_engine.GenerationJob)"""
         if not self.api_key:
             raise ValueError("API密钥未设置，请先设置API密钥")
             
         new_entries = []
 
         for i in range(num_entries):
-            # 生成用户查询
-            query_prompt = "生成一个关于视频搜索的用户查询，主题可以是综艺、健身、音乐等，内容要具体。"
             try:
-                query = call_llm(query_prompt, self.api_key, model=model).strip()
+                # 生成用户查询
+                query = self.generate_query(model=model)
                 print(f"生成查询 {i+1}/{num_entries}: {query}")
 
                 # 生成对应的处理结果
-                result_prompt = f"用户查询: '{query}'\n\n请生成一个符合现有数据格式的Result字段，包括id、turn、query_independent、target、processed_query和search。"
-                result = call_llm(result_prompt, self.api_key, model=model).strip()
-                # 使用正则表达式提取JSON内容
-                json_match = re.search(r'\{.*\}', result, re.DOTALL)
-                if not json_match:
-                    raise Exception("无法从LLM响应中提取JSON")
-                result_json = json.loads(json_match.group())
-
-                # 构建新条目
-                new_entry = {
-                    "Input": {
-                        "history": [],
-                        "query": query,
-                        "env": "",
-                        "search_results": ""
-                    },
-                    "Result": result_json
-                }
-                new_entries.append(new_entry)
+                new_entries.append(self.generate_result(query, model=model))
             except Exception as e:
                 print(f"生成第{i+1}条数据时出错: {str(e)}")
 
         print(f"成功生成{len(new_entries)}/{num_entries}条新数据")
         return new_entries
 
-    def add_generated_data(self, new_entries, data_type="train"):
-        """将生成的数据添加到数据集中"""
-        if data_type == "train":
-            # 确保ID唯一
-            max_id = max(item["Result"].get("id", 0) for item in self.train_data) if self.train_data else 0
-            for entry in new_entries:
-                max_id += 1
-                entry["Result"]["id"] = max_id
-            self.train_data.extend(new_entries)
-        else:
-            max_id = max(item["Result"].get("id", 0) for item in self.val_data) if self.val_data else 0
-            for entry in new_entries:
-                max_id += 1
-                entry["Result"]["id"] = max_id
-            self.val_data.extend(new_entries)
+    def add_generated_data(self, new_entries, data_type="train", strict=False):
+        """将生成的数据添加到数据集中
 
+        写入前按项目Schema批量校验，返回{位置: 错误信息列表}(只包含不合法的条目)；
+        strict=True时有不合法的条目则不写入并抛出ValueError，否则照常写入并打印警告。
+        """
+        split = "train" if data_type == "train" else "val"
+        data = self.train_data if split == "train" else self.val_data
+
+        invalid = self.validate_entries(new_entries)
+        if invalid:
+            first_position = min(invalid)
+            message = f"{len(invalid)}/{len(new_entries)}条数据不符合项目Schema，例如第{first_position + 1}条: {'; '.join(invalid[first_position][:3])}"
+            if strict:
+                raise ValueError(message)
+            print(f"警告: {message}")
+
+        with self._write_lock:
+            # 一次性分配唯一ID并更新id索引
+            index = self._id_index[split]
+            for entry, new_id in zip(new_entries, self._allocate_ids(split, len(new_entries))):
+                entry["Result"]["id"] = new_id
+                if index is not None:
+                    index.setdefault(new_id, len(data))
+                data.append(entry)
+                self._index_item(split, entry)
+
+            # 只追加新数据，不重写整个数据集；从读取签名到发布快照都持有写锁
+            with self.stores[split].lock():
+                before = self.stores[split].signature()
+                self.stores[split].append(new_entries)
+                dirty = self._dirty[split]
+                self._after_write(split, before, share=not (dirty["full"] or dirty["updated"] or dirty["deleted"]))
+            self._update_stats()
         print(f"成功添加{len(new_entries)}条新数据到{data_type}数据集")
-        self.save_data()
+        return invalid
+
+    def append_to_store(self, entries, data_type="train"):
+        """一次性分配id并直接追加到数据文件，不放入内存中的数据集(批量导入用，完成后调用load_data加载)"""
+        split = "train" if data_type == "train" else "val"
+        with self._write_lock:
+            for entry, new_id in zip(entries, self._allocate_ids(split, len(entries))):
+                entry["Result"]["id"] = new_id
+            self.stores[split].append(entries)
+            self._update_stats()
+
+    def validate_entries(self, entries) -> Dict[int, List[str]]:
+        """按项目Schema批量校验条目，返回{位置: 错误信息列表}，只包含不合法的条目"""
+        if self._validator is None:
+            return {}
+        return self._validator.validate_batch(entries)
+
+    def validate_split(self, data_type="train") -> Dict[str, Any]:
+        """校验整个数据集，返回校验报告
+
+        报告包含总数、不合法条数、每条不合法数据的位置/ID/错误信息，以及按错误类型的统计。
+        """
+        data = self.train_data if data_type == "train" else self.val_data
+        start = time.time()
+        invalid = self.validate_entries(data)
+        records = []
+        for position in sorted(invalid):
+            item = data[position]
+            result = item.get("Result") if isinstance(item, dict) else None
+            records.append({
+                "position": position,
+                "id": result.get("id") if isinstance(result, dict) else None,
+                "errors": invalid[position]
+            })
+        return {
+            "data_type": data_type,
+            "total": len(data),
+            "invalid": len(invalid),
+            "records": records,
+            "summary": summarize_errors(invalid),
+            "elapsed": time.time() - start
+        }
+
+    def validation_report(self) -> Dict[str, Dict[str, Any]]:
+        """校验训练集和验证集"""
+        return {"train": self.validate_split("train"), "val": self.validate_split("val")}
 
     def filter_combined(self, data_type: str = "train", filters: Optional[List[Dict[str, Any]]] = None, data: Optional[List[Dict[str, Any]]] = None, callback=None) -> List[Dict[str, Any]]:
         """组合多种过滤方式
@@ -410,34 +885,53 @@ class UniversalDataManager:
             filters: 过滤配置列表，每个配置包含过滤类型和参数
                      例如: [
                          {"type": "tags", "params": {"tags": ["综艺", "音乐"]}},
-                         {"type": "llm", "params": {"query": "搞笑视频", "model": "qwen-max"}}
+                         {"type": "field", "params": {"field": "intent", "value": "查询天气"}},
+                         {"type": "llm", "params": {"query": "搞笑视频", "model": "qwen-max", "max_workers": 8, "batch_size": 20}}
                      ]
             data: 可选的输入数据列表，如果不提供则使用默认数据集
-            callback: 进度回调函数，接收消息和进度值(0-1)
-                      
+            callback: 进度回调函数，接收消息和进度值(0-1)，会收到执行计划和每步的输入/输出条数
+
+        各步骤按估算的代价和选择率重新排序执行(见 _plan_filters)，结果与按添加顺序执行一致。
+
         Returns:
             过滤后的数据列表
         """
-        if filters is None or not filters:
-            return self.train_data if data_type == "train" else self.val_data
-
         # 初始数据
         filtered_data = data if data is not None else (self.train_data if data_type == "train" else self.val_data)
-        total_steps = len(filters)
-
-        for step_idx, filter_config in enumerate(filters):
-            filter_type = filter_config.get("type")
-            params = filter_config.get("params", {})
+        if filters is None or not filters:
+            return filtered_data
+
+        # 各步骤都是逐条判断的AND条件，可以交换顺序；按估算的代价和选择率重排
+        plan = self._plan_filters(data_type, filters)
+        total_steps = len(plan)
+        plan_desc = " → ".join(
+            f"{step['type']}(预估保留{step['selectivity']:.0%})" for step in plan
+        )
+        print(f"组合过滤执行计划: {plan_desc}")
+        if callback:
+            callback(f"执行计划: {plan_desc}", progress=0.0)
+
+        for step_idx, step in enumerate(plan):
+            filter_type = step["type"]
+            params = step["params"]
+            rows_in = len(filtered_data)
+            if not filtered_data:
+                # 前面的步骤已经过滤掉全部数据，跳过剩余步骤(尤其是大模型调用)
+                if callback:
+                    callback(f"第{step_idx + 1}/{total_steps}步 {filter_type}: 已无数据，跳过剩余步骤", progress=1.0)
+                break
 
             # 更新进度
             if callback:
-                step_progress = (step_idx + 1) / total_steps
-                callback(f"正在执行第{step_idx + 1}/{total_steps}步过滤: {filter_type}", progress=step_progress)
+                step_progress = step_idx / total_steps
+                callback(f"正在执行第{step_idx + 1}/{total_steps}步过滤: {filter_type} (输入{rows_in}条)", progress=step_progress)
 
             if filter_type == "tags":
                 filtered_data = self.filter_by_tags(data_type=data_type, tags=params.get("tags"), data=filtered_data)
             elif filter_type == "regex":
                 filtered_data = self.filter_by_regex(data_type=data_type, pattern=params.get("pattern"), data=filtered_data)
+            elif filter_type == "field":
+                filtered_data = self.filter_by_field(data_type=data_type, field=params.get("field"), value=params.get("value"), data=filtered_data)
             elif filter_type == "llm":
                 # 获取模型参数，如果没有则使用默认值
                 model = params.get("model", "qwen-plus")
@@ -446,81 +940,237 @@ class UniversalDataManager:
                     if callback:
                         overall_progress = step_idx / total_steps + progress / total_steps
                         callback(f"第{step_idx + 1}/{total_steps}步 (LLM): {message}", progress=overall_progress)
-                filtered_data = self.filter_by_llm(data_type=data_type, query=params.get("query"), data=filtered_data, callback=llm_sub_callback, model=model)
+                filtered_data = self.filter_by_llm(data_type=data_type, query=params.get("query"), data=filtered_data, callback=llm_sub_callback, model=model,
+                                                   max_workers=params.get("max_workers", DEFAULT_LLM_CONCURRENCY),
+                                                   batch_size=params.get("batch_size", 1),
+                                                   use_cache=params.get("use_cache", True))
             else:
                 print(f"未知的过滤类型: {filter_type}")
 
+            if callback:
+                callback(f"第{step_idx + 1}/{total_steps}步 {filter_type}: {rows_in} → {len(filtered_data)}条",
+                         progress=(step_idx + 1) / total_steps)
+
         print(f"组合过滤结果: {len(filtered_data)}条数据")
         return filtered_data
 
+    def iter_records(self, data_type: str = "train", filters: Optional[List[Dict[str, Any]]] = None,
+                     batch_size: int = 1000, callback=None) -> Iterator[Dict[str, Any]]:
+        """按数据集顺序逐条产出满足过滤条件的数据(filters格式同filter_combined)
+
+        标签和正则过滤在倒排索引上对整个数据集执行一次，得到的是条目引用列表；
+        大模型过滤按batch_size分批执行，边过滤边产出，调用方(如导出)不必等待全部判断完成。
+        """
+        data = self.train_data if data_type == "train" else self.val_data
+        filters = filters or []
+        local_filters = [f for f in filters if f.get("type") != "llm"]
+        llm_filters = [f for f in filters if f.get("type") == "llm"]
+        candidates = self.filter_combined(data_type, local_filters) if local_filters else data
+        for start in range(0, len(candidates), batch_size):
+            batch = candidates[start:start + batch_size]
+            if llm_filters:
+                batch = self.filter_combined(data_type, llm_filters, data=batch)
+            if callback:
+                callback(f"已处理{min(start + batch_size, len(candidates))}/{len(candidates)}条",
+                         progress=min(1.0, (start + batch_size) / len(candidates)))
+            yield from batch
+
+    def _plan_filters(self, data_type: str, filters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """为组合过滤生成执行计划
+
+        估算每个步骤的单条代价和选择率(保留比例)，按 代价 / (1 - 选择率) 从小到大排序，
+        即优先执行便宜且过滤掉数据多的步骤，大模型过滤总是排在最后。代价相同时保持用户添加的顺序。
+        """
+        plan = []
+        for order, filter_config in enumerate(filters):
+            filter_type = filter_config.get("type")
+            params = filter_config.get("params", {})
+            cost = FILTER_ROW_COST.get(filter_type, 0)
+            selectivity = 1.0
+            if filter_type == "tags":
+                selectivity = self._estimate_tags_selectivity(data_type, params.get("tags"))
+            elif filter_type == "regex":
+                cost, selectivity = self._estimate_regex_cost(data_type, params.get("pattern"))
+            elif filter_type in ("field", "llm"):
+                selectivity = DEFAULT_SELECTIVITY
+            rank = cost / (1 - selectivity) if selectivity < 1 else float("inf")
+            plan.append({"type": filter_type, "params": params, "cost": cost,
+                         "selectivity": selectivity, "rank": rank, "order": order})
+        # 预估不过滤任何数据的本地步骤排名为无穷大，大模型过滤仍须排在它们之后
+        plan.sort(key=lambda step: (step["type"] == "llm", step["rank"], step["order"]))
+        return plan
+
+    def _estimate_tags_selectivity(self, data_type, tags):
+        """根据bigram倒排表的候选数估算标签过滤的保留比例(上界)"""
+        if not tags:
+            return 1.0
+        if isinstance(self.train_data if data_type == "train" else self.val_data, LazyRecordList):
+            return DEFAULT_SELECTIVITY
+        index = self._get_tag_index(data_type)
+        if not len(index):
+            return DEFAULT_SELECTIVITY
+        selectivity = None
+        for tag in tags:
+            docs = index.candidates(tag.lower())
+            if docs is not None:
+                ratio = min(len(docs) / len(index), 1.0)
+                selectivity = ratio if selectivity is None else min(selectivity, ratio)
+        return DEFAULT_SELECTIVITY if selectivity is None else selectivity
+
+    def _estimate_regex_cost(self, data_type, pattern):
+        """估算正则过滤的单条代价和保留比例，能用trigram预筛时两者都更低"""
+        if not pattern:
+            return 0, 1.0
+        try:
+            literals = required_literals(re.compile(pattern))
+        except re.error:
+            return FILTER_ROW_COST["regex"], DEFAULT_SELECTIVITY
+        if not literals or isinstance(self.train_data if data_type == "train" else self.val_data, LazyRecordList):
+            return FILTER_ROW_COST["regex"], DEFAULT_SELECTIVITY
+        index = self._get_trigram_index(data_type)
+        docs = index.candidates_all(literals)
+        if docs is None or not len(index):
+            return FILTER_ROW_COST["regex"], DEFAULT_SELECTIVITY
+        return FILTER_ROW_COST["tags"], min(len(docs) / len(index), 1.0)
+
     # 修改现有过滤方法以支持传入数据参数
     def filter_by_tags(self, data_type: str = "train", tags: Optional[List[str]] = None, data: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
-        """通过标签过滤数据 - 基于项目配置动态适配数据结构"""
+        """通过标签过滤数据 - 基于字符bigram倒排索引，结果与逐条子串匹配一致"""
         if tags is None or not tags:
-            return self.train_data if data_type == "train" else self.val_data
+            return data if data is not None else (self.train_data if data_type == "train" else self.val_data)
 
         # 使用传入的数据或默认数据
-        data = data if data is not None else (self.train_data if data_type == "train" else self.val_data)
-        filtered_data = []
+        split_data = self.train_data if data_type == "train" else self.val_data
+        data = data if data is not None else split_data
+        if isinstance(split_data, LazyRecordList):
+            filtered_data = self._scan_tags(data, tags)
+            print(f"标签过滤结果: {len(filtered_data)}条数据")
+            return filtered_data
+
+        # 在倒排索引上求出同时包含所有标签的条目
+        index = self._get_tag_index(data_type)
+        matched = None
+        for tag in tags:
+            docs = index.search(tag.lower())
+            matched = docs if matched is None else matched & docs
+            if not matched:
+                break
 
+        filtered_data = []
         for item in data:
-            # 获取主要文本字段进行搜索
-            search_texts = []
-            
-            # 从Input中提取文本字段
-            if "Input" in item:
-                input_data = item["Input"]
-                # 根据配置或常见字段名提取文本
-                text_fields = ["current_query", "query", "processed_query", "user_input"]
-                for field in text_fields:
-                    if field in input_data and isinstance(input_data[field], str):
-                        search_texts.append(input_data[field])
-                
-                # 处理历史对话
-                if "history" in input_data and isinstance(input_data["history"], list):
-                    for msg in input_data["history"]:
-                        if isinstance(msg, dict) and "content" in msg:
-                            search_texts.append(msg["content"])
-            
-            # 从Result中提取文本字段
-            if "Result" in item:
-                result_data = item["Result"]
-                text_fields = ["intent", "response", "processed_query", "target"]
-                for field in text_fields:
-                    if field in result_data and isinstance(result_data[field], str):
-                        search_texts.append(result_data[field])
-            
-            # 在所有提取的文本中搜索标签
-            combined_text = " ".join(search_texts).lower()
-            if all(tag.lower() in combined_text for tag in tags):
-                filtered_data.append(item)
+            doc = index.doc_id(item)
+            if doc is not None:
+                if doc in matched:
+                    filtered_data.append(item)
+            else:
+                # 不属于当前数据集的外部数据，直接匹配
+                combined_text = extract_tag_text(item)
+                if all(tag.lower() in combined_text for tag in tags):
+                    filtered_data.append(item)
 
         print(f"标签过滤结果: {len(filtered_data)}条数据")
         return filtered_data
 
+    def _scan_tags(self, data, tags):
+        """逐条匹配标签(按需读取的数据集不构建倒排索引，SQLite数据集使用FTS5索引)
+
+        标签都能原样出现在序列化文本中时，先在数据行文本上粗筛，只解析可能匹配的条目。
+        """
+        if isinstance(data, SqliteRecordList):
+            # SQLite数据集在FTS5索引上匹配
+            return data.items_at(data.match_tags(tags))
+        tags = [tag.lower() for tag in tags]
+        candidates = data
+        if isinstance(data, LazyRecordList) and all(RAW_SAFE_TAG.fullmatch(tag) for tag in tags):
+            positions = [pos for pos, text in data.iter_texts() if all(tag in text.lower() for tag in tags)]
+            candidates = (data[pos] for pos in positions)
+        return [item for item in candidates if all(tag in extract_tag_text(item) for tag in tags)]
+
     def filter_by_regex(self, data_type: str = "train", pattern: str = "", data: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
         """通过正则表达式过滤数据"""
         if not pattern:
-            return self.train_data if data_type == "train" else self.val_data
+            return data if data is not None else (self.train_data if data_type == "train" else self.val_data)
 
         # 使用传入的数据或默认数据
-        data = data if data is not None else (self.train_data if data_type == "train" else self.val_data)
-        filtered_data = []
+        split_data = self.train_data if data_type == "train" else self.val_data
+        data = data if data is not None else split_data
         regex = re.compile(pattern)
-
-        for item in data:
-            # 搜索Input和Result中的文本
-            item_str = json.dumps(item, ensure_ascii=False)
-            if regex.search(item_str):
-                filtered_data.append(item)
+        if isinstance(split_data, LazyRecordList):
+            # 按需读取的数据集：直接在数据行文本上匹配，只解析匹配的条目；SQLite数据集先在FTS5索引上预筛
+            if isinstance(data, SqliteRecordList):
+                filtered_data = data.items_at(data.match_regex(regex))
+            elif isinstance(data, LazyRecordList):
+                filtered_data = [data[pos] for pos, text in data.iter_texts() if regex.search(text)]
+            else:
+                filtered_data = [item for item in data if regex.search(json.dumps(item, ensure_ascii=False))]
+            print(f"正则过滤结果: {len(filtered_data)}条数据")
+            return filtered_data
+
+        # 在缓存的序列化文本(Input和Result)中搜索
+        split = "train" if data_type == "train" else "val"
+        text_cache = self._get_text_cache(split)
+        candidates = None
+        literals = required_literals(regex)
+        if literals and data:
+            # 用正则中必须出现的字面量在trigram索引上预筛候选，只对候选执行完整正则
+            index = self._get_trigram_index(data_type)
+            candidates = index.candidates_all(literals)
+        if candidates is None or (data is split_data and len(candidates) > REGEX_PREFILTER_MAX_RATIO * len(data)):
+            # 无法预筛或预筛不够有选择性时直接扫描，完整数据集走拼接缓冲区
+            scanned = data
+            if data is split_data and self._snapshot[split] is not None:
+                # 数据未修改时与快照列表的条目完全相同，用快照列表扫描以共享其拼接缓冲区
+                scanned = self._snapshot[split].records
+            filtered_data = text_cache.search(regex, scanned, buffered=data is split_data)
+        elif data is split_data:
+            # 文档号与数据集顺序一致，按文档号排序即保持原顺序
+            texts = index.texts
+            filtered_data = [index.items[doc] for doc in sorted(candidates)
+                             if texts[doc] is not None and regex.search(texts[doc])]
+        else:
+            filtered_data = []
+            for item in data:
+                doc = index.doc_id(item)
+                if doc is None:
+                    # 不属于当前数据集的外部数据，直接匹配
+                    if regex.search(text_cache.text(item)):
+                        filtered_data.append(item)
+                elif doc in candidates and regex.search(index.texts[doc]):
+                    filtered_data.append(item)
 
         print(f"正则过滤结果: {len(filtered_data)}条数据")
         return filtered_data
 
-    def filter_by_llm(self, data_type: str = "train", query: str = "", data: Optional[List[Dict[str, Any]]] = None, callback=None, model="qwen-max") -> List[Dict[str, Any]]:
-        """通过大模型语义过滤数据"""
+    def filter_by_field(self, data_type: str = "train", field: str = "", value: Any = None, data: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """按Result中某个字段的取值精确过滤，如 field="intent", value="查询天气"
+
+        SQLite数据集在数据库中查询(sqlite_store.SQLITE_INDEXED_FIELDS中的字段走生成列索引)，其余逐条比较。
+        """
+        if not field:
+            return data if data is not None else (self.train_data if data_type == "train" else self.val_data)
+
+        data = data if data is not None else (self.train_data if data_type == "train" else self.val_data)
+        positions = data.match_field(field, value) if isinstance(data, SqliteRecordList) else None
+        if positions is not None:
+            filtered_data = data.items_at(positions)
+        else:
+            filtered_data = [item for item in data
+                             if isinstance(item.get("Result"), dict) and item["Result"].get(field) == value]
+        print(f"字段过滤结果: {len(filtered_data)}条数据")
+        return filtered_data
+
+    def filter_by_llm(self, data_type: str = "train", query: str = "", data: Optional[List[Dict[str, Any]]] = None, callback=None, model="qwen-max",
+                      max_workers: int = DEFAULT_LLM_CONCURRENCY, batch_size: int = 1, token_budget: int = LLM_BATCH_TOKEN_BUDGET,
+                      use_cache: bool = True) -> List[Dict[str, Any]]:
+        """通过大模型语义过滤数据
+
+        batch_size为1时每条数据单独调用一次大模型；大于1时把最多batch_size条、总长度不超过token_budget的数据
+        打包进一个请求，要求返回每个批内编号的判断，缺失的编号会单独重新询问，最多LLM_BATCH_MAX_RETRIES轮。
+        最多同时发出max_workers个请求，结果按原数据顺序返回，进度回调只在调用线程中执行。
+        use_cache为True时相同的提示词直接复用本项目缓存的响应(见 llm_cache)。
+        """
         if not query:
-            return self.train_data if data_type == "train" else self.val_data
+            return data if data is not None else (self.train_data if data_type == "train" else self.val_data)
 
         if not self.api_key:
             raise ValueError("API密钥未设置，请先设置API密钥")
@@ -528,37 +1178,122 @@ class UniversalDataManager:
         # 使用传入的数据或默认数据
         data = data if data is not None else (self.train_data if data_type == "train" else self.val_data)
         total_items = len(data)
-        filtered_data = []
-        processed_count = 0
-
-        # 为每条数据单独调用LLM进行判断
-        for item in data:
-            processed_count += 1
-            item_id = item["Result"].get("id", processed_count)
-            input_query=json.dumps(item, ensure_ascii=False, indent=2)        # 构建单条数据的提示
-            prompt = f"用户查询: '{query}'\n\n数据条目查询: '{input_query}'\n\n请判断该数据条目是否与用户查询语义相关。仅返回'true'或'false'，不要包含其他文本。"
-            print(f"正在处理第{processed_count}/{total_items}条数据 (ID: {item_id}), 模型: {model}")
-            # 调用回调函数报告进度
-            # if callback:
-            #     callback(f"正在处理第{processed_count}/{total_items}条数据 (ID: {item_id})", progress=processed_count/total_items)
-
-            try:
-                # 调用LLM
-                response = call_llm(prompt, self.api_key, model=model)
-                # 解析响应
-                is_relevant = response.strip().lower() == 'true'
-                if is_relevant:
-                    filtered_data.append(item)
-            except Exception as e:
-                print(f"处理ID为{item_id}的数据时出错: {str(e)}")
-                # 出错时跳过该数据
-                continue
-
-        # if callback:
-        #     callback(f"过滤完成，共找到{len(filtered_data)}条相关数据", progress=1.0)
+        if not total_items:
+            return []
+        batch_size = max(1, int(batch_size or 1))
+        max_workers = max(1, int(max_workers or 1))
+        rounds = 1 + (LLM_BATCH_MAX_RETRIES if batch_size > 1 else 0)
+        relevant = [False] * total_items
+        pending = list(range(total_items))
+        judged_count = 0
+        request_count = 0
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for round_idx in range(rounds):
+                final_round = round_idx == rounds - 1
+                if batch_size > 1:
+                    jobs = self._pack_llm_batches(data, pending, batch_size, token_budget)
+                else:
+                    jobs = [[position] for position in pending]
+                request_count += len(jobs)
+                # 每约1%的进度回调一次，避免频繁刷新页面
+                report_every = max(1, len(jobs) // 100)
+                futures = {
+                    executor.submit(self._llm_judge_items, [data[position] for position in job], query, model, use_cache): job
+                    for job in jobs
+                }
+                missing = []
+                failed_count = 0
+                for done_count, future in enumerate(as_completed(futures), 1):
+                    job = futures[future]
+                    try:
+                        verdicts = future.result()
+                    except Exception as e:
+                        print(f"处理第{job[0] + 1}条起的{len(job)}条数据时出错: {str(e)}")
+                        verdicts = {}
+                    for index, position in enumerate(job):
+                        if index in verdicts:
+                            relevant[position] = verdicts[index]
+                            judged_count += 1
+                        else:
+                            missing.append(position)
+                            if final_round:
+                                failed_count += 1
+                    print(f"已判断{judged_count}/{total_items}条数据, 模型: {model}")
+                    if callback and (done_count % report_every == 0 or done_count == len(jobs)):
+                        # 最后一轮中未得到判断的数据按不相关处理，同样计入进度
+                        callback(f"已判断{judged_count}/{total_items}条数据 (已发送{request_count}个请求, 并发{max_workers})",
+                                 progress=(judged_count + failed_count) / total_items)
+                pending = sorted(missing)
+                if not pending:
+                    break
+                if not final_round:
+                    print(f"第{round_idx + 1}轮有{len(pending)}条数据未得到判断，重新询问")
+
+        if pending:
+            # 出错或始终未得到判断的数据按不相关处理
+            print(f"有{len(pending)}条数据未能得到判断，按不相关处理")
+        filtered_data = [item for item, keep in zip(data, relevant) if keep]
+        if callback:
+            failed_note = f", {len(pending)}条判断失败按不相关处理" if pending else ""
+            callback(f"过滤完成，共找到{len(filtered_data)}条相关数据 (共{request_count}个请求{failed_note})", progress=1.0)
         print(f"LLM过滤结果: {len(filtered_data)}条数据")
         return filtered_data
 
+    @property
+    def llm_cache_namespace(self):
+        """大模型响应缓存的命名空间，按项目隔离"""
+        return self.current_project or "default"
+
+    def llm_cache_stats(self):
+        """当前项目的大模型响应缓存统计"""
+        return get_default_cache().stats(self.llm_cache_namespace)
+
+    def clear_llm_cache(self):
+        """清空当前项目的大模型响应缓存"""
+        get_default_cache().clear(self.llm_cache_namespace)
+
+    def _pack_llm_batches(self, data, positions, batch_size, token_budget):
+        """按条数上限和token预算把待判断的数据贪心地打包成批，超出预算的单条数据独占一批"""
+        batches = []
+        current = []
+        current_tokens = 0
+        for position in positions:
+            tokens = estimate_tokens(json.dumps(data[position], ensure_ascii=False))
+            if current and (len(current) >= batch_size or current_tokens + tokens > token_budget):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(position)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _llm_judge_items(self, items, query, model, use_cache=False):
+        """调用大模型判断一批数据是否与查询语义相关(在线程池中执行)，返回 {批内下标: 是否相关}"""
+        cache_kwargs = {"cache": get_default_cache(), "namespace": self.llm_cache_namespace} if use_cache else {}
+        if len(items) == 1:
+            input_query = json.dumps(items[0], ensure_ascii=False, indent=2)
+            prompt = f"用户查询: '{query}'\n\n数据条目查询: '{input_query}'\n\n请判断该数据条目是否与用户查询语义相关。仅返回'true'或'false'，不要包含其他文本。"
+            response = call_llm(prompt, self.api_key, model=model, **cache_kwargs)
+            return {0: response.strip().lower() == 'true'}
+
+        # 批量判断使用紧凑JSON和批内编号，减少token消耗
+        entries = "\n".join(f"[{index}] {json.dumps(item, ensure_ascii=False)}" for index, item in enumerate(items, 1))
+        prompt = (
+            f"用户查询: '{query}'\n\n"
+            f"下面是{len(items)}条数据条目，每条以\"[编号]\"开头：\n{entries}\n\n"
+            f"请逐条判断每个数据条目是否与用户查询语义相关。仅返回一个JSON对象，键为编号，值为true或false，"
+            f"必须包含全部{len(items)}个编号，例如: {{\"1\": true, \"2\": false}}。不要包含其他文本。"
+        )
+        response = call_llm(prompt, self.api_key, model=model, **cache_kwargs)
+        verdicts = parse_llm_batch_verdicts(response, len(items))
+        if use_cache and len(verdicts) < len(items):
+            # 不完整的响应不保留在缓存中，否则重新询问同一批数据时会再次命中它
+            get_default_cache().delete(self.llm_cache_namespace, make_cache_key(model, prompt, GENERATION_PARAMS))
+        return verdicts
+
     def get_item_display_info(self, item):
         """提取数据项的显示信息 - 根据项目配置动态适配"""
         display_info = {
@@ -662,11 +1397,9 @@ class UniversalDataManager:
         try:
             # 调用LLM
             result = call_llm(prompt, self.api_key, model=model).strip()
-            # 使用正则表达式提取JSON内容
-            json_match = re.search(r'\{.*\}', result, re.DOTALL)
-            if not json_match:
+            result_json = extract_json_from_llm_response(result)
+            if not isinstance(result_json, dict):
                 raise Exception("无法从LLM响应中提取JSON")
-            result_json = json.loads(json_match.group())
 
             # 构建新条目
             new_entry = {
@@ -694,11 +1427,9 @@ class UniversalDataManager:
         try:
             # 调用LLM
             result = call_llm(prompt, self.api_key, model=model).strip()
-            # 使用正则表达式提取JSON内容
-            json_match = re.search(r'\{.*\}', result, re.DOTALL)
-            if not json_match:
+            result_json = extract_json_from_llm_response(result)
+            if not isinstance(result_json, dict):
                 raise Exception("无法从LLM响应中提取JSON")
-            result_json = json.loads(json_match.group())
 
             # 从结果中提取用户输入
             user_input = result_json.get("user_input", "")
@@ -718,6 +1449,18 @@ class UniversalDataManager:
             print(f"生成Backward模式数据时出错: {str(e)}")
             raise
 
+    def generate_self_instruct_pairs(self, system_prompt, model="qwen-max"):
+        """Self-instruct模式: 一次调用，返回模型输出中的全部数据对(提示词可以要求一次生成多条)"""
+        if not self.api_key:
+            raise ValueError("API密钥未设置，请先设置API密钥")
+
+        prompt = f"{system_prompt}\n\n请自主生成一个用户输入和对应的输出结果，并生成符合现有数据格式的结果，包括id、turn、query_independent、target、processed_query和search。"
+        result = call_llm(prompt, self.api_key, model=model).strip()
+        data_pairs = []
+        for item in scan_json(result):
+            collect_data_pairs(item.value, data_pairs)
+        return data_pairs
+
     def generate_self_instruct_data(self, system_prompt, model="qwen-max"):
         """Self-instruct模式: 由模型自主生成符合格式的输入输出对"""
         if not self.api_key:
@@ -0,0 +1,155 @@
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from indexes import SerializedTextCache
+from lazy_records import open_lazy_records
+from storage import JsonlSplitStore
+
+
+class SplitSnapshot:
+    """某个数据文件在某一时刻解析出的数据，由所有会话共享，任何会话都不能修改其中的列表和条目
+
+    同时缓存基于该版本数据的序列化文本和n-gram倒排索引，数据未修改的会话直接共享；
+    会话修改数据前先fork出私有副本(见UniversalDataManager._detach)。
+    """
+
+    def __init__(self, records: List[Dict[str, Any]], signature: Tuple[int, Optional[int]],
+                 line_count: int, live_count: int, version: int):
+        self.records = records
+        self.signature = signature
+        self.line_count = line_count
+        self.live_count = live_count
+        self.version = version
+        self.text_cache = SerializedTextCache()
+        # 索引名 -> 基于records构建的索引
+        self._indexes = {}
+        self._index_lock = threading.Lock()
+
+    def index(self, name: str, build: Callable[[], Any]):
+        """获取名为name的共享索引，首次使用时调用build构建(同一版本只构建一次)"""
+        index = self._indexes.get(name)
+        if index is None:
+            with self._index_lock:
+                index = self._indexes.get(name)
+                if index is None:
+                    index = self._indexes[name] = build()
+        return index
+
+    def peek(self, name: str):
+        """已构建的共享索引，尚未构建时返回None"""
+        return self._indexes.get(name)
+
+    def adopt(self, text_cache: SerializedTextCache, indexes: Dict[str, Any]):
+        """接管发布该快照的会话的文本缓存和索引(它们正对应records)，调用后会话不能再修改它们"""
+        self.text_cache = text_cache
+        with self._index_lock:
+            self._indexes.update({name: index for name, index in indexes.items() if index is not None})
+
+
+class _Entry:
+    def __init__(self):
+        # 每个数据文件单独加锁，多个会话同时打开同一项目时只解析一次
+        self.lock = threading.Lock()
+        self.snapshot = None
+
+
+class DatasetRegistry:
+    """进程级的数据集注册表
+
+    每个项目的每个数据集(train/val)只在内存中保留一份解析后的快照，所有会话的管理器共享它。
+    快照记录解析时数据文件的(字节数, 修改时间)，文件变化(其他进程写入、Schema迁移等)后下次获取时重新解析。
+    超过storage.LAZY_LOAD_MIN_BYTES的数据文件不解析，快照是按需读取的LazyRecordList(偏移索引+内存映射)。
+    会话拿到的是快照列表的浅拷贝：增删条目只影响自己的列表，修改条目前先复制该条目(写时复制，见
+    UniversalDataManager._own_item)。会话把修改写入文件后，如果写入前文件正是它所基于的版本，
+    就把自己的列表发布为新快照，其他会话无需重新解析文件即可刷新到最新数据。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _entry(self, path) -> _Entry:
+        key = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            return entry
+
+    def load(self, store: JsonlSplitStore) -> SplitSnapshot:
+        """获取数据集的当前快照，文件自上次解析后有变化时重新解析，并同步store的行数统计"""
+        entry = self._entry(store.path)
+        # 先取数据集的写锁再取条目锁(与写入后发布的顺序一致)，解析期间文件不会被本进程的其他会话写入
+        with store.lock(), entry.lock:
+            store.migrate_legacy()
+            signature = store.signature()
+            snapshot = entry.snapshot
+            if snapshot is None or snapshot.signature != signature:
+                if store.is_large():
+                    records = open_lazy_records(store)
+                else:
+                    records = store.load()
+                version = snapshot.version + 1 if snapshot else 1
+                # 解析期间文件可能又被写入，以解析前的签名为准，下次获取时会再次检测到变化
+                snapshot = entry.snapshot = SplitSnapshot(records, signature, store.line_count,
+                                                          store.live_count, version)
+            else:
+                store.line_count = snapshot.line_count
+                store.live_count = snapshot.live_count
+            return snapshot
+
+    def publish(self, store: JsonlSplitStore, records: List[Dict[str, Any]], base_signature,
+                before_signature, share=True):
+        """会话写入数据文件后调用
+
+        调用方必须从读取before_signature之前一直到发布完成都持有数据集的写锁(store.lock())，
+        否则其他会话可能在两者之间写入，发布的快照会缺少它们写入的数据。
+        before_signature为写入前的文件签名；只有它等于会话所基于的版本(base_signature)时，
+        会话内存中的数据才与写入后的文件一致。此时返回写入后的签名作为会话新的基准版本，
+        share=True(会话没有其他未保存的修改)时同时把records发布为新快照。
+        否则说明文件被其他会话改过，返回None，会话应在没有未保存修改时重新加载。
+        返回(新的基准签名, 发布的快照)，没有发布快照时后者为None。
+        """
+        if before_signature != base_signature:
+            return None, None
+        entry = self._entry(store.path)
+        with entry.lock:
+            signature = store.signature()
+            if not share:
+                return signature, None
+            version = entry.snapshot.version + 1 if entry.snapshot else 1
+            entry.snapshot = SplitSnapshot(records.copy(), signature, store.line_count,
+                                           store.live_count, version)
+            return signature, entry.snapshot
+
+    def is_current(self, store: JsonlSplitStore, signature) -> bool:
+        """签名是否与数据文件当前的状态一致"""
+        return signature is not None and signature == store.signature()
+
+    def forget(self, data_dir: str):
+        """丢弃某个项目目录下全部数据集的快照(如删除项目后)"""
+        prefix = os.path.join(os.path.abspath(data_dir), "")
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """当前缓存的快照: {文件路径: {"records", "version"}}"""
+        with self._lock:
+            entries = list(self._entries.items())
+        return {path: {"records": len(entry.snapshot.records), "version": entry.snapshot.version}
+                for path, entry in entries if entry.snapshot is not None}
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_registry() -> DatasetRegistry:
+    """获取进程内共享的数据集注册表"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = DatasetRegistry()
+        return _default_registry
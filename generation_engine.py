@@ -0,0 +1,271 @@
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
+
+# 生成模式：查询->结果两阶段(generate_new_data)，或Self-instruct一次生成完整数据对
+GENERATION_MODES = ("query_result", "self_instruct")
+# 默认并发请求数
+DEFAULT_GENERATION_WORKERS = 8
+# 直接写入数据集时，每攒够这么多条追加一次
+GENERATION_FLUSH_SIZE = 50
+# 没有产出有效新数据的调用(出错、格式不合法、重复)超过目标条数的该比例时停止任务
+GENERATION_MAX_WASTE_RATIO = 0.5
+# 无效调用次数上限的最小值，避免小任务偶发错误就失败
+GENERATION_MIN_WASTE_LIMIT = 20
+# 保留最近的错误信息条数
+GENERATION_ERROR_LOG_SIZE = 20
+
+
+def validate_generated_entry(entry) -> Optional[str]:
+    """检查生成的条目结构，合法时返回None，否则返回原因"""
+    if not isinstance(entry, dict):
+        return "条目不是JSON对象"
+    if not isinstance(entry.get("Input"), dict):
+        return "Input不是JSON对象"
+    if not isinstance(entry.get("Result"), dict):
+        return "Result不是JSON对象"
+    if not entry["Input"]:
+        return "Input为空"
+    return None
+
+
+class GenerationJob:
+    """后台批量生成任务
+
+    在后台线程中用线程池并发调用大模型，直到得到target条有效数据。查询->结果模式下两个阶段流水线执行：
+    某条查询一返回，就立即提交它的结果生成请求，同时继续生成其他查询，始终保持max_workers个请求在途。
+    生成的条目经过校验(结构和项目Schema)和去重(按Input内容)后，destination为"review"时放入审核队列，由页面取出人工审核；
+    为"train"/"val"时每攒够flush_size条调用add_generated_data追加到对应数据集。
+    任务使用manager.open_session()得到的独立管理器，始终写入、校验创建任务时的项目(project)，
+    会话切换项目或页面读取会话数据都不受后台线程影响。
+
+    进度通过progress()读取，cancel()可随时取消，已生成的数据会保留(写入模式下已攒的数据会落盘)。
+    """
+
+    def __init__(self, manager, mode="self_instruct", target=100, system_prompt="", model="qwen-max",
+                 max_workers=DEFAULT_GENERATION_WORKERS, destination="review", flush_size=GENERATION_FLUSH_SIZE,
+                 validator: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None, dedupe=True):
+        if mode not in GENERATION_MODES:
+            raise ValueError(f"不支持的生成模式: {mode}")
+        if destination not in ("review", "train", "val"):
+            raise ValueError(f"不支持的输出位置: {destination}")
+        if mode == "self_instruct" and not system_prompt:
+            raise ValueError("Self-instruct模式需要System Prompt")
+        if not manager.api_key:
+            raise ValueError("API密钥未设置，请先设置API密钥")
+        self.project = manager.current_project
+        self.manager = manager.open_session()
+        self.mode = mode
+        self.target = max(1, int(target))
+        self.system_prompt = system_prompt
+        self.model = model
+        self.max_workers = max(1, int(max_workers))
+        self.destination = destination
+        self.flush_size = max(1, int(flush_size))
+        self.validator = validator or self._validate_entry
+        self.dedupe = dedupe
+        self.waste_limit = max(GENERATION_MIN_WASTE_LIMIT, int(self.target * GENERATION_MAX_WASTE_RATIO))
+
+        self.status = "pending"
+        # calls为发起的调用链数(查询->结果模式下每条链包含两次请求)，wasted_calls为没有产出有效新数据的链数
+        self.produced = 0
+        self.saved = 0
+        self.calls = 0
+        self.errors = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.wasted_calls = 0
+        self.started_at = None
+        self.finished_at = None
+        self.error_log = deque(maxlen=GENERATION_ERROR_LOG_SIZE)
+        self.review_queue = deque()
+        self._pending_writes = []
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """在后台线程中启动任务"""
+        if self._thread is not None:
+            raise ValueError("任务已经启动")
+        self.status = "running"
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="generation-job", daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """请求取消任务，在途请求完成后停止"""
+        self._cancel.set()
+
+    def join(self, timeout=None):
+        """等待任务结束"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def running(self):
+        return self.status == "running"
+
+    def _log_error(self, message):
+        with self._lock:
+            self.error_log.append(message)
+
+    def _validate_entry(self, entry):
+        """默认校验：结构检查，再按项目Schema校验"""
+        reason = validate_generated_entry(entry)
+        if reason:
+            return reason
+        errors = self.manager.validate_entries([entry]).get(0)
+        return "; ".join(errors[:3]) if errors else None
+
+    # ---- 各阶段任务，在线程池中执行，异常转为返回值交给调度线程处理 ----
+
+    def _query_stage(self):
+        try:
+            return "query", self.manager.generate_query(model=self.model)
+        except Exception as e:
+            return "error", f"生成查询失败: {str(e)}"
+
+    def _result_stage(self, query):
+        try:
+            return "entries", [self.manager.generate_result(query, model=self.model)]
+        except Exception as e:
+            return "error", f"生成结果失败: {str(e)}"
+
+    def _self_instruct_stage(self):
+        try:
+            return "entries", self.manager.generate_self_instruct_pairs(self.system_prompt, model=self.model)
+        except Exception as e:
+            return "error", f"Self-instruct生成失败: {str(e)}"
+
+    def _start_chain(self, executor):
+        self.calls += 1
+        if self.mode == "query_result":
+            return executor.submit(self._query_stage)
+        return executor.submit(self._self_instruct_stage)
+
+    def _expected_yield(self):
+        """每条调用链平均产出的有效条目数，用于估算还需要发起多少请求"""
+        productive = self.calls - self.wasted_calls
+        if self.produced and productive > 0:
+            return self.produced / productive
+        return 1.0
+
+    def _accept(self, entries):
+        """校验、去重并输出一次调用产出的条目，返回新接收的条数"""
+        accepted = 0
+        for entry in entries:
+            if self.produced >= self.target:
+                break
+            reason = self.validator(entry)
+            if reason:
+                self.invalid += 1
+                self._log_error(f"条目校验失败: {reason}")
+                continue
+            if self.dedupe:
+                key = json.dumps(entry["Input"], ensure_ascii=False, sort_keys=True)
+                if key in self._seen:
+                    self.duplicates += 1
+                    continue
+                self._seen.add(key)
+            accepted += 1
+            with self._lock:
+                self.produced += 1
+                if self.destination == "review":
+                    self.review_queue.append(entry)
+                else:
+                    self._pending_writes.append(entry)
+            if len(self._pending_writes) >= self.flush_size:
+                self._flush()
+        return accepted
+
+    def _flush(self):
+        with self._lock:
+            batch, self._pending_writes = self._pending_writes, []
+        if batch:
+            self.manager.add_generated_data(batch, data_type=self.destination)
+            with self._lock:
+                self.saved += len(batch)
+
+    def _run(self):
+        pending = set()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while True:
+                    stopping = (self._cancel.is_set() or self.produced >= self.target
+                                or self.wasted_calls >= self.waste_limit)
+                    # 按平均产出估算在途请求能带来的条数，不足目标时补充新的调用链
+                    while (not stopping and len(pending) < self.max_workers
+                           and self.produced + len(pending) * self._expected_yield() < self.target):
+                        pending.add(self._start_chain(executor))
+                    if not pending:
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        kind, value = future.result()
+                        if kind == "query":
+                            # 已取消或已达到目标时不再为剩余查询生成结果
+                            if stopping:
+                                continue
+                            # 查询阶段完成后立即提交结果阶段，与其他链的查询阶段重叠执行
+                            pending.add(executor.submit(self._result_stage, value))
+                        elif kind == "entries":
+                            if not self._accept(value):
+                                self.wasted_calls += 1
+                        else:
+                            self.errors += 1
+                            self.wasted_calls += 1
+                            self._log_error(value)
+            self._flush()
+            if self._cancel.is_set():
+                self.status = "cancelled"
+            elif self.produced >= self.target:
+                self.status = "done"
+            else:
+                self.status = "failed"
+                self._log_error(f"无效调用达到上限({self.waste_limit}次)，任务停止")
+        except Exception as e:
+            self.status = "failed"
+            self._log_error(f"任务异常: {str(e)}")
+        finally:
+            self.finished_at = time.time()
+            print(f"批量生成任务结束({self.status}): 生成{self.produced}/{self.target}条，"
+                  f"调用{self.calls}次，错误{self.errors}次，无效{self.invalid}条，重复{self.duplicates}条")
+
+    def take_review(self, limit=None) -> List[Dict[str, Any]]:
+        """从审核队列中取出最多limit条(None表示全部)待审核的条目"""
+        taken = []
+        with self._lock:
+            while self.review_queue and (limit is None or len(taken) < limit):
+                taken.append(self.review_queue.popleft())
+        return taken
+
+    def progress(self) -> Dict[str, Any]:
+        """返回当前进度快照"""
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            rate = self.produced / elapsed if elapsed > 0 else 0.0
+            remaining = self.target - self.produced
+            return {
+                "status": self.status,
+                "mode": self.mode,
+                "destination": self.destination,
+                "target": self.target,
+                "produced": self.produced,
+                "saved": self.saved,
+                "queued": len(self.review_queue),
+                "calls": self.calls,
+                "errors": self.errors,
+                "invalid": self.invalid,
+                "duplicates": self.duplicates,
+                "elapsed": elapsed,
+                "rate": rate,
+                "eta": remaining / rate if rate > 0 and self.status == "running" else None,
+                "recent_errors": list(self.error_log),
+            }
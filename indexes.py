@@ -0,0 +1,388 @@
+import re
+import json
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, Optional, Set
+
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# 已删除文档超过该比例时重建倒排表
+REBUILD_DEAD_RATIO = 0.5
+
+
+def extract_tag_text(item: dict) -> str:
+    """提取标签过滤使用的文本(小写)：Input/Result中的常见文本字段与历史对话内容"""
+    search_texts = []
+
+    # 从Input中提取文本字段
+    if "Input" in item:
+        input_data = item["Input"]
+        # 根据配置或常见字段名提取文本
+        text_fields = ["current_query", "query", "processed_query", "user_input"]
+        for field in text_fields:
+            if field in input_data and isinstance(input_data[field], str):
+                search_texts.append(input_data[field])
+
+        # 处理历史对话
+        if "history" in input_data and isinstance(input_data["history"], list):
+            for msg in input_data["history"]:
+                if isinstance(msg, dict) and "content" in msg:
+                    search_texts.append(msg["content"])
+
+    # 从Result中提取文本字段
+    if "Result" in item:
+        result_data = item["Result"]
+        text_fields = ["intent", "response", "processed_query", "target"]
+        for field in text_fields:
+            if field in result_data and isinstance(result_data[field], str):
+                search_texts.append(result_data[field])
+
+    return " ".join(search_texts).lower()
+
+
+class NGramIndex:
+    """字符n-gram倒排索引
+
+    为每条数据的文本建立"n-gram -> 文档号"倒排表。查询子串时取其最稀有的两个n-gram的倒排表交集
+    作为候选，再在候选文本上做子串校验，结果与逐条 `sub in text` 完全一致；
+    按字符切分，不依赖空格分词，适用于中文文本。
+    文档以数据条目对象为单位，文档号按添加顺序递增。条目修改后调用 update 增量更新：保留原文档号，
+    只为新文本中新出现的n-gram追加倒排项，旧的倒排项留作过期项(候选总会经过校验，不影响结果)；
+    删除的文档先留作墓碑，墓碑和过期文档过多时整体重建。
+    fork()得到的副本与原索引共享倒排表，副本首次向某个倒排表追加时才复制它，原索引不受影响。
+    """
+
+    def __init__(self, n: int = 2):
+        self.n = n
+        self.postings: Dict[str, array] = {}
+        # 与fork来源共享、追加前需要先复制的倒排表
+        self._borrowed: Set[str] = set()
+        # 文档号 -> 条目对象/文本，删除后置为None
+        self.items: List[Optional[dict]] = []
+        self.texts: List[Optional[str]] = []
+        # id(条目对象) -> 文档号；同时持有条目引用，保证对象id在索引期间不会被复用
+        self.doc_of: Dict[int, int] = {}
+        self.dead = 0
+        # 倒排表中含过期项的文档数
+        self.stale = 0
+
+    def __len__(self):
+        return len(self.doc_of)
+
+    def _grams(self, text: str) -> Set[str]:
+        n = self.n
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    def add(self, item: dict, text: str):
+        """添加一条数据"""
+        doc = len(self.items)
+        self.items.append(item)
+        self.texts.append(text)
+        self.doc_of[id(item)] = doc
+        for gram in self._grams(text):
+            self._posting(gram).append(doc)
+
+    def _posting(self, gram: str) -> array:
+        """可以追加的倒排表，不存在时创建，借用的先复制"""
+        posting = self.postings.get(gram)
+        if posting is None:
+            posting = self.postings[gram] = array('i')
+        elif gram in self._borrowed:
+            posting = self.postings[gram] = array('i', posting)
+            self._borrowed.discard(gram)
+        return posting
+
+    def fork(self) -> "NGramIndex":
+        """复制出可以独立修改的索引：只复制文档表和倒排表的引用，倒排表在副本首次追加时才复制"""
+        index = NGramIndex(self.n)
+        index.postings = dict(self.postings)
+        index._borrowed = set(index.postings)
+        index.items = list(self.items)
+        index.texts = list(self.texts)
+        index.doc_of = dict(self.doc_of)
+        index.dead = self.dead
+        index.stale = self.stale
+        return index
+
+    def remove(self, item: dict):
+        """删除一条数据"""
+        doc = self.doc_of.pop(id(item), None)
+        if doc is None:
+            return
+        self.items[doc] = None
+        self.texts[doc] = None
+        self.dead += 1
+        self._maybe_rebuild()
+
+    def update(self, item: dict, text: str):
+        """条目内容变化后重新索引，未被索引的条目追加为新文档"""
+        doc = self.doc_of.get(id(item))
+        if doc is None:
+            self.add(item, text)
+            return
+        old_text = self.texts[doc]
+        if text == old_text:
+            return
+        self.texts[doc] = text
+        for gram in self._grams(text) - self._grams(old_text):
+            self._posting(gram).append(doc)
+        self.stale += 1
+        self._maybe_rebuild()
+
+    def replace(self, old_item: dict, new_item: dict):
+        """用内容相同的新对象(如写时复制得到的副本)代替已索引的条目，保留原文档号；原条目未被索引时忽略"""
+        doc = self.doc_of.pop(id(old_item), None)
+        if doc is None:
+            return
+        self.items[doc] = new_item
+        self.doc_of[id(new_item)] = doc
+
+    def _maybe_rebuild(self):
+        if self.dead + self.stale > REBUILD_DEAD_RATIO * len(self.items):
+            self._rebuild()
+
+    def _rebuild(self):
+        live = [(item, text) for item, text in zip(self.items, self.texts) if item is not None]
+        self.__init__(self.n)
+        for item, text in live:
+            self.add(item, text)
+
+    def doc_id(self, item: dict) -> Optional[int]:
+        """条目对应的文档号，未被索引时返回None"""
+        return self.doc_of.get(id(item))
+
+    def text(self, item: dict) -> Optional[str]:
+        """条目被索引的文本"""
+        doc = self.doc_of.get(id(item))
+        return None if doc is None else self.texts[doc]
+
+    def candidates(self, substring: str) -> Optional[Set[int]]:
+        """根据n-gram倒排表返回可能包含子串的文档号；子串短于n时返回None表示无法使用索引"""
+        grams = self._grams(substring)
+        if not grams:
+            return None
+        postings = []
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        result = set(postings[0])
+        if len(postings) > 1:
+            result.intersection_update(postings[1])
+        return result
+
+    def candidates_all(self, substrings: List[str]) -> Optional[Set[int]]:
+        """返回可能同时包含所有子串的文档号；没有可用的子串时返回None"""
+        result = None
+        for substring in substrings:
+            docs = self.candidates(substring)
+            if docs is None:
+                continue
+            result = docs if result is None else result & docs
+            if not result:
+                break
+        return result
+
+    def search(self, substring: str) -> Set[int]:
+        """返回文本中包含子串的全部文档号"""
+        texts = self.texts
+        docs = self.candidates(substring)
+        if docs is None:
+            return {doc for doc, text in enumerate(texts) if text is not None and substring in text}
+        return {doc for doc in docs if texts[doc] is not None and substring in texts[doc]}
+
+
+# 依赖匹配位置上下文的正则结构：锚点、前后断言、原子组与占有量词
+_CONTEXT_SENSITIVE_OPS = {"AT", "ASSERT", "ASSERT_NOT", "ATOMIC_GROUP", "POSSESSIVE_REPEAT"}
+
+
+def _walk_pattern(node):
+    """遍历sre解析树中的(操作码, 参数)"""
+    if isinstance(node, sre_parse.SubPattern):
+        for op, av in node.data:
+            yield op, av
+            yield from _walk_pattern(av)
+    elif isinstance(node, (tuple, list)):
+        for child in node:
+            yield from _walk_pattern(child)
+
+
+def _set_matches_newline(members) -> bool:
+    """字符集合([...]、\\s等)是否包含换行符"""
+    contains = False
+    negate = False
+    for op, av in members:
+        op = str(op)
+        if op == "NEGATE":
+            negate = True
+        elif op == "LITERAL":
+            contains = contains or av == 10
+        elif op == "RANGE":
+            contains = contains or av[0] <= 10 <= av[1]
+        elif op == "CATEGORY":
+            name = str(av)
+            contains = contains or (name.endswith(("_SPACE", "_NOT_DIGIT", "_NOT_WORD", "_LINEBREAK"))
+                                    and not name.endswith(("_NOT_SPACE", "_NOT_LINEBREAK")))
+        else:
+            # 无法判断的成员按可能包含处理
+            contains = True
+    return contains != negate
+
+
+def _can_match_newline(tree) -> bool:
+    """正则中是否存在能匹配换行符(缓冲区中的条目分隔符)的原子"""
+    dotall = bool(tree.state.flags & sre_parse.SRE_FLAG_DOTALL)
+    for op, av in _walk_pattern(tree):
+        op = str(op)
+        if op == "LITERAL" and av == 10:
+            return True
+        if op == "NOT_LITERAL" and av != 10:
+            return True
+        if op == "IN" and _set_matches_newline(av):
+            return True
+        if op == "SUBPATTERN" and av[1] & sre_parse.SRE_FLAG_DOTALL:
+            dotall = True
+        if op == "ANY" and dotall:
+            return True
+    return False
+
+
+def _literal_tokens(subpattern):
+    """按顺序产生子模式每次匹配都必须出现的字面字符，None表示连续字面量在此中断"""
+    for op, av in subpattern.data:
+        op = str(op)
+        if op == "LITERAL":
+            yield chr(av)
+        elif op in ("AT", "ASSERT", "ASSERT_NOT"):
+            # 零宽结构不消耗字符，两侧的字面量在文本中依然相邻
+            continue
+        elif op == "SUBPATTERN":
+            if av[1] & sre_parse.SRE_FLAG_IGNORECASE:
+                yield None
+            else:
+                yield from _literal_tokens(av[3])
+        elif op == "ATOMIC_GROUP":
+            yield from _literal_tokens(av)
+        elif op in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"):
+            yield None
+            # 至少重复一次时，内容中的字面量必然出现
+            if av[0] >= 1:
+                yield from _literal_tokens(av[2])
+                yield None
+        else:
+            # 分支、字符集、任意字符、反向引用等无法确定字面量
+            yield None
+
+
+def required_literals(regex, min_length: int = 3) -> List[str]:
+    """提取正则任意一次匹配中都必须出现的字面量片段(长度不小于min_length)
+
+    用于在n-gram索引上预筛候选；忽略大小写的正则无法使用区分大小写的索引，返回空列表。
+    """
+    if regex.flags & re.IGNORECASE:
+        return []
+    try:
+        tree = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return []
+    literals = []
+    current = []
+    for token in list(_literal_tokens(tree)) + [None]:
+        if token is not None:
+            current.append(token)
+            continue
+        if len(current) >= min_length:
+            literals.append("".join(current))
+        current = []
+    return literals
+
+
+def is_buffer_safe(regex) -> bool:
+    """判断正则能否在拼接缓冲区上搜索
+
+    匹配结果不能依赖条目边界之外的上下文(锚点、断言等)，也不能匹配条目之间的换行分隔符。
+    """
+    try:
+        tree = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return False
+    if any(str(op) in _CONTEXT_SENSITIVE_OPS for op, _ in _walk_pattern(tree)):
+        return False
+    return not _can_match_newline(tree)
+
+
+class SerializedTextCache:
+    """数据条目的紧凑JSON序列化缓存
+
+    缓存每条数据的 json.dumps(item, ensure_ascii=False) 结果，条目修改时失效。
+    还可以把整个数据集拼接成一个以换行分隔的连续缓冲区(紧凑JSON中不含换行符)，
+    记录每条数据的偏移，用 regex.search 在缓冲区上跳跃扫描，再按偏移映射回命中的条目。
+    """
+
+    def __init__(self):
+        # id(条目对象) -> (条目, 序列化文本)，持有条目引用避免对象id被复用
+        self._texts = {}
+        # 拼接缓冲区(条目列表, 缓冲区, 各条起始偏移, 各条结束偏移)，整体替换，多个会话共享同一缓存时读到的总是一致的一组
+        self._buffered = None
+
+    def text(self, item: dict) -> str:
+        """获取条目的序列化文本"""
+        entry = self._texts.get(id(item))
+        if entry is not None and entry[0] is item:
+            return entry[1]
+        text = json.dumps(item, ensure_ascii=False)
+        self._texts[id(item)] = (item, text)
+        return text
+
+    def fork(self) -> "SerializedTextCache":
+        """复制出可以独立修改的缓存(共享已序列化的文本，不含拼接缓冲区)"""
+        cache = SerializedTextCache()
+        cache._texts = dict(self._texts)
+        return cache
+
+    def invalidate(self, item: Optional[dict] = None):
+        """条目修改或删除后使其缓存失效；数据集有任何变化都会使缓冲区失效"""
+        if item is not None:
+            self._texts.pop(id(item), None)
+        self._buffered = None
+
+    def _build_buffer(self, items: List[dict]):
+        texts = [self.text(item) for item in items]
+        starts, ends = [], []
+        offset = 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text)
+            ends.append(offset)
+            offset += 1
+        self._buffered = (items, "\n".join(texts), starts, ends)
+        return self._buffered
+
+    def search(self, regex, items: List[dict], buffered: bool = True) -> List[dict]:
+        """返回序列化文本能被regex搜索到的条目，顺序与items一致
+
+        buffered=True时使用拼接缓冲区扫描(适用于完整数据集)，否则逐条搜索缓存的文本。
+        """
+        if not buffered or not items or not is_buffer_safe(regex):
+            return [item for item in items if regex.search(self.text(item))]
+        buffered = self._buffered
+        if buffered is None or buffered[0] is not items or len(buffered[2]) != len(items):
+            buffered = self._build_buffer(items)
+        _, buffer, starts, ends = buffered
+        matched = []
+        pos = 0
+        while pos <= len(buffer):
+            match = regex.search(buffer, pos)
+            if match is None:
+                break
+            # is_buffer_safe保证匹配不会跨越换行分隔符，匹配起点所在的条目即命中条目
+            doc = bisect_right(starts, match.start()) - 1
+            matched.append(items[doc])
+            # 同一条目只需命中一次，从下一条数据的起始位置继续搜索
+            pos = ends[doc] + 1
+        return matched
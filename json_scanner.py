@@ -0,0 +1,173 @@
+import re
+import json
+from bisect import bisect_right
+from collections import namedtuple
+from typing import Callable, List, Optional
+
+# 扫描得到的JSON值及其在文本中的位置[start, end)
+JsonValue = namedtuple("JsonValue", ["start", "end", "value"])
+
+# 扫描时只需要关心的字符：括号、引号、反斜杠和换行
+_SPECIAL_CHARS = re.compile(r'[\[\]{}"\\\n]')
+_CLOSERS = {"}": "{", "]": "["}
+_DECODER = json.JSONDecoder()
+
+
+class _Frame:
+    """一个尚未闭合的括号，children保存直接嵌套在其中、已经闭合的括号(用于外层解析失败时回退)"""
+
+    __slots__ = ("opener", "start", "children")
+
+    def __init__(self, opener, start):
+        self.opener = opener
+        self.start = start
+        self.children = []
+
+
+class JsonScanner:
+    """单遍、可增量的JSON值扫描器
+
+    在任意文本(如带说明文字、代码块的大模型输出)中按括号匹配找出所有顶层JSON值及其偏移。
+    只在括号内部跟踪字符串和转义，括号、引号之外的字符用正则整段跳过，整体为线性时间，
+    不存在正则回溯问题。顶层括号闭合后用json.loads解析；解析失败时(如外层是说明文字中的括号)
+    退而输出其中能解析的嵌套值。
+
+    可以分多次调用feed送入流式输出的片段，每次返回新完成的顶层值，结束时调用finish处理未闭合的括号。
+    送入的片段分段保存，不会每次拼接全部文本；用slice(start, end)取出其中一段。
+    on_close(start, end)会在任意深度的括号正确闭合时被调用，可用于在外层闭合之前提取内层对象。
+    """
+
+    def __init__(self, on_close: Optional[Callable[[int, int], None]] = None):
+        self.pos = 0
+        self.on_close = on_close
+        self.values: List[JsonValue] = []
+        self._pieces: List[str] = []
+        self._offsets: List[int] = []
+        self._stack: List[_Frame] = []
+        # 栈中各种左括号的数量，判断不匹配的右括号能否找到对应的左括号
+        self._open_counts = {"{": 0, "[": 0}
+        self._in_string = False
+        # 反斜杠转义的字符位于该位置之前，扫描到的特殊字符需跳过
+        self._skip_until = 0
+
+    @property
+    def text(self) -> str:
+        """已送入的全部文本(每次访问都会拼接，只需要一段时用slice)"""
+        if len(self._pieces) > 1:
+            self._pieces = ["".join(self._pieces)]
+            self._offsets = [0]
+        return self._pieces[0] if self._pieces else ""
+
+    def slice(self, start: int, end: int) -> str:
+        """已送入文本中[start, end)的部分，只拼接覆盖该范围的片段"""
+        first = bisect_right(self._offsets, start) - 1
+        parts = []
+        for k in range(max(first, 0), len(self._pieces)):
+            offset = self._offsets[k]
+            if offset >= end:
+                break
+            parts.append(self._pieces[k][max(start - offset, 0):end - offset])
+        return "".join(parts)
+
+    def _push(self, ch, i):
+        self._stack.append(_Frame(ch, i))
+        self._open_counts[ch] += 1
+
+    def _pop(self) -> _Frame:
+        frame = self._stack.pop()
+        self._open_counts[frame.opener] -= 1
+        return frame
+
+    def feed(self, chunk: str) -> List[JsonValue]:
+        """送入一段文本，返回新完成的顶层JSON值"""
+        if not chunk:
+            return []
+        base = self.pos
+        self._pieces.append(chunk)
+        self._offsets.append(base)
+        found = []
+        stack = self._stack
+        for match in _SPECIAL_CHARS.finditer(chunk):
+            i = base + match.start()
+            if i < self._skip_until:
+                continue
+            ch = match.group()
+            if self._in_string:
+                if ch == "\\":
+                    self._skip_until = i + 2
+                elif ch == '"' or ch == "\n":
+                    # 合法的JSON字符串中不会出现换行，遇到换行说明引号来自说明文字，恢复括号跟踪
+                    self._in_string = False
+                continue
+            if ch == "\n":
+                continue
+            if not stack:
+                # 括号外的引号和反斜杠属于说明文字
+                if ch in "{[":
+                    self._push(ch, i)
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._push(ch, i)
+            elif ch in "}]":
+                self._close(ch, i + 1, found)
+        self.pos = base + len(chunk)
+        return found
+
+    def _close(self, ch, end, found):
+        stack = self._stack
+        opener = _CLOSERS[ch]
+        if stack[-1].opener != opener:
+            # 括号不匹配：找不到对应的左括号时忽略该右括号，否则丢弃中间未闭合的括号(保留其已闭合的子节点)
+            if not self._open_counts[opener]:
+                return
+            while stack[-1].opener != opener:
+                broken = self._pop()
+                stack[-1].children.extend(broken.children)
+        frame = self._pop()
+        if self.on_close is not None:
+            self.on_close(frame.start, end)
+        if stack:
+            stack[-1].children.append((frame.start, end, frame.children))
+        else:
+            self._emit(frame.start, end, frame.children, found)
+
+    def _emit(self, start, end, children, found):
+        """解析顶层片段，失败时依次解析其中嵌套的片段
+
+        用显式栈代替递归，嵌套很深的说明文字不会超出递归深度；整段只拼接一次，嵌套片段在其上按偏移解析。
+        """
+        region = self.slice(start, end)
+        pending = [(start, end, children)]
+        while pending:
+            span_start, span_end, span_children = pending.pop()
+            try:
+                value, value_end = _DECODER.raw_decode(region, span_start - start)
+            except (ValueError, RecursionError):
+                value_end = None
+            if value_end != span_end - start:
+                pending.extend(reversed(span_children))
+                continue
+            item = JsonValue(span_start, span_end, value)
+            found.append(item)
+            self.values.append(item)
+
+    def finish(self) -> List[JsonValue]:
+        """输入结束：未闭合的括号中已闭合的嵌套片段按顶层值处理"""
+        found = []
+        orphans = []
+        for frame in self._stack:
+            orphans.extend(frame.children)
+        self._stack = []
+        for start, end, children in sorted(orphans):
+            self._emit(start, end, children, found)
+        return found
+
+
+def scan_json(text: str) -> List[JsonValue]:
+    """扫描完整文本，按出现顺序返回其中所有顶层JSON值"""
+    scanner = JsonScanner()
+    values = scanner.feed(text)
+    values.extend(scanner.finish())
+    return values
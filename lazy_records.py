@@ -0,0 +1,174 @@
+import json
+import mmap
+from array import array
+from collections.abc import MutableSequence
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from storage import NO_KEY, OP_KEY, JsonlSplitStore, RecordIndex, record_key
+
+
+class LazyRecordList(MutableSequence):
+    """按需解析的数据列表，用于大数据文件(见storage.LAZY_LOAD_MIN_BYTES)
+
+    数据文件通过mmap映射到内存，只保存偏移索引(每条16字节)，访问某一条时才解析对应的行，
+    每次访问文件中的条目都会得到一个新解析的字典。新增或替换的条目保存在内存中(_objects)，
+    在_refs中以负数 -(槽位+1) 表示。copy()得到的列表共享映射和已有槽位，增删互不影响。
+    数据文件被原子重写(rename)后，已有的映射仍指向旧文件，内容保持不变。
+    """
+
+    def __init__(self, path: Optional[str] = None, index: Optional[RecordIndex] = None):
+        self._mm = b""
+        self._refs = array('q')
+        self._keys = array('q')
+        self._other_keys = {}
+        self._objects = []
+        # 整数id到第一个位置的映射，查找时按需构建；删除或在中间插入后失效
+        self._key_positions = None
+        if index is None:
+            return
+        if index.covered:
+            with open(path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), index.covered, access=mmap.ACCESS_READ)
+        self._refs = index.refs
+        self._keys = index.keys
+        self._other_keys = index.other_keys
+
+    def copy(self) -> "LazyRecordList":
+        """浅拷贝：共享映射、id表和内存中的条目，偏移数组各自独立"""
+        other = self.__class__.__new__(self.__class__)
+        other.__dict__.update(self.__dict__)
+        other._refs = array('q', self._refs)
+        other._keys = array('q', self._keys)
+        other._objects = list(self._objects)
+        other._key_positions = None
+        return other
+
+    def __len__(self):
+        return len(self._refs)
+
+    def _line(self, ref) -> bytes:
+        start = ref >> 1
+        end = self._mm.find(b"\n", start)
+        return self._mm[start:end if end >= 0 else len(self._mm)]
+
+    def _get(self, pos):
+        ref = self._refs[pos]
+        if ref < 0:
+            return self._objects[-ref - 1]
+        obj = json.loads(self._line(ref))
+        if ref & 1 and OP_KEY in obj:
+            return obj["record"]
+        return obj
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [self._get(i) for i in range(*pos.indices(len(self)))]
+        return self._get(pos)
+
+    def __setitem__(self, pos, item):
+        if isinstance(pos, slice):
+            raise TypeError("LazyRecordList不支持切片赋值")
+        self._objects.append(item)
+        self._refs[pos] = -len(self._objects)
+        self._keys[pos] = NO_KEY
+
+    def __delitem__(self, pos):
+        if isinstance(pos, slice):
+            for i in sorted(range(*pos.indices(len(self))), reverse=True):
+                del self[i]
+            return
+        del self._refs[pos]
+        del self._keys[pos]
+        self._key_positions = None
+
+    def insert(self, pos, item):
+        if pos < len(self._refs):
+            self._key_positions = None
+        self._objects.append(item)
+        self._refs.insert(pos, -len(self._objects))
+        self._keys.insert(pos, NO_KEY)
+
+    def __iter__(self):
+        for pos in range(len(self)):
+            yield self._get(pos)
+
+    def is_loaded(self, pos) -> bool:
+        """位置pos处的条目是否已在内存中(之后访问返回同一个对象)"""
+        return self._refs[pos] < 0
+
+    def materialize(self, pos) -> Dict[str, Any]:
+        """解析位置pos处的条目并保存在内存中，之后访问返回同一个对象"""
+        item = self._get(pos)
+        if self._refs[pos] >= 0:
+            self[pos] = item
+        return item
+
+    def find(self, key) -> Optional[int]:
+        """id对应的第一个位置，找不到时返回None；只有内存中的条目需要查看数据本身"""
+        if key is None:
+            return None
+        found = None
+        if type(key) is int and NO_KEY < key < 2 ** 63:
+            found = self._find_int_key(key)
+        for ref, other in self._other_keys.items():
+            if other == key:
+                try:
+                    pos = self._refs.index(ref)
+                except ValueError:
+                    continue
+                if found is None or pos < found:
+                    found = pos
+        for slot, item in enumerate(self._objects):
+            if record_key(item) == key:
+                try:
+                    pos = self._refs.index(-slot - 1)
+                except ValueError:
+                    continue
+                if found is None or pos < found:
+                    found = pos
+        return found
+
+    def _find_int_key(self, key) -> Optional[int]:
+        """在id数组中查找整数id的第一个位置；映射中的位置已被替换(见__setitem__)时重新构建"""
+        for _ in range(2):
+            if self._key_positions is None:
+                positions = {}
+                for pos, value in enumerate(self._keys):
+                    if value != NO_KEY and value not in positions:
+                        positions[value] = pos
+                self._key_positions = positions
+            pos = self._key_positions.get(key)
+            if pos is None or self._keys[pos] == key:
+                return pos
+            self._key_positions = None
+        return None
+
+    def max_int_key(self) -> Optional[int]:
+        """最大的整数id，没有整数id时返回None"""
+        ids = [key for key in self._other_keys.values() if type(key) is int]
+        ids.extend(item["Result"].get("id") for item in self._objects
+                   if isinstance(item, dict) and isinstance(item.get("Result"), dict))
+        ids = [key for key in ids if isinstance(key, int) and not isinstance(key, bool)]
+        if self._keys:
+            largest = max(self._keys)
+            if largest != NO_KEY:
+                ids.append(largest)
+        return max(ids) if ids else None
+
+    def iter_texts(self) -> Iterator[Tuple[int, str]]:
+        """逐条产出(位置, json.dumps(条目, ensure_ascii=False))
+
+        文件中的规范数据行直接使用行文本，不需要解析；其余条目解析或序列化后产出。
+        """
+        for pos in range(len(self)):
+            ref = self._refs[pos]
+            if ref >= 0 and not ref & 1:
+                yield pos, self._line(ref).decode("utf-8")
+            else:
+                yield pos, json.dumps(self._get(pos), ensure_ascii=False)
+
+
+def open_lazy_records(store: JsonlSplitStore) -> LazyRecordList:
+    """通过偏移索引打开数据集(首次打开或文件有新增内容时扫描并保存索引)，同步store的行数统计"""
+    index = store.load_index()
+    return LazyRecordList(store.path, index)
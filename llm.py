@@ -1,33 +1,280 @@
-from dashscope import Generation
-import time 
-
-def call_llm(prompt, api_key, model="qwen-max"):
-    """调用LLM"""
-    try:
-        # 记录耗时
-        print(f"api key: {api_key}")
-        print(prompt)
-        print(model)
-        start_time = time.time()    
-        response = Generation.call(
-            api_key=api_key,  # 显式传入API Key
-            model=model,
-            prompt=prompt,
-            max_tokens=2048,
-            temperature=0.1,
-            timeout=20,
-        )
-        if response is None:
-            raise Exception("API调用返回为空")
-        if not hasattr(response, 'output') or not hasattr(response.output, 'text'):
-            raise Exception(f"API返回格式异常: {response}")
-        end_time = time.time()
-        print(f"LLM调用耗时: {end_time - start_time} 秒")
-        return response.output.text
-    except Exception as e:
-        print(f"调用LLM时发生错误: {str(e)}")
-        raise
+import os
+import json
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from llm_cache import make_cache_key
 
+# 采样参数，同时参与响应缓存的键计算
+GENERATION_PARAMS = {"max_tokens": 2048, "temperature": 0.1}
+# DashScope原生HTTP接口地址，可通过环境变量指向代理或本地模拟服务
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com"
+GENERATION_PATH = "/api/v1/services/aigc/text-generation/generation"
+# 默认限流：每分钟请求数和token数
+DEFAULT_RPM = 600
+DEFAULT_TPM = 1000000
+# 可重试的HTTP状态码：限流和服务端错误
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# 连接或读取响应体时的网络错误：连接失败/超时，以及响应体中途断开(分块编码不完整、压缩数据截断)
+NETWORK_ERRORS = (requests.ConnectionError, requests.Timeout,
+                  requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError)
+
+
+class LLMError(Exception):
+    """大模型接口调用失败"""
+
+    def __init__(self, message, status=None, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        # 服务端通过Retry-After要求的等待秒数
+        self.retry_after = retry_after
+
+
+def estimate_tokens(text):
+    """粗略估算文本的token数：中文等非ASCII字符约1个token，ASCII字符约4个一个token"""
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return len(text) - ascii_chars + ascii_chars // 4 + 1
+
+
+def iter_sse_events(response):
+    """解析SSE(text/event-stream)响应，逐个产出(事件名, data内容)"""
+    response.encoding = "utf-8"
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+            continue
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+    if data:
+        yield event, "\n".join(data)
+
+
+class TokenBucket:
+    """令牌桶限流器，capacity为每分钟配额，令牌按速率连续补充；线程安全"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """取出amount个令牌，不足时阻塞等待；超过桶容量的请求按容量计算，避免永远等待"""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def consume(self, amount):
+        """事后扣除令牌(如按实际用量修正预估)，允许透支，透支部分由后续请求等待偿还"""
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+
+
+class LLMClient:
+    """可复用的大模型客户端
+
+    通过带连接池的 requests.Session 调用DashScope原生HTTP接口，保持长连接；
+    用令牌桶同时限制每分钟请求数(rpm)和token数(tpm)；限流(429)、服务端错误和网络错误时
+    按带随机抖动的指数退避重试。一个进程内的所有调用共享同一个客户端(见 get_default_client)，
+    限流在所有线程间生效。base_url默认读取环境变量DASHSCOPE_BASE_URL，可指向本地模拟服务测试。
+    """
+
+    def __init__(self, base_url=None, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, max_retries=4,
+                 backoff_base=1.0, backoff_max=30.0, timeout=20, pool_size=32):
+        self.base_url = (base_url or os.getenv("DASHSCOPE_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.request_limiter = TokenBucket(rpm)
+        self.token_limiter = TokenBucket(tpm)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _backoff(self, attempt, retry_after=None):
+        """第attempt次重试前的等待时间：服务端给出Retry-After时优先使用，否则为全抖动指数退避"""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _request(self, api_key, payload, stream=False):
+        """发送一次请求，非200响应转换为LLMError；stream=True时返回未读取的SSE响应"""
+        headers = {"Authorization": f"Bearer {api_key}"}
+        if stream:
+            headers["Accept"] = "text/event-stream"
+            headers["X-DashScope-SSE"] = "enable"
+        try:
+            response = self.session.post(
+                self.base_url + GENERATION_PATH,
+                json=payload,
+                headers=headers,
+                timeout=self.timeout,
+                stream=stream,
+            )
+        except NETWORK_ERRORS as e:
+            raise LLMError(f"网络错误: {str(e)}", retryable=True)
+        if response.status_code != 200:
+            try:
+                body = response.json()
+                detail = f"{body.get('code')}: {body.get('message')}"
+            except ValueError:
+                detail = response.text[:200]
+            retry_after = response.headers.get("Retry-After")
+            raise LLMError(f"HTTP {response.status_code} {detail}", status=response.status_code,
+                           retryable=response.status_code in RETRYABLE_STATUS,
+                           retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+        return response
+
+    def _request_with_retries(self, api_key, payload, estimated, stream=False):
+        """限流后发送请求，可重试的错误按退避策略重试"""
+        attempt = 0
+        while True:
+            self.request_limiter.acquire()
+            self.token_limiter.acquire(estimated)
+            try:
+                return self._request(api_key, payload, stream=stream)
+            except LLMError as e:
+                if not e.retryable or attempt >= self.max_retries:
+                    print(f"调用LLM时发生错误: {str(e)}")
+                    raise
+                wait = self._backoff(attempt, e.retry_after)
+                attempt += 1
+                print(f"调用LLM出错({str(e)})，{wait:.1f}秒后进行第{attempt}次重试")
+                time.sleep(wait)
+
+    def _correct_usage(self, usage, estimated):
+        """按接口返回的实际token用量修正预估值"""
+        usage = usage or {}
+        used = usage.get("total_tokens") or (usage.get("input_tokens", 0) + usage.get("output_tokens", 0))
+        if used:
+            self.token_limiter.consume(used - estimated)
+
+    def generate(self, prompt, api_key, model="qwen-max", **params):
+        """生成文本，params覆盖默认采样参数"""
+        parameters = dict(GENERATION_PARAMS, **params)
+        payload = {"model": model, "input": {"prompt": prompt}, "parameters": parameters}
+        # 预估输入token数先占用配额，拿到实际用量后再修正
+        estimated = estimate_tokens(prompt)
+        start_time = time.time()
+        response = self._request_with_retries(api_key, payload, estimated)
+        try:
+            body = response.json()
+            text = body["output"]["text"]
+        except (ValueError, KeyError, TypeError):
+            raise LLMError(f"API返回格式异常: {response.text[:200]}")
+        self._correct_usage(body.get("usage"), estimated)
+        print(f"LLM调用耗时: {time.time() - start_time:.2f} 秒, 模型: {model}")
+        return text
+
+    def stream(self, prompt, api_key, model="qwen-max", **params):
+        """流式生成文本，逐段产出新增的文本片段
+
+        使用DashScope的SSE增量输出(incremental_output)。只有在收到第一个片段之前的错误会重试，
+        之后的错误直接抛出LLMError，调用方已收到的片段不会重复。
+        """
+        parameters = dict(GENERATION_PARAMS, incremental_output=True, **params)
+        payload = {"model": model, "input": {"prompt": prompt}, "parameters": parameters}
+        estimated = estimate_tokens(prompt)
+        start_time = time.time()
+        first_token_time = None
+        usage = None
+        response = self._request_with_retries(api_key, payload, estimated, stream=True)
+        try:
+            for event, data in iter_sse_events(response):
+                try:
+                    body = json.loads(data)
+                except ValueError:
+                    raise LLMError(f"流式响应格式异常: {data[:200]}")
+                if event == "error" or body.get("code"):
+                    raise LLMError(f"流式输出出错 {body.get('code')}: {body.get('message')}")
+                usage = body.get("usage") or usage
+                text = (body.get("output") or {}).get("text")
+                if text:
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                    yield text
+        except NETWORK_ERRORS as e:
+            raise LLMError(f"流式输出中断: {str(e)}")
+        finally:
+            response.close()
+        self._correct_usage(usage, estimated)
+        if first_token_time is not None:
+            print(f"LLM流式调用首字耗时: {first_token_time - start_time:.2f} 秒, "
+                  f"总耗时: {time.time() - start_time:.2f} 秒, 模型: {model}")
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """获取进程内共享的默认客户端"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = LLMClient()
+        return _default_client
+
+
+def set_default_client(client):
+    """替换共享的默认客户端(如指向本地模拟服务或调整限流参数)，返回原客户端"""
+    global _default_client
+    with _default_client_lock:
+        previous = _default_client
+        _default_client = client
+        return previous
+
+
+def stream_llm(prompt, api_key, model="qwen-max"):
+    """流式调用LLM(使用共享的默认客户端)，逐段产出新增的文本片段"""
+    yield from get_default_client().stream(prompt, api_key, model=model)
+
+
+def call_llm(prompt, api_key, model="qwen-max", cache=None, namespace="default"):
+    """调用LLM(使用共享的默认客户端)
+
+    传入cache(LLMCache)时先按模型、提示词和采样参数查询缓存，命中则直接返回，
+    未命中时调用接口并写入缓存。只有输出确定、可复用的调用(如过滤判断)才应使用缓存。
+    """
+    client = get_default_client()
+    if cache is None:
+        return client.generate(prompt, api_key, model=model)
+    key = make_cache_key(model, prompt, GENERATION_PARAMS)
+    cached = cache.get(namespace, key)
+    if cached is not None:
+        return cached
+    response = client.generate(prompt, api_key, model=model)
+    cache.put(namespace, key, response)
+    return response
 
 
 if __name__ == "__main__":
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+# 默认缓存文件位于项目根目录下，所有项目共用一个文件，按命名空间区分
+DEFAULT_CACHE_PATH = os.path.join("data", "llm_cache.sqlite")
+# 缓存响应总大小上限(字节)，超出后按最近使用时间淘汰
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# 淘汰时清理到上限的该比例，避免每次写入都触发淘汰
+EVICT_TARGET_RATIO = 0.9
+
+
+def make_cache_key(model: str, prompt: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """根据模型、提示词和采样参数计算内容寻址的缓存键"""
+    payload = json.dumps({"model": model, "prompt": prompt, "params": params or {}},
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """基于SQLite的大模型响应缓存
+
+    以 (命名空间, 缓存键) 为主键保存响应文本，命名空间一般为项目名；
+    读取命中时刷新最近使用时间，总大小超过max_bytes时按LRU淘汰。
+    可在多个线程中共享(并发过滤时使用)，命中/未命中次数按命名空间统计，只保存在内存中。
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        dir_path = os.path.dirname(path)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, response TEXT NOT NULL, "
+            "size INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _count(self, namespace: str, field: str):
+        stats = self._stats.setdefault(namespace, {"hits": 0, "misses": 0})
+        stats[field] += 1
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        """读取缓存的响应，未命中时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None:
+                self._count(namespace, "misses")
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_used = ? WHERE namespace = ? AND key = ?", (time.time(), namespace, key)
+            )
+            self._conn.commit()
+            self._count(namespace, "hits")
+            return row[0]
+
+    def put(self, namespace: str, key: str, response: str):
+        """写入响应，必要时淘汰最久未使用的条目"""
+        size = len(response.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM responses WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (namespace, key, response, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (namespace, key, response, size, now, now)
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def delete(self, namespace: str, key: str):
+        """删除一条缓存(如响应内容不可用时)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size FROM responses WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None:
+                return
+            self._conn.execute("DELETE FROM responses WHERE namespace = ? AND key = ?", (namespace, key))
+            self._conn.commit()
+            self._total_bytes -= row[0]
+
+    def _evict(self):
+        """按最近使用时间从旧到新删除，直到总大小降到上限的EVICT_TARGET_RATIO以下"""
+        target = self.max_bytes * EVICT_TARGET_RATIO
+        rows = self._conn.execute("SELECT rowid, size FROM responses ORDER BY last_used")
+        evicted = []
+        for rowid, size in rows:
+            if self._total_bytes <= target:
+                break
+            evicted.append((rowid,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE rowid = ?", evicted)
+        print(f"大模型响应缓存超过大小上限，已淘汰{len(evicted)}条")
+
+    def stats(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """返回命中/未命中次数、命中率以及缓存条数和大小；不指定命名空间时统计全部"""
+        with self._lock:
+            if namespace is None:
+                hits = sum(s["hits"] for s in self._stats.values())
+                misses = sum(s["misses"] for s in self._stats.values())
+                entries, size = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+            else:
+                stats = self._stats.get(namespace, {"hits": 0, "misses": 0})
+                hits, misses = stats["hits"], stats["misses"]
+                entries, size = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses WHERE namespace = ?", (namespace,)
+                ).fetchone()
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def clear(self, namespace: Optional[str] = None):
+        """清空缓存；指定命名空间时只清空该命名空间"""
+        with self._lock:
+            if namespace is None:
+                self._conn.execute("DELETE FROM responses")
+                self._stats.clear()
+            else:
+                self._conn.execute("DELETE FROM responses WHERE namespace = ?", (namespace,))
+                self._stats.pop(namespace, None)
+            self._conn.commit()
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> LLMCache:
+    """获取进程内共享的默认缓存实例"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
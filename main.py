@@ -67,8 +67,8 @@ ul[data-testid="stSidebarNavItems"] {
 """
 st.markdown(hide_streamlit_style, unsafe_allow_html=True)
 
-# 初始化数据管理器
-@st.cache_resource
+# 初始化数据管理器：每个会话一个实例，避免会话之间互相覆盖未保存的修改；
+# 解析后的数据由进程内的数据集注册表(dataset_registry)共享，不会为每个会话重复解析
 def init_manager(project_name=None):
     try:
         # 从环境变量获取API密钥，不再允许用户输入
@@ -89,6 +89,8 @@ def get_manager():
     if "manager" in st.session_state:
         manager = st.session_state["manager"]
         if manager.current_project == current_project:
+            # 其他会话保存了修改时刷新到最新数据(本会话有未保存的修改时不刷新)
+            manager.refresh_if_stale()
             return manager
     
     # 创建新的manager实例
@@ -360,13 +362,13 @@ def about_page():
     st.code("""
 data/
 ├── project_name/
-│   ├── train_data.json      # 训练数据
-│   ├── val_data.json        # 验证数据
+│   ├── train_data.jsonl     # 训练数据
+│   ├── val_data.jsonl       # 验证数据
 │   ├── config.json          # 项目配置(Schema等)
 │   └── system_prompts/      # 系统提示词目录
 └── video_agent/             # 示例项目
-    ├── train_data.json
-    ├── val_data.json
+    ├── train_data.jsonl
+    ├── val_data.jsonl
     ├── config.json
     └── system_prompts/
     """, language="text")
@@ -0,0 +1,264 @@
+"""本地模拟大模型服务
+
+实现DashScope原生HTTP生成接口(POST /api/v1/services/aigc/text-generation/generation)，
+可配置延迟分布、错误率和固定响应，用于在没有API密钥的情况下离线测试和压测过滤、生成流程。
+
+用法:
+    python mock_llm_server.py --port 8000 --latency lognormal:0.5,0.4 --error-rate 0.02 --throttle-rate 0.05
+    export DASHSCOPE_BASE_URL=http://127.0.0.1:8000
+"""
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+GENERATION_PATH = "/api/v1/services/aigc/text-generation/generation"
+
+
+def parse_latency(spec):
+    """解析延迟分布描述，返回采样函数(秒)
+
+    支持: fixed:秒, uniform:最小,最大, normal:均值,标准差, lognormal:中位数,sigma, exp:均值
+    """
+    name, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()] if args else []
+    if name == "fixed":
+        return lambda: values[0] if values else 0.0
+    if name == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if name == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if name == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    if name == "exp":
+        return lambda: random.expovariate(1.0 / values[0])
+    raise ValueError(f"不支持的延迟分布: {spec}")
+
+
+def _stable_ratio(text):
+    """把文本稳定地映射到[0, 1)，保证同一条数据每次得到相同的判断"""
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16) / 0x100000000
+
+
+def _fake_result(seed):
+    rng = random.Random(seed)
+    return {
+        "id": rng.randint(1, 100000),
+        "turn": rng.randint(1, 3),
+        "query_independent": rng.random() < 0.5,
+        "target": rng.choice(["search", "chat", "order"]),
+        "processed_query": f"MUST: video_type: 模拟_{rng.randint(1, 9)}",
+        "search": rng.random() < 0.5,
+    }
+
+
+class MockResponder:
+    """根据提示词生成模拟响应
+
+    优先使用固定响应规则(正则匹配提示词)；否则识别过滤和生成流程的提示词格式：
+    批量相关性判断返回编号到true/false的JSON对象，单条判断返回true/false，
+    生成Result返回JSON，Self-instruct返回包含多个Input/Result数据对的JSON代码块，其余返回一段文本。
+    """
+
+    def __init__(self, canned=None, relevance_rate=0.3, pairs=3):
+        self.canned = [(re.compile(rule["match"]), rule["response"]) for rule in (canned or [])]
+        self.relevance_rate = relevance_rate
+        self.pairs = pairs
+
+    def respond(self, prompt):
+        for pattern, response in self.canned:
+            if pattern.search(prompt):
+                return response
+        entries = re.findall(r"^\[(\d+)\] (.*)$", prompt, re.MULTILINE)
+        if entries:
+            return json.dumps({key: _stable_ratio(text) < self.relevance_rate for key, text in entries})
+        if "仅返回'true'或'false'" in prompt:
+            return "true" if _stable_ratio(prompt) < self.relevance_rate else "false"
+        if "自主生成" in prompt:
+            pairs = [
+                {"Input": {"history": [], "query": f"模拟查询{random.randint(1, 10 ** 9)}", "env": "", "search_results": ""},
+                 "Result": _fake_result(prompt + str(i))}
+                for i in range(self.pairs)
+            ]
+            return "以下是生成的数据：\n```json\n" + json.dumps(pairs, ensure_ascii=False, indent=2) + "\n```"
+        if "Result" in prompt or "数据格式" in prompt:
+            return json.dumps(_fake_result(prompt), ensure_ascii=False)
+        return f"模拟查询{random.randint(1, 10 ** 9)}：帮我找一些关于{random.choice(['综艺', '健身', '音乐'])}的视频"
+
+
+class MockLLMServer:
+    """可在后台线程中启动的模拟服务，统计请求数和注入的错误数
+
+    请求头带 X-DashScope-SSE: enable 时按SSE增量输出逐段返回，首段前等待采样的延迟。
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency="fixed:0", error_rate=0.0, throttle_rate=0.0,
+                 hang_rate=0.0, hang_seconds=30.0, responder=None, token_latency=0.02, chunk_chars=4):
+        self.sample_latency = parse_latency(latency)
+        # 流式输出时每段的字符数和段间间隔
+        self.token_latency = token_latency
+        self.chunk_chars = chunk_chars
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.responder = responder or MockResponder()
+        self.stats = {"requests": 0, "ok": 0, "errors": 0, "throttled": 0, "hung": 0}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, field):
+        with self._lock:
+            self.stats[field] += 1
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body, headers=None):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    with server._lock:
+                        self._send_json(200, dict(server.stats))
+                else:
+                    self._send_json(404, {"code": "NotFound", "message": self.path})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if self.path != GENERATION_PATH:
+                    self._send_json(404, {"code": "NotFound", "message": self.path})
+                    return
+                try:
+                    prompt = json.loads(body)["input"]["prompt"]
+                except (ValueError, KeyError, TypeError):
+                    self._send_json(400, {"code": "InvalidParameter", "message": "请求格式错误"})
+                    return
+                server._count("requests")
+                roll = random.random()
+                if roll < server.throttle_rate:
+                    server._count("throttled")
+                    self._send_json(429, {"code": "Throttling", "message": "Requests rate limit exceeded"},
+                                    headers={"Retry-After": "1"})
+                    return
+                if roll < server.throttle_rate + server.error_rate:
+                    server._count("errors")
+                    self._send_json(500, {"code": "InternalError", "message": "模拟服务端错误"})
+                    return
+                if roll < server.throttle_rate + server.error_rate + server.hang_rate:
+                    # 模拟请求卡住，客户端应当超时
+                    server._count("hung")
+                    time.sleep(server.hang_seconds)
+                    self.close_connection = True
+                    return
+                time.sleep(server.sample_latency())
+                text = server.responder.respond(prompt)
+                server._count("ok")
+                input_tokens = len(prompt) // 2 + 1
+                output_tokens = len(text) // 2 + 1
+                usage = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                         "total_tokens": input_tokens + output_tokens}
+                request_id = hashlib.md5(f"{time.time()}{random.random()}".encode()).hexdigest()
+                if self.headers.get("X-DashScope-SSE") == "enable":
+                    self._send_stream(text, usage, request_id)
+                    return
+                self._send_json(200, {
+                    "output": {"text": text, "finish_reason": "stop"},
+                    "usage": usage,
+                    "request_id": request_id,
+                })
+
+            def _send_stream(self, text, usage, request_id):
+                """以SSE增量输出的形式逐段发送响应，每段之间间隔token_latency秒"""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                size = server.chunk_chars
+                pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+                for index, piece in enumerate(pieces, 1):
+                    last = index == len(pieces)
+                    body = {"output": {"text": piece, "finish_reason": "stop" if last else "null"},
+                            "usage": usage, "request_id": request_id}
+                    event = f"id:{index}\nevent:result\n:HTTP_STATUS/200\ndata:{json.dumps(body, ensure_ascii=False)}\n\n"
+                    self.wfile.write(event.encode("utf-8"))
+                    self.wfile.flush()
+                    if not last:
+                        time.sleep(server.token_latency)
+
+        return Handler
+
+    def start(self):
+        """在后台线程中启动服务，返回服务地址"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        """停止服务"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟大模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="lognormal:0.5,0.4", help="延迟分布，如 fixed:0.2、uniform:0.1,0.5、lognormal:0.5,0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500错误的比例")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回429限流的比例")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="请求卡住不返回的比例")
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--token-latency", type=float, default=0.02, help="流式输出时每段之间的间隔(秒)")
+    parser.add_argument("--relevance-rate", type=float, default=0.3, help="相关性判断返回true的比例")
+    parser.add_argument("--pairs", type=int, default=3, help="Self-instruct每次返回的数据对数量")
+    parser.add_argument("--responses", help="固定响应规则文件: [{\"match\": 正则, \"response\": 文本}, ...]")
+    args = parser.parse_args()
+
+    canned = None
+    if args.responses:
+        with open(args.responses, "r", encoding="utf-8") as f:
+            canned = json.load(f)
+    server = MockLLMServer(
+        host=args.host, port=args.port, latency=args.latency, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, hang_rate=args.hang_rate, hang_seconds=args.hang_seconds,
+        token_latency=args.token_latency,
+        responder=MockResponder(canned=canned, relevance_rate=args.relevance_rate, pairs=args.pairs),
+    )
+    print(f"模拟大模型服务已启动: {server.base_url}")
+    print(f"使用方法: export DASHSCOPE_BASE_URL={server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
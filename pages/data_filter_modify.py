@@ -1,5 +1,35 @@
 import streamlit as st
 import json
+import os
+import time
+from data_export import export_dataset, EXPORT_FORMATS, DEFAULT_EXPORT_WORKERS
+
+# 过滤结果表格和修改选择框每页显示的条数
+RESULT_PAGE_SIZE = 50
+
+
+def page_range(total, key):
+    """分页选择，返回当前页条目的位置范围；大数据集的条目只在显示时按页读取"""
+    pages = max(1, (total + RESULT_PAGE_SIZE - 1) // RESULT_PAGE_SIZE)
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"页码(共{pages}页)", min_value=1, max_value=pages, value=1, step=1, key=key)
+    start = (page - 1) * RESULT_PAGE_SIZE
+    return range(start, min(total, start + RESULT_PAGE_SIZE))
+
+
+def show_filtered_table(manager, filtered_data, positions):
+    """显示过滤结果中指定位置的条目"""
+    # 使用数据管理器的通用显示方法
+    display_data = []
+    for i in positions:
+        info = manager.get_item_display_info(filtered_data[i])
+        display_data.append({
+            "ID": info["id"],
+            "查询内容": info["query"],
+            "详细信息": info["main_text"][:100] + "..." if len(info["main_text"]) > 100 else info["main_text"]
+        })
+    st.dataframe(display_data)
 
 
 # 数据筛选与修改页面
@@ -31,17 +61,6 @@ def data_filter_modify_page(manager):
                 filtered_data = manager.filter_by_tags(data_type=data_type, tags=tags)
                 st.session_state["filtered_data"] = filtered_data
                 st.write(f"过滤结果: {len(filtered_data)} 条数据")
-                if filtered_data:
-                    # 使用数据管理器的通用显示方法
-                    display_data = []
-                    for item in filtered_data:
-                        info = manager.get_item_display_info(item)
-                        display_data.append({
-                            "ID": info["id"],
-                            "查询内容": info["query"],
-                            "详细信息": info["main_text"][:100] + "..." if len(info["main_text"]) > 100 else info["main_text"]
-                        })
-                    st.dataframe(display_data)
 
     elif filter_type == "正则表达式过滤":
         pattern = st.text_input("输入正则表达式", key="regex_filter_input")
@@ -50,17 +69,6 @@ def data_filter_modify_page(manager):
                 filtered_data = manager.filter_by_regex(data_type=data_type, pattern=pattern)
                 st.session_state["filtered_data"] = filtered_data
                 st.write(f"过滤结果: {len(filtered_data)} 条数据")
-                if filtered_data:
-                    # 使用数据管理器的通用显示方法
-                    display_data = []
-                    for item in filtered_data:
-                        info = manager.get_item_display_info(item)
-                        display_data.append({
-                            "ID": info["id"],
-                            "查询内容": info["query"],
-                            "详细信息": info["main_text"][:100] + "..." if len(info["main_text"]) > 100 else info["main_text"]
-                        })
-                    st.dataframe(display_data)
 
     elif filter_type == "大模型语义过滤":
         query = st.text_input("输入语义查询", key="semantic_filter_input")
@@ -70,6 +78,28 @@ def data_filter_modify_page(manager):
             index=0,
             key="semantic_filter_model"
         )
+        max_workers = st.number_input(
+            "最大并发请求数",
+            min_value=1,
+            max_value=32,
+            value=8,
+            key="semantic_filter_workers",
+            help="同时发出的大模型请求数量，过大可能触发接口限流"
+        )
+        batch_size = st.number_input(
+            "每个请求判断的数据条数",
+            min_value=1,
+            max_value=50,
+            value=20,
+            key="semantic_filter_batch_size",
+            help="大于1时把多条数据打包进一个请求判断，可大幅减少请求数量"
+        )
+        use_cache = st.checkbox(
+            "使用响应缓存",
+            value=True,
+            key="semantic_filter_use_cache",
+            help="相同的数据和查询直接复用之前的判断结果，不再重复调用大模型"
+        )
         if query:
             if st.button("应用过滤", key="apply_semantic_filter"):
                 # 创建进度条和状态文本
@@ -91,21 +121,17 @@ def data_filter_modify_page(manager):
                             data_type=data_type,
                             query=query,
                             callback=update_progress,
-                            model=model
+                            model=model,
+                            max_workers=int(max_workers),
+                            batch_size=int(batch_size),
+                            use_cache=use_cache
                         )
+                        if use_cache:
+                            cache_stats = manager.llm_cache_stats()
+                            st.caption(f"响应缓存: 命中{cache_stats['hits']}次, 未命中{cache_stats['misses']}次, "
+                                       f"命中率{cache_stats['hit_rate']:.0%}, 共缓存{cache_stats['entries']}条")
                         st.session_state["filtered_data"] = filtered_data
                         st.write(f"过滤结果: {len(filtered_data)} 条数据")
-                        if filtered_data:
-                            # 使用数据管理器的通用显示方法
-                            display_data = []
-                            for item in filtered_data:
-                                info = manager.get_item_display_info(item)
-                                display_data.append({
-                                    "ID": info["id"],
-                                    "查询内容": info["query"],
-                                    "详细信息": info["main_text"][:100] + "..." if len(info["main_text"]) > 100 else info["main_text"]
-                                })
-                            st.dataframe(display_data)
                         # 完成后清除状态
                         status_text.success("语义过滤完成")
                     except Exception as e:
@@ -125,7 +151,7 @@ def data_filter_modify_page(manager):
         with col1:
             new_filter_type = st.selectbox(
                 "添加过滤步骤",
-                ["标签过滤", "正则表达式过滤", "大模型语义过滤"],
+                ["标签过滤", "正则表达式过滤", "字段过滤", "大模型语义过滤"],
                 key="new_filter_type"
             )
         with col2:
@@ -159,6 +185,25 @@ def data_filter_modify_page(manager):
                         if pattern:
                             step['params']['pattern'] = pattern
 
+                    elif step['type'] == "字段过滤":
+                        field = st.text_input(
+                            "Result字段名",
+                            value="intent",
+                            key=f"field_name_{step['id']}"
+                        )
+                        value_text = st.text_input(
+                            "字段取值",
+                            key=f"field_value_{step['id']}",
+                            help="按JSON解析(如 1、true、\"文本\")，无法解析时作为字符串"
+                        )
+                        if field and value_text:
+                            try:
+                                value = json.loads(value_text)
+                            except json.JSONDecodeError:
+                                value = value_text
+                            step['params']['field'] = field
+                            step['params']['value'] = value
+
                     elif step['type'] == "大模型语义过滤":
                         query = st.text_input(
                             "输入语义查询",
@@ -170,9 +215,25 @@ def data_filter_modify_page(manager):
                             index=0,
                             key=f"llm_model_{step['id']}"
                         )
+                        max_workers = st.number_input(
+                            "最大并发请求数",
+                            min_value=1,
+                            max_value=32,
+                            value=8,
+                            key=f"llm_workers_{step['id']}"
+                        )
+                        batch_size = st.number_input(
+                            "每个请求判断的数据条数",
+                            min_value=1,
+                            max_value=50,
+                            value=20,
+                            key=f"llm_batch_size_{step['id']}"
+                        )
                         if query:
                             step['params']['query'] = query
                             step['params']['model'] = model
+                            step['params']['max_workers'] = int(max_workers)
+                            step['params']['batch_size'] = int(batch_size)
 
                     # 删除按钮
                     if st.button("删除此步骤", key=f"delete_{step['id']}"):
@@ -192,6 +253,10 @@ def data_filter_modify_page(manager):
                         st.warning("请设置所有正则表达式过滤步骤的模式")
                         valid = False
                         break
+                    elif step['type'] == "字段过滤" and not step['params'].get('field'):
+                        st.warning("请设置所有字段过滤步骤的字段名和取值")
+                        valid = False
+                        break
                     elif step['type'] == "大模型语义过滤" and ('query' not in step['params'] or not step['params']['query']):
                         st.warning("请设置所有大模型语义过滤步骤的查询")
                         valid = False
@@ -204,6 +269,7 @@ def data_filter_modify_page(manager):
                         filter_type_map = {
                             "标签过滤": "tags",
                             "正则表达式过滤": "regex",
+                            "字段过滤": "field",
                             "大模型语义过滤": "llm"
                         }
                         filters.append({
@@ -215,11 +281,15 @@ def data_filter_modify_page(manager):
                     progress_bar = st.progress(0)
                     status_text = st.empty()
                     status_text.text("准备开始组合过滤...")
+                    plan_text = st.empty()
 
-                    # 定义进度回调函数
+                    # 定义进度回调函数，执行计划单独显示(步骤会按代价重新排序)
                     def update_progress(message, progress):
                         progress_bar.progress(progress)
-                        status_text.text(message)
+                        if message.startswith("执行计划"):
+                            plan_text.info(message)
+                        else:
+                            status_text.text(message)
 
                     try:
                         filtered_data = manager.filter_combined(
@@ -230,17 +300,6 @@ def data_filter_modify_page(manager):
                         st.session_state["filtered_data"] = filtered_data
                         status_text.success(f"组合过滤完成，找到 {len(filtered_data)} 条数据")
                         st.write(f"组合过滤结果: {len(filtered_data)} 条数据")
-                        if filtered_data:
-                            # 使用数据管理器的通用显示方法
-                            display_data = []
-                            for item in filtered_data:
-                                info = manager.get_item_display_info(item)
-                                display_data.append({
-                                    "ID": info["id"],
-                                    "查询内容": info["query"],
-                                    "详细信息": info["main_text"][:100] + "..." if len(info["main_text"]) > 100 else info["main_text"]
-                                })
-                            st.dataframe(display_data)
                     except Exception as e:
                         status_text.error(f"组合过滤失败: {str(e)}")
                         st.error(f"组合过滤失败: {str(e)}")
@@ -249,6 +308,10 @@ def data_filter_modify_page(manager):
 
     # 数据修改部分
     if "filtered_data" in st.session_state and st.session_state["filtered_data"]:
+        st.subheader("过滤结果")
+        positions = page_range(len(st.session_state["filtered_data"]), "filtered_data_page")
+        show_filtered_table(manager, st.session_state["filtered_data"], positions)
+
         st.subheader("数据修改")
         if len(st.session_state["filtered_data"]) > 0:
             def format_item(i):
@@ -257,8 +320,8 @@ def data_filter_modify_page(manager):
                 return f"ID: {info['id']}, 查询: {info['query'][:30]}..."
             
             selected_index = st.selectbox(
-                "选择要修改的数据",
-                range(len(st.session_state["filtered_data"])),
+                "选择要修改的数据(当前页)",
+                positions,
                 format_func=format_item,
                 key="modify_data_selector"
             )
@@ -354,11 +417,10 @@ def data_filter_modify_page(manager):
                 if changes:
                     success = manager.modify_item(data_type=data_type, item_id=item_id, changes=changes)
                     if success:
-                            # 保存修改后的数据
+                            # 保存修改后的数据(只写入修改过的条目)
                             manager.save_data()
                             st.success("数据修改成功并已保存")
-                            # 刷新数据和过滤结果
-                            manager.load_data()
+                            # 内存中的数据已是最新，只需刷新过滤结果
                             # 重新应用过滤以更新filtered_data
                             if filter_type == "标签过滤" and tags_input:
                                 tags = [tag.strip() for tag in tags_input.split(",")]
@@ -375,5 +437,85 @@ def data_filter_modify_page(manager):
                         st.error("数据修改失败")
                 else:
                     st.warning("未做任何修改")
+
+            # 删除数据
+            if st.button("🗑️ 删除此条数据", key="delete_data_item"):
+                if manager.delete_item(item_id, data_type=data_type):
+                    manager.save_data()
+                    filtered_data = st.session_state["filtered_data"]
+                    # 过滤结果就是数据集本身(未过滤)时，删除已经反映在其中，不必逐条复制
+                    if filtered_data is not (manager.train_data if data_type == "train" else manager.val_data):
+                        st.session_state["filtered_data"] = [
+                            item for item in filtered_data if item is not selected_item
+                        ]
+                    st.success("数据已删除")
+                    st.rerun()
+                else:
+                    st.error("数据删除失败")
     else:
-        st.info("请先进行数据筛选")
\ No newline at end of file
+        st.info("请先进行数据筛选")
+
+    render_data_export(manager, data_type)
+
+
+def render_data_export(manager, data_type):
+    """渲染数据导出区域：按过滤条件把数据集流式导出为训练可用的文件"""
+    st.subheader("数据导出")
+    dataset_name = "训练数据集" if data_type == "train" else "验证数据集"
+    st.caption(f"把{dataset_name}中满足过滤条件的数据导出为JSONL、对话格式JSONL或Parquet文件，支持压缩和按条数分片")
+
+    # 默认使用组合过滤中配置好的步骤
+    filter_type_map = {"标签过滤": "tags", "正则表达式过滤": "regex", "字段过滤": "field", "大模型语义过滤": "llm"}
+    default_filters = [{"type": filter_type_map[step["type"]], "params": step["params"]}
+                       for step in st.session_state.get("filter_steps", []) if step["params"]]
+    filters_text = st.text_area(
+        "过滤条件(格式同组合过滤，空列表表示导出全部数据)",
+        value=json.dumps(default_filters, ensure_ascii=False, indent=2),
+        height=120, key="export_filters"
+    )
+
+    col_format, col_compress, col_shard, col_workers = st.columns(4)
+    with col_format:
+        fmt = st.selectbox("导出格式", options=list(EXPORT_FORMATS), key="export_format",
+                           format_func=lambda x: {"jsonl": "JSONL(原始数据)", "chat": "对话格式JSONL",
+                                                  "parquet": "Parquet"}[x])
+    with col_compress:
+        compress = st.checkbox("gzip压缩", value=False, key="export_compress", disabled=fmt == "parquet",
+                               help="Parquet文件使用内置的snappy列压缩")
+    with col_shard:
+        shard_size = st.number_input("每个文件条数(0为不分片)", min_value=0, value=0, step=10000, key="export_shard_size")
+    with col_workers:
+        workers = st.number_input("编码进程数", min_value=1, max_value=os.cpu_count() or 1,
+                                  value=DEFAULT_EXPORT_WORKERS, key="export_workers")
+    system_prompt = ""
+    if fmt == "chat":
+        system_prompt = st.text_area("System Prompt(可选，写入每条对话开头)", key="export_system_prompt", height=80)
+        st.caption("对话由Input.history、Input.current_query(或query)和Result.response构造，缺少查询或回复的数据会被跳过")
+    project_dir = os.path.join(manager.projects_root, manager.current_project or "")
+    output_dir = st.text_input("输出目录", value=os.path.join(project_dir, "exports"), key="export_output_dir")
+
+    if st.button("📤 开始导出", key="export_start", type="primary"):
+        try:
+            filters = json.loads(filters_text) if filters_text.strip() else []
+        except json.JSONDecodeError as e:
+            st.error(f"❌ 过滤条件格式错误：第 {e.lineno} 行，第 {e.colno} 列: {e.msg}")
+            return
+        progress_bar = st.progress(0.0)
+        status_text = st.empty()
+
+        def update_progress(message, progress):
+            progress_bar.progress(progress)
+            status_text.text(message)
+
+        try:
+            name = f"{manager.current_project or 'data'}_{data_type}_{time.strftime('%Y%m%d_%H%M%S')}"
+            report = export_dataset(manager, output_dir, data_type=data_type, filters=filters, name=name, fmt=fmt,
+                                    compress=compress, shard_size=int(shard_size), workers=int(workers),
+                                    system_prompt=system_prompt, callback=update_progress)
+        except Exception as e:
+            st.error(f"❌ 导出失败: {str(e)}")
+            return
+        st.success(f"✅ 导出 {report['records']} 条数据（跳过 {report['skipped']} 条），共 {len(report['files'])} 个文件，"
+                   f"{report['bytes'] / 1024 / 1024:.1f} MB，耗时 {report['elapsed']:.1f} 秒")
+        for file_info in report["files"]:
+            st.write(f"- `{file_info['path']}`（{file_info['records']} 条）")
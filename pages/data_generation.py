@@ -2,6 +2,18 @@ import streamlit as st
 import json
 import os
 import re
+import time
+from json_scanner import JsonScanner
+from data_manager import collect_data_pairs
+from generation_engine import GenerationJob, GENERATION_MODES, DEFAULT_GENERATION_WORKERS
+from data_import import import_dataset, preview_rows, suggest_columns, IMPORT_CHUNK_SIZE
+
+# 流式输出时页面的最短刷新间隔(秒)
+STREAM_RENDER_INTERVAL = 0.1
+# 批量生成任务运行时的进度刷新间隔(秒)
+BULK_PROGRESS_REFRESH_INTERVAL = 1.0
+# 对象块前紧邻的 "Input": / "Result": 键名
+BLOCK_LABEL_PATTERN = re.compile(r'"(Input|Result)"\s*:\s*$')
 
 def generate_self_instruct_prompt(input_schema, result_schema):
     """根据Input和Result Schema生成Self-instruct提示词"""
@@ -90,180 +102,225 @@ Result部分应包含以下字段：
 
     return prompt
 
-def extract_data_pairs_from_text(text):
-    """从生成的文本中提取Input和Result对"""
-    from data_manager import extract_json_from_llm_response
-    
+def extract_data_pairs_from_text(text, debug=False):
+    """从生成的文本中提取Input和Result对
+
+    用json_scanner单遍扫描出文本中所有JSON值(单个对象、数组、多个代码块均可)，收集其中的数据对；
+    没有完整的数据对时，把扫描中遇到的 "Input": {...} 和 "Result": {...} 块按出现顺序配对。
+    debug=True时打印解析过程(页面勾选"显示调试信息"时使用)。
+    """
     data_pairs = []
-    
-    # 添加调试信息
-    print(f"[DEBUG] 开始解析文本，长度: {len(text)}")
-    print(f"[DEBUG] 文本前200字符: {text[:200]}")
-    
-    try:
-        # 使用通用JSON提取函数
-        parsed_data = extract_json_from_llm_response(text)
-        print(f"[DEBUG] 通用JSON提取结果类型: {type(parsed_data)}")
-        
-        # 方法1: 如果直接是包含Input和Result的对象
-        if isinstance(parsed_data, dict) and "Input" in parsed_data and "Result" in parsed_data:
-            data_pairs.append({
-                "Input": parsed_data["Input"],
-                "Result": parsed_data["Result"]
-            })
-            print(f"[DEBUG] 方法1成功，提取1个数据对")
-            return data_pairs
-        
-        # 方法2: 如果是对象数组
-        if isinstance(parsed_data, list):
-            print(f"[DEBUG] 检测到数组，长度: {len(parsed_data)}")
-            for i, item in enumerate(parsed_data):
-                print(f"[DEBUG] 检查数组项 {i}: {type(item)}, keys: {list(item.keys()) if isinstance(item, dict) else 'N/A'}")
-                if isinstance(item, dict) and "Input" in item and "Result" in item:
-                    data_pairs.append({
-                        "Input": item["Input"],
-                        "Result": item["Result"]
-                    })
-                    print(f"[DEBUG] 数组项 {i} 成功提取")
-            if data_pairs:
-                print(f"[DEBUG] 方法2成功，提取{len(data_pairs)}个数据对")
-                return data_pairs
-    except Exception as e:
-        print(f"[DEBUG] 通用JSON提取失败: {str(e)}")
-        pass
-    
-    # 备用方法1: 先尝试提取JSON数组
-    print(f"[DEBUG] 尝试备用方法1: 直接提取JSON数组")
-    try:
-        # 尝试找到JSON数组模式
-        array_patterns = [
-            r'\[(?:[^\[\]]|\{[^{}]*\})*\]',  # 简单数组
-            r'\[(?:[^\[\]]|\{(?:[^{}]|\{[^{}]*\})*\})*\]',  # 嵌套数组
-        ]
-        
-        for pattern in array_patterns:
-            matches = re.findall(pattern, text, re.DOTALL)
-            for match in matches:
-                try:
-                    array_data = json.loads(match)
-                    if isinstance(array_data, list):
-                        print(f"[DEBUG] 找到数组，长度: {len(array_data)}")
-                        for i, item in enumerate(array_data):
-                            if isinstance(item, dict) and "Input" in item and "Result" in item:
-                                data_pairs.append({
-                                    "Input": item["Input"],
-                                    "Result": item["Result"]
-                                })
-                                print(f"[DEBUG] 从数组提取数据对 {i}")
-                        if data_pairs:
-                            print(f"[DEBUG] 备用方法1成功，提取{len(data_pairs)}个数据对")
-                            return data_pairs
-                except Exception as e:
-                    print(f"[DEBUG] 数组解析失败: {str(e)}")
-                    continue
-    except Exception as e:
-        print(f"[DEBUG] 备用方法1异常: {str(e)}")
-    
-    # 备用方法2: 使用正则表达式逐个提取JSON对象
-    print(f"[DEBUG] 尝试备用方法2: 逐个提取JSON对象")
-    try:
-        # 改进的正则表达式，支持多层嵌套
-        object_patterns = [
-            # 匹配包含Input和Result的完整对象
-            r'\{[^{}]*"Input"[^{}]*"Result"[^{}]*\}',
-            r'\{(?:[^{}]|\{[^{}]*\})*"Input"(?:[^{}]|\{[^{}]*\})*"Result"(?:[^{}]|\{[^{}]*\})*\}',
-            r'\{(?:[^{}]|\{(?:[^{}]|\{[^{}]*\})*\})*"Input"(?:[^{}]|\{(?:[^{}]|\{[^{}]*\})*\})*"Result"(?:[^{}]|\{(?:[^{}]|\{[^{}]*\})*\})*\}',
-        ]
-        
-        for pattern in object_patterns:
-            matches = re.findall(pattern, text, re.DOTALL)
-            print(f"[DEBUG] 使用模式找到 {len(matches)} 个匹配")
-            
-            for i, match in enumerate(matches):
-                try:
-                    parsed = json.loads(match)
-                    if isinstance(parsed, dict) and "Input" in parsed and "Result" in parsed:
-                        data_pairs.append({
-                            "Input": parsed["Input"],
-                            "Result": parsed["Result"]
-                        })
-                        print(f"[DEBUG] 成功解析对象 {i}")
-                except Exception as e:
-                    print(f"[DEBUG] 对象 {i} 解析失败: {str(e)}")
-                    continue
-            
-            if data_pairs:
-                print(f"[DEBUG] 备用方法2成功，提取{len(data_pairs)}个数据对")
-                return data_pairs
-    except Exception as e:
-        print(f"[DEBUG] 备用方法2异常: {str(e)}")
-    
-    # 备用方法3: 分别提取Input和Result块并配对
-    print(f"[DEBUG] 尝试备用方法3: 分别提取Input和Result块")
-    if not data_pairs:
-        try:
-            input_blocks = []
-            result_blocks = []
-            
-            # 提取Input块
-            input_patterns = [
-                r'"Input"\s*:\s*(\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\})',
-                r'"Input"\s*:\s*(\{(?:[^{}]|\{[^{}]*\})*\})',
-            ]
-            
-            for pattern in input_patterns:
-                input_matches = re.findall(pattern, text, re.DOTALL)
-                print(f"[DEBUG] Input模式找到 {len(input_matches)} 个匹配")
-                for i, match in enumerate(input_matches):
-                    try:
-                        input_data = json.loads(match)
-                        input_blocks.append(input_data)
-                        print(f"[DEBUG] 成功解析Input块 {i}")
-                    except Exception as e:
-                        print(f"[DEBUG] Input块 {i} 解析失败: {str(e)}")
-                        continue
-                if input_blocks:
-                    break
-            
-            # 提取Result块
-            result_patterns = [
-                r'"Result"\s*:\s*(\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\})',
-                r'"Result"\s*:\s*(\{(?:[^{}]|\{[^{}]*\})*\})',
-            ]
-            
-            for pattern in result_patterns:
-                result_matches = re.findall(pattern, text, re.DOTALL)
-                print(f"[DEBUG] Result模式找到 {len(result_matches)} 个匹配")
-                for i, match in enumerate(result_matches):
-                    try:
-                        result_data = json.loads(match)
-                        result_blocks.append(result_data)
-                        print(f"[DEBUG] 成功解析Result块 {i}")
-                    except Exception as e:
-                        print(f"[DEBUG] Result块 {i} 解析失败: {str(e)}")
-                        continue
-                if result_blocks:
-                    break
-            
-            # 配对Input和Result
-            min_len = min(len(input_blocks), len(result_blocks))
-            print(f"[DEBUG] 准备配对: Input块{len(input_blocks)}个, Result块{len(result_blocks)}个, 可配对{min_len}个")
-            
-            for i in range(min_len):
-                data_pairs.append({
-                    "Input": input_blocks[i],
-                    "Result": result_blocks[i]
-                })
-                print(f"[DEBUG] 成功配对数据对 {i}")
-                
-            if data_pairs:
-                print(f"[DEBUG] 备用方法3成功，提取{len(data_pairs)}个数据对")
-        except Exception as e:
-            print(f"[DEBUG] 备用方法3异常: {str(e)}")
-    
-    print(f"[DEBUG] 最终结果: 提取了{len(data_pairs)}个数据对")
+
+    def log(message):
+        if debug:
+            print(f"[DEBUG] {message}")
+
+    log(f"开始解析文本，长度: {len(text)}")
+
+    # 扫描时顺便记录带有Input/Result键名的对象块，作为备用
+    labeled_blocks = {"Input": [], "Result": []}
+
+    def record_labeled_block(start, end):
+        if text[start] != "{":
+            return
+        label = BLOCK_LABEL_PATTERN.search(text[max(0, start - 40):start])
+        if label:
+            labeled_blocks[label.group(1)].append((start, end))
+
+    scanner = JsonScanner(on_close=record_labeled_block)
+    values = scanner.feed(text) + scanner.finish()
+    log(f"扫描到 {len(values)} 个JSON值")
+
+    for item in values:
+        collect_data_pairs(item.value, data_pairs)
+    if data_pairs:
+        log(f"提取{len(data_pairs)}个数据对")
+        return data_pairs
+
+    # 备用方法: 分别提取Input和Result块并配对
+    log("尝试备用方法: 分别提取Input和Result块")
+    blocks = {}
+    for label, spans in labeled_blocks.items():
+        blocks[label] = []
+        for start, end in spans:
+            try:
+                blocks[label].append(json.loads(text[start:end]))
+            except ValueError as e:
+                log(f"{label}块解析失败: {str(e)}")
+    min_len = min(len(blocks["Input"]), len(blocks["Result"]))
+    log(f"准备配对: Input块{len(blocks['Input'])}个, Result块{len(blocks['Result'])}个, 可配对{min_len}个")
+    for i in range(min_len):
+        data_pairs.append({
+            "Input": blocks["Input"][i],
+            "Result": blocks["Result"][i]
+        })
+
+    log(f"最终结果: 提取了{len(data_pairs)}个数据对")
     return data_pairs
 
+
+class StreamingPairExtractor:
+    """流式输出的增量数据对解析器
+
+    基于JsonScanner增量扫描新到达的文本片段，每当任意深度的JSON对象闭合、
+    且同时包含"Input"和"Result"字段时立即解析并返回该数据对，不必等外层数组结束。
+    """
+
+    def __init__(self):
+        self.pairs = []
+        self._new_pairs = []
+        self.scanner = JsonScanner(on_close=self._on_close)
+
+    def _on_close(self, start, end):
+        text = self.scanner.slice(start, end)
+        if text[0] != "{" or '"Input"' not in text or '"Result"' not in text:
+            return
+        try:
+            parsed = json.loads(text)
+        except ValueError:
+            return
+        if isinstance(parsed, dict) and "Input" in parsed and "Result" in parsed:
+            self._new_pairs.append({"Input": parsed["Input"], "Result": parsed["Result"]})
+
+    def feed(self, chunk):
+        """送入新的文本片段，返回本次新解析出的数据对"""
+        self._new_pairs = []
+        self.scanner.feed(chunk)
+        self.pairs.extend(self._new_pairs)
+        return self._new_pairs
+
+
+def stream_generation_output(prompt, api_key, model):
+    """流式调用大模型并实时渲染输出和已解析出的数据对，返回(完整输出, 数据对列表)"""
+    from llm import stream_llm
+
+    output_box = st.empty()
+    pairs_box = st.empty()
+    extractor = StreamingPairExtractor()
+    last_render = 0.0
+    for delta in stream_llm(prompt, api_key, model=model):
+        new_pairs = extractor.feed(delta)
+        now = time.time()
+        # 限制刷新频率，避免每个片段都重绘页面
+        if new_pairs or now - last_render > STREAM_RENDER_INTERVAL:
+            output_box.code(extractor.scanner.text, language="json")
+            last_render = now
+        if new_pairs:
+            pairs_box.success(f"⚡ 已解析出 {len(extractor.pairs)} 个数据对，继续生成中...")
+    output_box.empty()
+    pairs_box.empty()
+    return extractor.scanner.text.strip(), extractor.pairs
+
+
+class StagingBuffer:
+    """审核通过、尚未写入数据集的数据对暂存区
+
+    审核时接受的数据对先放入暂存区，"保存全部已接受"时按目标数据集分组，每个数据集只调用一次
+    add_generated_data：一次分配ID、一次追加写入，而不是每接受一条就写一次文件。
+    """
+
+    def __init__(self):
+        # (数据集类型, 条目)
+        self.entries = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry, data_type="train"):
+        self.entries.append(("train" if data_type == "train" else "val", entry))
+
+    def counts(self):
+        """各数据集暂存的条数"""
+        counts = {"train": 0, "val": 0}
+        for data_type, _ in self.entries:
+            counts[data_type] += 1
+        return counts
+
+    def clear(self):
+        self.entries = []
+
+    def commit(self, manager):
+        """把暂存的数据写入数据集，返回各数据集写入的条数和其中不符合项目Schema的条数(invalid)；
+        某个数据集写入失败时保留尚未写入的条目"""
+        saved = {"train": 0, "val": 0, "invalid": 0}
+        for data_type in ("train", "val"):
+            batch = [entry for split, entry in self.entries if split == data_type]
+            if not batch:
+                continue
+            invalid = manager.add_generated_data(batch, data_type=data_type)
+            self.entries = [(split, entry) for split, entry in self.entries if split != data_type]
+            saved[data_type] = len(batch)
+            saved["invalid"] += len(invalid)
+        return saved
+
+
+def get_staging_buffer(manager):
+    """获取当前项目的暂存区(保存在session_state中，切换项目时互不影响)"""
+    key = f"staging_buffer_{manager.current_project}"
+    if key not in st.session_state:
+        st.session_state[key] = StagingBuffer()
+    return st.session_state[key]
+
+
+def build_entry_from_editor(edited_input, edited_result):
+    """把编辑器中的Input/Result文本解析为数据条目，JSON格式错误时抛出JSONDecodeError"""
+    new_entry = {
+        "Input": json.loads(edited_input),
+        "Result": json.loads(edited_result)
+    }
+    # 确保Result中有必要的字段，ID会在add_generated_data中统一分配
+    if "id" not in new_entry["Result"]:
+        new_entry["Result"]["id"] = 0
+    return new_entry
+
+
+def render_staging_area(manager):
+    """渲染暂存区：显示已接受的数据对，一次性保存到数据集"""
+    staging = get_staging_buffer(manager)
+    if not len(staging):
+        return
+
+    st.markdown("---")
+    counts = staging.counts()
+    st.subheader(f"📦 已接受待保存 ({len(staging)} 对)")
+    col_staged1, col_staged2 = st.columns(2)
+    with col_staged1:
+        st.metric("待保存到训练集", f"{counts['train']} 条")
+    with col_staged2:
+        st.metric("待保存到验证集", f"{counts['val']} 条")
+
+    # 保存前按项目Schema校验暂存的数据
+    invalid = manager.validate_entries([entry for _, entry in staging.entries])
+    if invalid:
+        st.warning(f"⚠️ {len(invalid)} 条暂存数据不符合项目Schema，仍可保存")
+
+    with st.expander("👀 查看暂存的数据"):
+        for position, (data_type, entry) in enumerate(staging.entries):
+            st.caption("训练集" if data_type == "train" else "验证集")
+            for error in invalid.get(position, []):
+                st.caption(f"⚠️ {error}")
+            st.json(entry, expanded=False)
+
+    col_commit, col_clear = st.columns(2)
+    with col_commit:
+        if st.button(f"💾 保存全部已接受 ({len(staging)} 条)", type="primary", use_container_width=True,
+                     key="staging_commit"):
+            try:
+                saved = staging.commit(manager)
+                st.session_state["staging_saved_message"] = (
+                    f"✅ 已保存 {saved['train'] + saved['val']} 条数据：训练集 {saved['train']} 条，验证集 {saved['val']} 条"
+                    f"（当前数据量：训练集 {len(manager.train_data)} 条，验证集 {len(manager.val_data)} 条）"
+                    + (f"，其中 {saved['invalid']} 条不符合项目Schema" if saved["invalid"] else "")
+                )
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ 保存时出错: {str(e)}")
+    with col_clear:
+        if st.button("🗑️ 清空暂存区", use_container_width=True, key="staging_clear"):
+            staging.clear()
+            st.rerun()
+
+
 def render_data_pair_editor(pair_id, input_data, result_data, default_data_type, manager):
     """渲染单个数据对的编辑器"""
     st.markdown(f"### 数据对 {pair_id + 1}")
@@ -308,7 +365,8 @@ def render_data_pair_editor(pair_id, input_data, result_data, default_data_type,
         col_save, col_discard, col_preview = st.columns([1, 1, 1])
         
         with col_save:
-            save_clicked = st.button(f"💾 保存", key=f"save_{pair_id}", use_container_width=True, type="primary")
+            accept_clicked = st.button(f"✅ 接受", key=f"accept_{pair_id}", use_container_width=True, type="primary",
+                                       help="加入暂存区，点击\"保存全部已接受\"时统一写入数据集")
         
         with col_discard:
             discard_clicked = st.button(f"🗑️ 放弃", key=f"discard_{pair_id}", use_container_width=True)
@@ -323,7 +381,207 @@ def render_data_pair_editor(pair_id, input_data, result_data, default_data_type,
                 except Exception as e:
                     st.error(f"JSON格式错误: {str(e)}")
     
-    return save_clicked, discard_clicked, edited_input, edited_result, individual_data_type
+    return accept_clicked, discard_clicked, edited_input, edited_result, individual_data_type
+
+def render_bulk_generation(manager, system_prompt, model):
+    """渲染批量生成区域：启动后台生成任务、显示进度、把审核队列中的数据载入编辑器"""
+    st.subheader("批量生成")
+    st.caption("在后台并发生成大量数据，生成结果进入审核队列或直接写入数据集")
+
+    job = st.session_state.get("generation_job")
+    if job is not None and job.project != manager.current_project:
+        # 会话已切换项目：任务属于原项目，取消并移除(写入模式下已生成的数据仍写入原项目)
+        job.cancel()
+        del st.session_state["generation_job"]
+        st.info(f"已切换项目，项目 {job.project} 的批量生成任务已取消")
+        job = None
+    if job is None or not job.running:
+        col_mode, col_target, col_workers = st.columns(3)
+        with col_mode:
+            mode = st.radio(
+                "生成模式",
+                options=list(GENERATION_MODES),
+                format_func=lambda x: "Self-instruct" if x == "self_instruct" else "查询→结果",
+                key="bulk_generation_mode",
+                help="Self-instruct使用上方的System Prompt一次生成完整数据对；查询→结果先生成查询再生成对应结果"
+            )
+        with col_target:
+            target = st.number_input("目标条数", min_value=1, max_value=100000, value=100, step=10,
+                                     key="bulk_generation_target")
+        with col_workers:
+            max_workers = st.number_input("最大并发请求数", min_value=1, max_value=64,
+                                          value=DEFAULT_GENERATION_WORKERS, key="bulk_generation_workers")
+        destination = st.radio(
+            "生成结果输出到",
+            options=["review", "train", "val"],
+            format_func=lambda x: {"review": "📝 审核队列", "train": "🎯 训练数据集", "val": "✅ 验证数据集"}[x],
+            horizontal=True,
+            key="bulk_generation_destination"
+        )
+        if st.button("🚀 开始批量生成", key="bulk_generation_start"):
+            try:
+                job = GenerationJob(manager, mode=mode, target=target, system_prompt=system_prompt, model=model,
+                                    max_workers=max_workers, destination=destination)
+                st.session_state["generation_job"] = job.start()
+                st.rerun()
+            except ValueError as e:
+                st.error(str(e))
+
+    if job is None:
+        return
+
+    progress = job.progress()
+    status_text = {"running": "运行中", "done": "已完成", "cancelled": "已取消", "failed": "已停止"}.get(
+        progress["status"], progress["status"])
+    st.progress(min(1.0, progress["produced"] / progress["target"]),
+                text=f"{status_text}: {progress['produced']}/{progress['target']} 条")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("生成速度", f"{progress['rate']:.2f} 条/秒")
+    with col2:
+        eta = progress["eta"]
+        st.metric("预计剩余", f"{eta:.0f} 秒" if eta is not None else "-")
+    with col3:
+        st.metric("调用/错误", f"{progress['calls']}/{progress['errors']}")
+    with col4:
+        if progress["destination"] == "review":
+            st.metric("待审核", f"{progress['queued']} 条")
+        else:
+            st.metric("已写入", f"{progress['saved']} 条")
+    if progress["invalid"] or progress["duplicates"]:
+        st.caption(f"丢弃格式不合法的条目 {progress['invalid']} 条，重复条目 {progress['duplicates']} 条")
+    if progress["recent_errors"]:
+        with st.expander("最近的错误"):
+            st.text("\n".join(progress["recent_errors"]))
+
+    col_action1, col_action2, col_action3 = st.columns(3)
+    with col_action1:
+        if job.running and st.button("⏹️ 取消任务", key="bulk_generation_cancel", use_container_width=True):
+            job.cancel()
+            st.rerun()
+    with col_action2:
+        if progress["queued"] and st.button("📥 载入待审核数据(20条)", key="bulk_generation_review",
+                                            use_container_width=True):
+            # 追加到数据对编辑器中，沿用逐条审核保存的流程
+            pairs = st.session_state.get("extracted_pairs", [])
+            start = len(pairs)
+            pairs = pairs + job.take_review(20)
+            st.session_state["extracted_pairs"] = pairs
+            st.session_state["pairs_to_process"] = st.session_state.get("pairs_to_process", []) + list(
+                range(start, len(pairs)))
+            st.rerun()
+    with col_action3:
+        if not job.running and not progress["queued"] and st.button("清除任务", key="bulk_generation_clear",
+                                                                     use_container_width=True):
+            del st.session_state["generation_job"]
+            st.rerun()
+
+    if job.running:
+        # 自动刷新在页面末尾执行(见data_generation_page)，保证页面其余部分正常渲染
+        auto_refresh = st.checkbox("自动刷新进度", value=True, key="bulk_generation_auto_refresh")
+        if not auto_refresh and st.button("🔄 刷新进度", key="bulk_generation_refresh"):
+            st.rerun()
+
+
+def render_data_import(manager):
+    """渲染批量导入区域：上传文件或指定服务器上的文件，配置列映射后流式导入"""
+    st.subheader("批量导入")
+    st.caption("流式导入JSONL、JSON数组、CSV和Parquet文件(可为.gz压缩)，按列映射转换为Input/Result，"
+               "按项目Schema校验后分块写入数据集")
+
+    source_type = st.radio("数据来源", options=["upload", "path"], horizontal=True, key="import_source_type",
+                           format_func=lambda x: "上传文件" if x == "upload" else "服务器文件路径")
+    source, name = None, None
+    if source_type == "upload":
+        uploaded = st.file_uploader("选择文件", key="import_upload",
+                                    type=["jsonl", "ndjson", "json", "csv", "tsv", "parquet", "gz"])
+        if uploaded is not None:
+            source, name = uploaded, uploaded.name
+    else:
+        path = st.text_input("文件路径", key="import_path", help="大文件建议放到服务器上，直接按路径导入，避免上传")
+        if path:
+            if os.path.isfile(path):
+                source, name = path, path
+            else:
+                st.error("❌ 文件不存在")
+    if source is None:
+        return
+
+    try:
+        preview = preview_rows(source, name=name)
+    except Exception as e:
+        st.error(f"❌ 读取文件失败: {str(e)}")
+        return
+    with st.expander(f"源数据预览(前{len(preview)}行)"):
+        st.json(preview, expanded=False)
+
+    col_map, col_types = st.columns(2)
+    with col_map:
+        columns_text = st.text_area(
+            "列映射 {源列名: 目标字段}",
+            value=json.dumps(suggest_columns(preview[0] if preview else None), ensure_ascii=False, indent=2),
+            height=200, key=f"import_columns_{name}",
+            help="目标字段以Input.或Result.开头，源列名可以用.访问嵌套字段；为空表示每行已是{Input, Result}结构"
+        )
+    with col_types:
+        types_text = st.text_area(
+            "类型转换 {目标字段: 类型}", value="{}", height=200, key=f"import_types_{name}",
+            help="类型可选 string/integer/number/boolean/array/object，CSV中的值默认都是字符串"
+        )
+    col_type, col_invalid, col_chunk = st.columns(3)
+    with col_type:
+        data_type = st.radio("导入到", options=["train", "val"], horizontal=True, key="import_data_type",
+                             format_func=lambda x: "🎯 训练数据集" if x == "train" else "✅ 验证数据集")
+    with col_invalid:
+        on_invalid = st.radio("不合法的数据", options=["skip", "keep"], horizontal=True, key="import_on_invalid",
+                              format_func=lambda x: "跳过" if x == "skip" else "照常导入")
+    with col_chunk:
+        chunk_size = st.number_input("每块条数", min_value=100, max_value=100000, value=IMPORT_CHUNK_SIZE,
+                                     step=1000, key="import_chunk_size")
+
+    col_check, col_run = st.columns(2)
+    with col_check:
+        check = st.button("🔍 预检(不写入)", use_container_width=True, key="import_check")
+    with col_run:
+        run = st.button("📥 开始导入", use_container_width=True, type="primary", key="import_run")
+    if check or run:
+        try:
+            columns = json.loads(columns_text) if columns_text.strip() else {}
+            types = json.loads(types_text) if types_text.strip() else {}
+        except json.JSONDecodeError as e:
+            st.error(f"❌ 列映射或类型转换格式错误：第 {e.lineno} 行，第 {e.colno} 列: {e.msg}")
+            return
+        progress_bar = st.progress(0.0)
+        status_text = st.empty()
+
+        def update_progress(message, progress):
+            progress_bar.progress(progress)
+            status_text.text(message)
+
+        try:
+            if not isinstance(source, str):
+                source.seek(0)
+            report = import_dataset(manager, source, name=name, columns=columns, types=types, data_type=data_type,
+                                    on_invalid=on_invalid, chunk_size=int(chunk_size), dry_run=check,
+                                    callback=update_progress)
+        except Exception as e:
+            st.error(f"❌ 导入失败: {str(e)}")
+            return
+        st.session_state["import_report"] = report
+
+    report = st.session_state.get("import_report")
+    if report:
+        action = "可导入" if report["dry_run"] else "已导入"
+        st.info(f"读取 {report['rows']} 行，{action} {report['imported']} 条，跳过 {report['skipped']} 条，"
+                f"不合法 {report['invalid']} 条（耗时 {report['elapsed']:.1f} 秒，{report['rate']:.0f} 行/秒）")
+        if report["summary"]:
+            with st.expander("错误统计"):
+                for message, count in report["summary"]:
+                    st.write(f"- {message}（{count} 条）")
+            with st.expander(f"不合法数据明细(前{len(report['samples'])}条)"):
+                for sample in report["samples"]:
+                    st.write(f"**第 {sample['row']} 行**: {'; '.join(sample['errors'])}")
+
 
 # 数据生成页面
 def data_generation_page(manager):
@@ -402,6 +660,9 @@ def data_generation_page(manager):
         st.text_area("System Prompt内容", system_prompt, height=500)
 
 
+    stream_output = st.checkbox("流式输出", value=True, key="stream_generation",
+                                help="边生成边显示模型输出，完整的数据对会在生成过程中实时解析出来")
+
     # 生成按钮
     if st.button("生成结果"):
         if system_prompt:
@@ -411,8 +672,13 @@ def data_generation_page(manager):
                     from llm import call_llm
                     prompt = f"{system_prompt}\n\n请自主生成一个用户输入和对应的输出结果，并生成符合现有数据格式的结果，包括id、turn、query_independent、target、processed_query和search。"
                     
-                    # 调用LLM获取原始输出
-                    raw_output = call_llm(prompt, manager.api_key, model=model).strip()
+                    streamed_pairs = None
+                    if stream_output:
+                        # 流式输出：边接收边显示，数据对一闭合就解析出来
+                        raw_output, streamed_pairs = stream_generation_output(prompt, manager.api_key, model)
+                    else:
+                        # 调用LLM获取原始输出
+                        raw_output = call_llm(prompt, manager.api_key, model=model).strip()
                     
                     # 存储原始输出
                     st.session_state["raw_llm_output"] = raw_output
@@ -449,7 +715,8 @@ def data_generation_page(manager):
                         
                         debug_output = io.StringIO()
                         with contextlib.redirect_stdout(debug_output):
-                            data_pairs = extract_data_pairs_from_text(raw_output)
+                            # 流式解析没有得到数据对时(如Input和Result分开给出)，再对完整输出做一次解析
+                            data_pairs = streamed_pairs or extract_data_pairs_from_text(raw_output, debug=show_debug)
                         
                         # 显示调试信息
                         if show_debug:
@@ -533,10 +800,11 @@ def data_generation_page(manager):
                 val_count = len(manager.val_data) if manager.val_data else 0
                 st.metric("验证数据集", f"{val_count} 条")
             
-            st.info("💡 每个数据对可以单独选择保存到训练集或验证集")
+            st.info("💡 每个数据对可以单独选择保存到训练集或验证集；接受的数据对先进入暂存区，最后一次性保存")
             
             # 默认数据集类型，用于每个数据对的初始选择
             data_type = "train"
+            staging = get_staging_buffer(manager)
             
             # 为每个数据对渲染编辑器
             pairs_to_remove = []
@@ -545,39 +813,17 @@ def data_generation_page(manager):
                 pair = data_pairs[pair_idx]
                 
                 with st.container():
-                    save_clicked, discard_clicked, edited_input, edited_result, individual_data_type = render_data_pair_editor(
+                    accept_clicked, discard_clicked, edited_input, edited_result, individual_data_type = render_data_pair_editor(
                         pair_idx, pair["Input"], pair["Result"], data_type, manager
                     )
                     
-                    if save_clicked:
-                        # 保存数据（使用个人选择的数据集类型）
+                    if accept_clicked:
+                        # 加入暂存区(使用个人选择的数据集类型)，统一保存时再写入
                         try:
-                            input_json = json.loads(edited_input)
-                            result_json = json.loads(edited_result)
-                            
-                            new_entry = {
-                                "Input": input_json,
-                                "Result": result_json
-                            }
-                            
-                            # 确保Result中有必要的字段
-                            if "id" not in new_entry["Result"]:
-                                new_entry["Result"]["id"] = 0
-                            
-                            manager.add_generated_data([new_entry], data_type=individual_data_type)
-                            
-                            dataset_name = "训练数据集" if individual_data_type == "train" else "验证数据集"
-                            train_count = len(manager.train_data)
-                            val_count = len(manager.val_data)
-                            st.success(f"✅ 数据对 {pair_idx + 1} 已保存到{dataset_name}")
-                            st.info(f"📊 当前数据量：训练集 {train_count} 条，验证集 {val_count} 条")
-                            
+                            staging.add(build_entry_from_editor(edited_input, edited_result), individual_data_type)
                             pairs_to_remove.append(pair_idx)
-                            
                         except json.JSONDecodeError as e:
                             st.error(f"❌ 数据对 {pair_idx + 1} JSON格式错误: {str(e)}")
-                        except Exception as e:
-                            st.error(f"❌ 保存数据对 {pair_idx + 1} 时出错: {str(e)}")
                     
                     elif discard_clicked:
                         st.info(f"🗑️ 已放弃数据对 {pair_idx + 1}")
@@ -594,7 +840,6 @@ def data_generation_page(manager):
                 
                 if not remaining_pairs:
                     # 所有数据对都已处理完毕
-                    st.success("🎉 所有数据对已处理完毕！")
                     if "extracted_pairs" in st.session_state:
                         del st.session_state["extracted_pairs"]
                     if "pairs_to_process" in st.session_state:
@@ -606,7 +851,25 @@ def data_generation_page(manager):
             
             # 批量操作按钮
             st.markdown("---")
-            col_batch1, col_batch2 = st.columns([1, 1])
+            col_batch0, col_batch1, col_batch2 = st.columns([1, 1, 1])
+            
+            with col_batch0:
+                if st.button("✅ 全部接受", use_container_width=True):
+                    # 按编辑器中的当前内容和各自选择的数据集加入暂存区，格式错误的保留在编辑器中
+                    failed = []
+                    for pair_idx in pairs_to_process:
+                        try:
+                            staging.add(build_entry_from_editor(
+                                st.session_state.get(f"input_edit_{pair_idx}", json.dumps(data_pairs[pair_idx]["Input"])),
+                                st.session_state.get(f"result_edit_{pair_idx}", json.dumps(data_pairs[pair_idx]["Result"]))
+                            ), st.session_state.get(f"individual_data_type_{pair_idx}", data_type))
+                        except json.JSONDecodeError:
+                            failed.append(pair_idx)
+                    st.session_state["pairs_to_process"] = failed
+                    if not failed:
+                        del st.session_state["extracted_pairs"]
+                        del st.session_state["pairs_to_process"]
+                    st.rerun()
             
             with col_batch1:
                 if st.button("🗑️ 全部放弃", use_container_width=True):
@@ -626,6 +889,14 @@ def data_generation_page(manager):
                         with st.expander("原始模型输出", expanded=True):
                             st.text_area("原始文本", st.session_state["generated_text"], height=300)
 
+    if "staging_saved_message" in st.session_state:
+        st.success(st.session_state.pop("staging_saved_message"))
+    render_staging_area(manager)
+
+    render_bulk_generation(manager, system_prompt, model)
+
+    render_data_import(manager)
+
     # 手动输入数据区域
     st.subheader("手动输入数据")
     
@@ -718,7 +989,9 @@ def data_generation_page(manager):
                     new_entry["Result"]["id"] = 0
                 
                 # 保存数据
-                manager.add_generated_data([new_entry], data_type=data_type)
+                invalid = manager.add_generated_data([new_entry], data_type=data_type)
+                if invalid:
+                    st.warning("⚠️ 数据已保存，但不符合项目Schema：\n" + "\n".join(f"- {error}" for error in invalid[0]))
                 
                 # 显示成功消息
                 dataset_name = "训练数据集" if data_type == "train" else "验证数据集"
@@ -740,4 +1013,9 @@ def data_generation_page(manager):
             except Exception as e:
                 st.error(f"❌ 保存数据时出错: {str(e)}")
         else:
-            st.error("❌ Input和Result不能为空")
\ No newline at end of file
+            st.error("❌ Input和Result不能为空")
+    # 批量生成任务运行中时定时刷新进度；放在页面末尾，保证整个页面已经渲染
+    job = st.session_state.get("generation_job")
+    if job is not None and job.running and st.session_state.get("bulk_generation_auto_refresh", True):
+        time.sleep(BULK_PROGRESS_REFRESH_INTERVAL)
+        st.rerun()
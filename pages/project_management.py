@@ -1,9 +1,13 @@
 import streamlit as st
 import json
 import os
+import time
 import shutil
 from pathlib import Path
 
+from schema_migration import migrate_project, suggest_migration
+from sqlite_store import STORAGE_BACKENDS, migrate_storage, storage_backend
+
 # 项目管理页面
 def project_management_page(manager):
     st.title("项目管理")
@@ -52,8 +56,10 @@ def show_project_overview(manager, existing_projects):
         # 显示项目卡片
         for i, project_name in enumerate(existing_projects):
             try:
-                # 创建临时管理器来读取项目信息
-                temp_manager = manager.__class__(project_name=project_name, api_key=manager.api_key)
+                # 只读取统计信息和配置，不加载项目数据
+                stats = manager.get_project_stats(project_name)
+                train_count = stats.get("train", {}).get("count", 0)
+                val_count = stats.get("val", {}).get("count", 0)
                 
                 # 项目卡片
                 with st.container():
@@ -67,14 +73,13 @@ def show_project_overview(manager, existing_projects):
                             st.markdown(f"**📁 {project_name}**")
                     
                     with col2:
-                        st.metric("训练数据", len(temp_manager.train_data))
+                        st.metric("训练数据", train_count)
                     
                     with col3:
-                        st.metric("验证数据", len(temp_manager.val_data))
+                        st.metric("验证数据", val_count)
                     
                     with col4:
-                        total_data = len(temp_manager.train_data) + len(temp_manager.val_data)
-                        st.metric("总计", total_data)
+                        st.metric("总计", train_count + val_count)
                     
                     with col5:
                         col5_1, col5_2 = st.columns(2)
@@ -122,13 +127,19 @@ def show_project_overview(manager, existing_projects):
                     
                     # 项目详情展开
                     with st.expander(f"📋 {project_name} 详情"):
+                        config = manager.read_project_config(project_name)
+                        total_bytes = stats.get("train", {}).get("bytes", 0) + stats.get("val", {}).get("bytes", 0)
+                        updated_at = stats.get("updated_at")
+                        st.caption(f"数据文件 {total_bytes / 1024 / 1024:.2f} MB"
+                                   + (f"，最后更新于 {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(updated_at))}" if updated_at else "")
+                                   + f"，Schema哈希 {stats.get('schema_hash', '')[:8]}")
                         detail_col1, detail_col2 = st.columns(2)
                         with detail_col1:
                             st.write("**Input Schema:**")
-                            st.json(temp_manager.input_schema, expanded=False)
+                            st.json(config.get("input_schema", {}), expanded=False)
                         with detail_col2:
                             st.write("**Result Schema:**")
-                            st.json(temp_manager.result_schema, expanded=False)
+                            st.json(config.get("result_schema", {}), expanded=False)
                 
                 if i < len(existing_projects) - 1:
                     st.markdown("---")
@@ -245,6 +256,14 @@ def show_create_project_page(manager):
                 help="定义输出结果的JSON Schema格式"
             )
         
+        backend = st.selectbox(
+            "存储引擎",
+            STORAGE_BACKENDS,
+            format_func=lambda name: "JSONL文件" if name == "jsonl" else "SQLite数据库",
+            help="JSONL适合中小规模数据；SQLite为标签/正则过滤建立全文索引，为intent等常用Result字段建立索引，"
+                 "适合大数据集。之后可以在修改项目页面迁移"
+        )
+
         # 表单提交按钮
         submitted = st.form_submit_button("创建项目", use_container_width=True, type="primary")
         
@@ -307,7 +326,7 @@ def show_create_project_page(manager):
                 
                 # Schema验证通过，创建项目
                 try:
-                    manager.create_project(new_project_name, input_schema, result_schema)
+                    manager.create_project(new_project_name, input_schema, result_schema, storage_backend=backend)
                     st.success(f"✅ 项目 '{new_project_name}' 创建成功")
                     st.session_state["pm_page_state"] = "overview"
                     st.rerun()
@@ -318,6 +337,122 @@ def show_create_project_page(manager):
             else:
                 st.error("❌ 请填写所有必要信息")
 
+def show_validation_report(report):
+    """显示训练集和验证集的Schema校验报告"""
+    for data_type, split_report in report.items():
+        dataset_name = "训练数据集" if data_type == "train" else "验证数据集"
+        total, invalid = split_report["total"], split_report["invalid"]
+        if not invalid:
+            st.success(f"✅ {dataset_name}: {total} 条数据全部符合Schema（耗时 {split_report['elapsed']:.2f} 秒）")
+            continue
+        st.warning(f"⚠️ {dataset_name}: {invalid}/{total} 条数据不符合Schema（耗时 {split_report['elapsed']:.2f} 秒）")
+        with st.expander(f"{dataset_name}错误统计"):
+            for message, count in split_report["summary"]:
+                st.write(f"- {message}（{count} 条）")
+        with st.expander(f"{dataset_name}不合法数据明细(前100条)"):
+            for record in split_report["records"][:100]:
+                st.write(f"**ID {record['id']}** (第 {record['position'] + 1} 条)")
+                for error in record["errors"]:
+                    st.write(f"- {error}")
+
+
+def show_migration_report(report):
+    """显示数据迁移(或预览)的结果"""
+    action = "预览" if report.get("dry_run") else "迁移"
+    for data_type in ("train", "val"):
+        split_report = report[data_type]
+        dataset_name = "训练数据集" if data_type == "train" else "验证数据集"
+        st.write(f"**{dataset_name}**: 处理 {split_report['lines']} 行，{action}改动 {split_report['changed']} 条，"
+                 f"类型转换失败 {split_report['coerce_failures']} 条，不符合Schema {split_report['invalid']} 条")
+        if split_report["coerce_failure_samples"]:
+            with st.expander(f"{dataset_name}类型转换失败明细"):
+                for record in split_report["coerce_failure_samples"]:
+                    st.write(f"**ID {record['id']}**: {'; '.join(record['errors'])}")
+        if split_report["summary"]:
+            with st.expander(f"{dataset_name}迁移后的错误统计"):
+                for message, count in split_report["summary"]:
+                    st.write(f"- {message}（{count} 条）")
+
+
+def show_schema_migration(manager, temp_manager, selected_project):
+    """数据迁移：按声明式规则把已有数据迁移到当前Schema"""
+    st.write("### 数据迁移")
+    st.caption("修改Schema后，可以按规则批量迁移已有数据：rename重命名字段，drop删除字段，defaults为缺失字段补默认值，"
+               "coerce转换字段类型(string/integer/number/boolean/array/object)。字段路径以Input.或Result.开头。"
+               "下面的规则草稿根据当前Schema生成，重命名需要手动填写。")
+    # 当前会话正在使用该项目时直接在会话的manager上迁移，保证内存中的数据和未保存的修改一致
+    target_manager = manager if manager.current_project == selected_project else temp_manager
+    spec_text = st.text_area(
+        "迁移规则",
+        value=json.dumps(suggest_migration(temp_manager.input_schema, temp_manager.result_schema),
+                         ensure_ascii=False, indent=2),
+        height=250,
+        key=f"migration_spec_{selected_project}"
+    )
+
+    col_preview, col_apply = st.columns(2)
+    with col_preview:
+        preview = st.button("👁️ 预览迁移", use_container_width=True, key="preview_migration")
+    with col_apply:
+        apply = st.button("🚀 执行迁移", use_container_width=True, type="primary", key="apply_migration")
+
+    if preview or apply:
+        try:
+            spec = json.loads(spec_text)
+        except json.JSONDecodeError as e:
+            st.error(f"❌ 迁移规则格式错误：第 {e.lineno} 行，第 {e.colno} 列: {e.msg}")
+            return
+        progress_bar = st.progress(0.0)
+        status_text = st.empty()
+
+        def update_progress(message, progress):
+            progress_bar.progress(progress)
+            status_text.text(message)
+
+        try:
+            # Schema可能刚在本页修改过，迁移前重新读取配置
+            target_manager.load_project_config()
+            report = migrate_project(target_manager, spec, dry_run=preview, callback=update_progress)
+        except Exception as e:
+            st.error(f"❌ 数据迁移失败: {str(e)}")
+            return
+        st.session_state["migration_report"] = (selected_project, report)
+        if apply:
+            # 数据已变化，之前的校验报告失效
+            st.session_state.pop("validation_report", None)
+            st.success("✅ 数据迁移完成")
+
+    saved_report = st.session_state.get("migration_report")
+    if saved_report and saved_report[0] == selected_project:
+        show_migration_report(saved_report[1])
+
+
+def show_storage_backend(manager, temp_manager, selected_project):
+    """存储引擎：在JSONL文件和SQLite数据库之间迁移项目数据"""
+    st.write("### 存储引擎")
+    current = storage_backend(temp_manager.data_dir)
+    target = "sqlite" if current == "jsonl" else "jsonl"
+    names = {"jsonl": "JSONL文件", "sqlite": "SQLite数据库"}
+    st.caption(f"当前使用{names[current]}存储。迁移会把全部数据写入{names[target]}，完成后原文件保留为 .bak 备份。")
+    if st.button(f"🔁 迁移到{names[target]}", key=f"migrate_storage_{selected_project}"):
+        # 当前会话正在使用该项目时直接在会话的manager上迁移，先保存未保存的修改
+        target_manager = manager if manager.current_project == selected_project else temp_manager
+        progress_bar = st.progress(0.0)
+        status_text = st.empty()
+
+        def update_progress(message, progress):
+            progress_bar.progress(progress)
+            status_text.text(message)
+
+        try:
+            migrate_storage(target_manager, target, callback=update_progress)
+        except Exception as e:
+            st.error(f"❌ 存储迁移失败: {str(e)}")
+            return
+        st.success(f"✅ 已迁移到{names[target]}")
+        st.rerun()
+
+
 def show_edit_project_page(manager, existing_projects):
     """显示编辑项目页面"""
     col1, col2 = st.columns([1, 6])
@@ -342,6 +477,12 @@ def show_edit_project_page(manager, existing_projects):
             
             # 显示项目基本信息
             st.info(f"正在编辑项目: **{selected_project}**")
+            saved_message = st.session_state.get("config_saved_message")
+            if saved_message and saved_message[0] == selected_project:
+                st.session_state.pop("config_saved_message")
+                st.success(saved_message[1])
+                if saved_message[2]:
+                    st.warning(saved_message[2])
             
             col1, col2, col3 = st.columns(3)
             with col1:
@@ -352,6 +493,14 @@ def show_edit_project_page(manager, existing_projects):
                 total_data = len(temp_manager.train_data) + len(temp_manager.val_data)
                 st.metric("总数据量", total_data)
             
+            # 按当前Schema校验全部数据
+            if st.button("🔍 按Schema校验数据", key="validate_project_data"):
+                with st.spinner("正在校验数据..."):
+                    st.session_state["validation_report"] = (selected_project, temp_manager.validation_report())
+            saved_report = st.session_state.get("validation_report")
+            if saved_report and saved_report[0] == selected_project:
+                show_validation_report(saved_report[1])
+            
             # Schema编辑表单
             with st.form("edit_project_form"):
                 st.write("### 编辑项目Schema")
@@ -413,7 +562,15 @@ def show_edit_project_page(manager, existing_projects):
                     # Schema验证通过，保存配置
                     try:
                         temp_manager.save_project_config(input_schema, result_schema)
-                        st.success(f"✅ 项目 '{selected_project}' 配置已保存")
+                        # Schema已变化，之前的校验报告失效
+                        st.session_state.pop("validation_report", None)
+                        ignored = temp_manager.ignored_schema_keywords
+                        # 重跑后再显示(见页面上方)，否则st.rerun()前输出的提示不会被看到
+                        st.session_state["config_saved_message"] = (
+                            selected_project,
+                            f"✅ 项目 '{selected_project}' 配置已保存",
+                            f"⚠️ 以下Schema关键字暂不支持，不参与数据校验: {', '.join(ignored)}" if ignored else None
+                        )
                         st.rerun()
                     except Exception as e:
                         st.error(f"❌ 保存配置时出错: {str(e)}")
@@ -429,6 +586,9 @@ def show_edit_project_page(manager, existing_projects):
                         st.rerun()
                     except Exception as e:
                         st.error(f"❌ 切换项目失败: {str(e)}")
+
+            show_schema_migration(manager, temp_manager, selected_project)
+            show_storage_backend(manager, temp_manager, selected_project)
                         
         except Exception as e:
             st.error(f"❌ 无法加载项目信息: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,393 @@
+import os
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from schema_validator import EntryValidator, count_errors, top_errors
+from storage import OP_KEY, JsonlSplitStore, atomic_open, iter_jsonl, record_key
+
+# 迁移时每处理这么多行回调一次进度
+MIGRATION_PROGRESS_EVERY = 2000
+# 校验汇总中保留的不合法条目明细数
+MIGRATION_SAMPLE_ERRORS = 100
+
+_MISSING = object()
+
+
+def _split_path(path: str) -> List[str]:
+    parts = path.split(".")
+    if len(parts) < 2 or parts[0] not in ("Input", "Result") or not all(parts):
+        raise ValueError(f"字段路径必须以Input.或Result.开头，例如Input.query: {path}")
+    return parts
+
+
+def _get(record, parts):
+    node = record
+    for part in parts:
+        if not isinstance(node, dict) or part not in node:
+            return _MISSING
+        node = node[part]
+    return node
+
+
+def _set(record, parts, value):
+    node = record
+    for part in parts[:-1]:
+        child = node.get(part)
+        if not isinstance(child, dict):
+            child = node[part] = {}
+        node = child
+    node[parts[-1]] = value
+
+
+def _pop(record, parts):
+    parent = _get(record, parts[:-1])
+    if not isinstance(parent, dict) or parts[-1] not in parent:
+        return _MISSING
+    return parent.pop(parts[-1])
+
+
+def coerce_value(value, target: str):
+    """把值转换为目标类型，无法转换时抛出ValueError"""
+    if target == "string":
+        if isinstance(value, str):
+            return value
+        if value is None:
+            return ""
+        if isinstance(value, (dict, list, bool)):
+            return json.dumps(value, ensure_ascii=False)
+        return str(value)
+    if target in ("integer", "number"):
+        if isinstance(value, bool):
+            return int(value)
+        if isinstance(value, (int, float)):
+            number = value
+        elif isinstance(value, str) and value.strip():
+            text = value.strip()
+            try:
+                number = int(text) if text.lstrip("+-").isdigit() else float(text)
+            except ValueError:
+                raise ValueError(f"无法把{value!r}转换为{target}")
+        else:
+            raise ValueError(f"无法把{type(value).__name__}转换为{target}")
+        if target == "integer":
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError(f"{value}不是整数")
+            return int(number)
+        return number
+    if target == "boolean":
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, (int, float)) and value in (0, 1):
+            return bool(value)
+        if isinstance(value, str) and value.strip().lower() in ("true", "false", "1", "0", "yes", "no", "是", "否"):
+            return value.strip().lower() in ("true", "1", "yes", "是")
+        raise ValueError(f"无法把{value!r}转换为boolean")
+    if target == "array":
+        if isinstance(value, list):
+            return value
+        if value is None or value == "":
+            return []
+        if isinstance(value, str):
+            try:
+                parsed = json.loads(value)
+            except ValueError:
+                parsed = None
+            if isinstance(parsed, list):
+                return parsed
+        return [value]
+    if target == "object":
+        if isinstance(value, dict):
+            return value
+        if value is None or value == "":
+            return {}
+        if isinstance(value, str):
+            try:
+                parsed = json.loads(value)
+            except ValueError:
+                parsed = None
+            if isinstance(parsed, dict):
+                return parsed
+        raise ValueError(f"无法把{type(value).__name__}转换为object")
+    raise ValueError(f"不支持的目标类型: {target}")
+
+
+class MigrationPlan:
+    """声明式的数据迁移规则
+
+    spec格式(字段路径以Input.或Result.开头，可以用.访问嵌套字段)：
+        {
+            "rename": {"Input.query": "Input.current_query"},   # 重命名字段
+            "drop": ["Input.search_results"],                   # 删除字段
+            "defaults": {"Result.response": ""},                # 缺失字段的默认值
+            "coerce": {"Input.env": "object"}                   # 类型转换: string/integer/number/boolean/array/object
+        }
+    按 rename -> drop -> defaults -> coerce 的顺序应用。规则是幂等的，对已迁移的数据再次执行不会改变结果，
+    因此迁移中途中断后可以直接重新执行。
+    """
+
+    def __init__(self, spec: Dict[str, Any]):
+        unknown = set(spec) - {"rename", "drop", "defaults", "coerce"}
+        if unknown:
+            raise ValueError(f"不支持的迁移规则: {', '.join(sorted(unknown))}")
+        self.spec = spec
+        self.renames = [(_split_path(src), _split_path(dst)) for src, dst in spec.get("rename", {}).items()]
+        self.drops = [_split_path(path) for path in spec.get("drop", [])]
+        self.defaults = [(_split_path(path), value) for path, value in spec.get("defaults", {}).items()]
+        self.coercions = []
+        for path, target in spec.get("coerce", {}).items():
+            if target not in ("string", "integer", "number", "boolean", "array", "object"):
+                raise ValueError(f"不支持的目标类型: {target}")
+            self.coercions.append((_split_path(path), target))
+
+    @property
+    def empty(self) -> bool:
+        return not (self.renames or self.drops or self.defaults or self.coercions)
+
+    def apply(self, record) -> Tuple[bool, List[str]]:
+        """原地迁移一条数据，返回(是否有改动, 类型转换失败的信息列表)"""
+        if not isinstance(record, dict):
+            return False, []
+        changed = False
+        failures = []
+        for src, dst in self.renames:
+            value = _pop(record, src)
+            if value is _MISSING:
+                continue
+            # 目标字段已存在时保留目标字段的值
+            if _get(record, dst) is _MISSING:
+                _set(record, dst, value)
+            changed = True
+        for parts in self.drops:
+            if _pop(record, parts) is not _MISSING:
+                changed = True
+        for parts, value in self.defaults:
+            if _get(record, parts) is _MISSING:
+                # 默认值可能是可变对象，每条数据使用独立的副本
+                _set(record, parts, json.loads(json.dumps(value)))
+                changed = True
+        for parts, target in self.coercions:
+            value = _get(record, parts)
+            if value is _MISSING:
+                continue
+            try:
+                new_value = coerce_value(value, target)
+            except ValueError as e:
+                failures.append(f"{'.'.join(parts)}: {str(e)}")
+                continue
+            if type(new_value) is not type(value) or new_value != value:
+                _set(record, parts, new_value)
+                changed = True
+        return changed, failures
+
+    def migrate_key(self, key):
+        """迁移操作行中引用的id(Result.id可能被类型转换)"""
+        stub = {"Input": {}, "Result": {"id": key}}
+        for parts, target in self.coercions:
+            if parts == ["Result", "id"]:
+                try:
+                    stub["Result"]["id"] = coerce_value(key, target)
+                except ValueError:
+                    pass
+        return record_key(stub)
+
+
+def _default_for(schema: Dict[str, Any]):
+    schema_type = schema.get("type")
+    if "default" in schema:
+        return schema["default"]
+    if isinstance(schema_type, list):
+        schema_type = schema_type[0] if schema_type else None
+    return {"string": "", "integer": 0, "number": 0, "boolean": False, "array": [], "object": {}}.get(schema_type)
+
+
+def suggest_migration(input_schema: Dict[str, Any], result_schema: Dict[str, Any]) -> Dict[str, Any]:
+    """根据Schema生成迁移规则草稿：必填字段按类型给默认值，声明了单一类型的字段做类型转换
+
+    重命名无法从Schema推断，需要手动补充。
+    """
+    spec = {"rename": {}, "drop": [], "defaults": {}, "coerce": {}}
+    for name, schema in (("Input", input_schema), ("Result", result_schema)):
+        properties = (schema or {}).get("properties", {})
+        for field in (schema or {}).get("required", []):
+            if name == "Result" and field == "id":
+                continue
+            default = _default_for(properties.get(field, {}))
+            spec["defaults"][f"{name}.{field}"] = default
+        for field, field_schema in properties.items():
+            if name == "Result" and field == "id":
+                continue
+            field_type = field_schema.get("type") if isinstance(field_schema, dict) else None
+            if field_type in ("string", "integer", "number", "boolean", "array", "object"):
+                spec["coerce"][f"{name}.{field}"] = field_type
+    return spec
+
+
+class _SplitSummary:
+    """单个数据集的迁移统计
+
+    逐行累加计数，只保留前MIGRATION_SAMPLE_ERRORS条明细，内存占用与数据量无关。
+    统计按迁移的数据行计(set操作行中的数据也算一行)，未压缩的数据文件中同一id可能被计入多次。
+    """
+
+    def __init__(self, validator: Optional[EntryValidator]):
+        self.validator = validator
+        self.lines = 0
+        self.records = 0
+        self.changed = 0
+        self.coerce_failures = 0
+        self.failure_samples = []
+        self.invalid = 0
+        self.invalid_samples = []
+        self.error_counts = {}
+
+    def record(self, record, changed, failures):
+        self.records += 1
+        if changed:
+            self.changed += 1
+        if failures:
+            self.coerce_failures += 1
+            if len(self.failure_samples) < MIGRATION_SAMPLE_ERRORS:
+                self.failure_samples.append({"id": record_key(record), "errors": failures})
+        if self.validator is None:
+            return
+        errors = self.validator.validate(record)
+        if not errors:
+            return
+        self.invalid += 1
+        count_errors(self.error_counts, errors)
+        if len(self.invalid_samples) < MIGRATION_SAMPLE_ERRORS:
+            self.invalid_samples.append({"id": record_key(record), "errors": errors})
+
+    def report(self):
+        return {
+            "lines": self.lines,
+            "records": self.records,
+            "changed": self.changed,
+            "coerce_failures": self.coerce_failures,
+            "coerce_failure_samples": self.failure_samples,
+            "invalid": self.invalid,
+            "invalid_samples": self.invalid_samples,
+            "summary": top_errors(self.error_counts),
+        }
+
+
+class _null_writer:
+    """数据文件不存在时占位的上下文管理器"""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _migrate_lines(path, plan, summary, out=None, progress=None):
+    """逐行迁移一个JSONL文件(数据行和set操作行中的数据都会迁移)，写入out；out为None时只统计"""
+    for obj in iter_jsonl(path):
+        summary.lines += 1
+        if OP_KEY in obj:
+            if "id" in obj:
+                obj["id"] = plan.migrate_key(obj["id"])
+            if obj[OP_KEY] == "set" and isinstance(obj.get("record"), dict):
+                changed, failures = plan.apply(obj["record"])
+                summary.record(obj["record"], changed, failures)
+        else:
+            changed, failures = plan.apply(obj)
+            summary.record(obj, changed, failures)
+        if out is not None:
+            out.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        if progress is not None and summary.lines % MIGRATION_PROGRESS_EVERY == 0:
+            progress(summary.lines)
+
+
+def _migrate_records(records, plan, summary, progress=None):
+    """逐条迁移数据(非JSONL存储，如SQLite)，产出迁移后的数据"""
+    for record in records:
+        summary.lines += 1
+        changed, failures = plan.apply(record)
+        summary.record(record, changed, failures)
+        yield record
+        if progress is not None and summary.lines % MIGRATION_PROGRESS_EVERY == 0:
+            progress(summary.lines)
+
+
+def migrate_project(manager, spec: Dict[str, Any], dry_run=False, validator: Optional[EntryValidator] = None,
+                    callback=None) -> Dict[str, Any]:
+    """按迁移规则流式迁移当前项目的训练集和验证集
+
+    先保存内存中未保存的修改(清空预写日志)，然后逐行读取每个数据文件，迁移后写入同目录的临时文件，
+    两个数据集都写完后才依次rename替换原文件，内存占用与数据量无关。迁移后的数据按validator校验(默认为项目当前Schema)，
+    返回每个数据集的统计和校验汇总。dry_run=True时只读取已保存的数据文件做统计和校验，不写入任何文件
+    (不保存未保存的修改、不转换旧格式文件)。
+    callback(message, progress)接收进度消息和进度值(0-1，按已处理行数估算)。
+    迁移完成后重新加载数据。
+    非JSONL存储(如SQLite)的数据集逐条读取后通过store.rewrite重写，每个数据集单独替换。
+    迁移期间持有两个数据集的写锁(store.lock())，其他会话的写入等待迁移完成后再进行。
+    """
+    if not manager.current_project:
+        raise ValueError("请先选择项目")
+    plan = MigrationPlan(spec)
+    stores = manager.stores
+    if validator is None:
+        validator = manager._validator
+    summaries = {split: _SplitSummary(validator) for split in ("train", "val")}
+    total_lines = sum(stores[split].line_count for split in ("train", "val")) or 1
+    done_lines = [0]
+
+    def make_progress(split):
+        def progress(lines):
+            if callback is not None:
+                name = "训练集" if split == "train" else "验证集"
+                callback(f"{name}: 已处理{lines}行", min(1.0, (done_lines[0] + lines) / total_lines))
+        return progress
+
+    # 从读取到替换文件一直持有两个数据集的写锁，其他会话的追加会等待迁移完成，不会被rename覆盖
+    with manager._write_lock, stores["train"].lock(), stores["val"].lock():
+        if dry_run:
+            if any(dirty["full"] or dirty["updated"] or dirty["deleted"] for dirty in manager._dirty.values()):
+                print("预览只基于已保存的数据文件，未保存的修改不计入")
+        else:
+            manager.save_data()
+            for split in ("train", "val"):
+                stores[split].migrate_legacy()
+        existing = [split for split in ("train", "val") if os.path.exists(stores[split].path)]
+        # 每个数据集按自己的存储引擎处理(两个数据集可能使用不同的存储引擎)
+        jsonl = [split for split in existing if isinstance(stores[split], JsonlSplitStore)]
+        if dry_run:
+            for split in ("train", "val"):
+                if split in jsonl:
+                    _migrate_lines(stores[split].path, plan, summaries[split], progress=make_progress(split))
+                elif split in existing:
+                    for _ in _migrate_records(stores[split].load(), plan, summaries[split], make_progress(split)):
+                        pass
+                elif isinstance(stores[split], JsonlSplitStore) and os.path.exists(stores[split].legacy_path):
+                    # 旧格式文件只读取，不转换
+                    with open(stores[split].legacy_path, 'r', encoding='utf-8') as f:
+                        legacy = json.load(f)
+                    for _ in _migrate_records(legacy, plan, summaries[split], make_progress(split)):
+                        pass
+                done_lines[0] += summaries[split].lines
+        else:
+            for split in existing:
+                if split not in jsonl:
+                    stores[split].rewrite(_migrate_records(stores[split].load(), plan, summaries[split],
+                                                           make_progress(split)))
+                    done_lines[0] += summaries[split].lines
+            # JSONL数据集都写入临时文件后才替换原文件(嵌套的atomic_open退出时依次rename)
+            with atomic_open(stores["train"].path) if "train" in jsonl else _null_writer() as train_out, \
+                    atomic_open(stores["val"].path) if "val" in jsonl else _null_writer() as val_out:
+                for split, out in (("train", train_out), ("val", val_out)):
+                    if split in jsonl:
+                        _migrate_lines(stores[split].path, plan, summaries[split], out, make_progress(split))
+                        done_lines[0] += summaries[split].lines
+            manager.load_data()
+
+    report = {split: summary.report() for split, summary in summaries.items()}
+    report["dry_run"] = dry_run
+    if callback:
+        callback("迁移预览完成" if dry_run else "迁移完成", 1.0)
+    print(f"{'预览' if dry_run else '完成'}数据迁移: 训练集{report['train']['lines']}行/验证集{report['val']['lines']}行，"
+          f"改动{report['train']['changed'] + report['val']['changed']}条，"
+          f"不符合Schema {report['train']['invalid'] + report['val']['invalid']}条")
+    return report
+
@@ -0,0 +1,473 @@
+import re
+import json
+import math
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 校验函数：合法时返回None，否则返回[(相对路径, 错误信息), ...]
+Check = Callable[[Any], Optional[List[Tuple[tuple, str]]]]
+
+# 只影响文档、不参与校验的关键字
+_ANNOTATION_KEYWORDS = {"$schema", "$id", "$comment", "title", "description", "default", "examples", "format",
+                        "readOnly", "writeOnly", "deprecated"}
+# 支持的校验关键字
+_SUPPORTED_KEYWORDS = {"type", "enum", "const", "properties", "required", "additionalProperties", "items",
+                       "minItems", "maxItems", "uniqueItems", "minLength", "maxLength", "pattern",
+                       "minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum", "multipleOf",
+                       "minProperties", "maxProperties", "anyOf", "oneOf", "allOf", "not"}
+
+_TYPE_CHECKS = {
+    "string": lambda v: type(v) is str,
+    # JSON中的1.0也是整数；bool是int的子类，需要用type排除
+    "integer": lambda v: type(v) is int or (type(v) is float and v.is_integer()),
+    "number": lambda v: type(v) is int or type(v) is float,
+    "boolean": lambda v: type(v) is bool,
+    "array": lambda v: type(v) is list,
+    "object": lambda v: type(v) is dict,
+    "null": lambda v: v is None,
+}
+_TYPE_NAMES = {str: "string", int: "integer", float: "number", bool: "boolean", list: "array", dict: "object",
+               type(None): "null"}
+
+# 每条记录最多保留的错误数
+MAX_ERRORS_PER_RECORD = 10
+
+
+class SchemaError(ValueError):
+    """Schema本身不合法(结构错误、取值类型错误等)"""
+
+
+def _type_name(value) -> str:
+    return _TYPE_NAMES.get(type(value), type(value).__name__)
+
+
+def _is_number(value) -> bool:
+    return type(value) is int or type(value) is float
+
+
+def _fail(message):
+    return [((), message)]
+
+
+def _prefix(key, errors):
+    return [((key,) + path, message) for path, message in errors]
+
+
+def _combine(checks: List[Check]) -> Optional[Check]:
+    """把多个校验函数合并为一个；没有需要校验的内容时返回None"""
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(value):
+        errors = None
+        for check in checks:
+            result = check(value)
+            if result:
+                if errors is None:
+                    errors = []
+                errors.extend(result)
+        return errors
+
+    return check_all
+
+
+def _compile_type(types):
+    tests = [_TYPE_CHECKS[name] for name in types]
+    expected = "/".join(types)
+    if len(tests) == 1:
+        test = tests[0]
+        return lambda value: None if test(value) else _fail(f"类型应为{expected}，实际为{_type_name(value)}")
+    return lambda value: None if any(t(value) for t in tests) else _fail(
+        f"类型应为{expected}，实际为{_type_name(value)}")
+
+
+def _compile_object(schema, where, ignored):
+    checks = []
+    properties = schema.get("properties", {})
+    if not isinstance(properties, dict):
+        raise SchemaError(f"{where}: properties必须是对象")
+    compiled_props = []
+    for key, sub_schema in properties.items():
+        sub_check = _compile(sub_schema, f"{where}.{key}", ignored)
+        if sub_check is not None:
+            compiled_props.append((key, sub_check))
+    required = schema.get("required", [])
+    if not isinstance(required, list):
+        raise SchemaError(f"{where}: required必须是数组")
+    additional = schema.get("additionalProperties", True)
+    additional_check = None
+    if isinstance(additional, dict):
+        additional_check = _compile(additional, f"{where}.additionalProperties", ignored)
+    elif additional is not True and additional is not False:
+        raise SchemaError(f"{where}: additionalProperties必须是布尔值或Schema")
+    known = set(properties)
+
+    if compiled_props or required:
+        def check_properties(value):
+            if type(value) is not dict:
+                return None
+            errors = None
+            for key in required:
+                if key not in value:
+                    if errors is None:
+                        errors = []
+                    errors.append(((key,), "缺少必填字段"))
+            for key, sub_check in compiled_props:
+                if key in value:
+                    result = sub_check(value[key])
+                    if result:
+                        if errors is None:
+                            errors = []
+                        errors.extend(_prefix(key, result))
+            return errors
+
+        checks.append(check_properties)
+
+    if additional is False:
+        def check_no_additional(value):
+            if type(value) is not dict:
+                return None
+            extra = [key for key in value if key not in known]
+            return [((key,), "不允许的额外字段") for key in extra] or None
+
+        checks.append(check_no_additional)
+    elif additional_check is not None:
+        def check_additional(value):
+            if type(value) is not dict:
+                return None
+            errors = []
+            for key, item in value.items():
+                if key not in known:
+                    result = additional_check(item)
+                    if result:
+                        errors.extend(_prefix(key, result))
+            return errors or None
+
+        checks.append(check_additional)
+
+    min_props, max_props = schema.get("minProperties"), schema.get("maxProperties")
+    if min_props is not None or max_props is not None:
+        def check_size(value):
+            if type(value) is not dict:
+                return None
+            if min_props is not None and len(value) < min_props:
+                return _fail(f"字段数不能少于{min_props}")
+            if max_props is not None and len(value) > max_props:
+                return _fail(f"字段数不能多于{max_props}")
+            return None
+
+        checks.append(check_size)
+    return checks
+
+
+def _compile_array(schema, where, ignored):
+    checks = []
+    items = schema.get("items")
+    if items is not None and not isinstance(items, (dict, bool)):
+        # 元组形式的items按注解处理，不参与校验
+        ignored.append(f"{where}.items")
+        items = None
+    if items is not None:
+        item_check = _compile(items, f"{where}[]", ignored)
+        if item_check is not None:
+            def check_items(value):
+                if type(value) is not list:
+                    return None
+                errors = None
+                for index, item in enumerate(value):
+                    result = item_check(item)
+                    if result:
+                        if errors is None:
+                            errors = []
+                        errors.extend(_prefix(index, result))
+                return errors
+
+            checks.append(check_items)
+    min_items, max_items = schema.get("minItems"), schema.get("maxItems")
+    unique = schema.get("uniqueItems", False)
+    if min_items is not None or max_items is not None or unique:
+        def check_size(value):
+            if type(value) is not list:
+                return None
+            if min_items is not None and len(value) < min_items:
+                return _fail(f"元素个数不能少于{min_items}")
+            if max_items is not None and len(value) > max_items:
+                return _fail(f"元素个数不能多于{max_items}")
+            if unique and len({json.dumps(item, sort_keys=True) for item in value}) != len(value):
+                return _fail("元素不能重复")
+            return None
+
+        checks.append(check_size)
+    return checks
+
+
+def _compile_string(schema, where):
+    min_length, max_length = schema.get("minLength"), schema.get("maxLength")
+    pattern = schema.get("pattern")
+    if min_length is None and max_length is None and pattern is None:
+        return []
+    try:
+        regex = re.compile(pattern) if pattern is not None else None
+    except re.error as e:
+        raise SchemaError(f"{where}: pattern不是合法的正则表达式: {e}")
+
+    def check_string(value):
+        if type(value) is not str:
+            return None
+        if min_length is not None and len(value) < min_length:
+            return _fail(f"长度不能小于{min_length}")
+        if max_length is not None and len(value) > max_length:
+            return _fail(f"长度不能大于{max_length}")
+        if regex is not None and not regex.search(value):
+            return _fail(f"不匹配模式 {pattern}")
+        return None
+
+    return [check_string]
+
+
+def _is_multiple(value, multiple) -> bool:
+    """value是否为multiple的整数倍；浮点数按商与最近整数的相对误差判断，避免0.3/0.1之类的舍入误差"""
+    if type(value) is int and type(multiple) is int:
+        return value % multiple == 0
+    quotient = value / multiple
+    if math.isinf(quotient) or math.isnan(quotient):
+        return False
+    return math.isclose(quotient, round(quotient), rel_tol=1e-9, abs_tol=1e-9)
+
+
+def _compile_number(schema, where):
+    bounds = {key: schema[key] for key in ("minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum", "multipleOf")
+              if key in schema}
+    if not bounds:
+        return []
+    for key, bound in bounds.items():
+        if not _is_number(bound):
+            raise SchemaError(f"{where}: {key}必须是数字")
+    minimum, maximum = bounds.get("minimum"), bounds.get("maximum")
+    ex_minimum, ex_maximum = bounds.get("exclusiveMinimum"), bounds.get("exclusiveMaximum")
+    multiple = bounds.get("multipleOf")
+    if multiple is not None and multiple <= 0:
+        raise SchemaError(f"{where}: multipleOf必须大于0")
+
+    def check_number(value):
+        if not _is_number(value):
+            return None
+        if minimum is not None and value < minimum:
+            return _fail(f"不能小于{minimum}")
+        if maximum is not None and value > maximum:
+            return _fail(f"不能大于{maximum}")
+        if ex_minimum is not None and value <= ex_minimum:
+            return _fail(f"必须大于{ex_minimum}")
+        if ex_maximum is not None and value >= ex_maximum:
+            return _fail(f"必须小于{ex_maximum}")
+        if multiple is not None and not _is_multiple(value, multiple):
+            return _fail(f"必须是{multiple}的倍数")
+        return None
+
+    return [check_number]
+
+
+def _compile_combinators(schema, where, ignored):
+    checks = []
+    for keyword in ("anyOf", "oneOf", "allOf"):
+        if keyword not in schema:
+            continue
+        options = schema[keyword]
+        if not isinstance(options, list) or not options:
+            raise SchemaError(f"{where}: {keyword}必须是非空数组")
+        compiled = [_compile(option, f"{where}.{keyword}[{i}]", ignored) or (lambda value: None)
+                    for i, option in enumerate(options)]
+        if keyword == "allOf":
+            checks.extend(compiled)
+        elif keyword == "anyOf":
+            checks.append(lambda value, compiled=compiled: None if any(not c(value) for c in compiled)
+                          else _fail("不满足anyOf中的任何一个Schema"))
+        else:
+            def check_one_of(value, compiled=compiled):
+                matched = sum(1 for c in compiled if not c(value))
+                return None if matched == 1 else _fail(f"应恰好满足oneOf中的一个Schema，实际满足{matched}个")
+
+            checks.append(check_one_of)
+    if "not" in schema:
+        negated = _compile(schema["not"], f"{where}.not", ignored) or (lambda value: None)
+        checks.append(lambda value: _fail("不应满足not中的Schema") if not negated(value) else None)
+    return checks
+
+
+def _compile(schema, where="$", ignored=None) -> Optional[Check]:
+    """把Schema编译为校验函数；任何值都合法时返回None
+
+    不支持的关键字按注解处理(不参与校验)，其位置追加到ignored中。
+    """
+    if ignored is None:
+        ignored = []
+    if schema is True:
+        return None
+    if schema is False:
+        return lambda value: _fail("Schema不允许任何值")
+    if not isinstance(schema, dict):
+        raise SchemaError(f"{where}: Schema必须是对象")
+    for keyword in schema:
+        if keyword not in _SUPPORTED_KEYWORDS and keyword not in _ANNOTATION_KEYWORDS:
+            ignored.append(f"{where}.{keyword}")
+
+    checks = []
+    if "type" in schema:
+        types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+        for name in types:
+            if name not in _TYPE_CHECKS:
+                raise SchemaError(f"{where}: 未知的类型 {name}")
+        checks.append(_compile_type(types))
+    if "enum" in schema:
+        options = schema["enum"]
+        if not isinstance(options, list):
+            raise SchemaError(f"{where}: enum必须是数组")
+        keys = {json.dumps(option, sort_keys=True) for option in options}
+        checks.append(lambda value: None if json.dumps(value, sort_keys=True) in keys
+                      else _fail(f"取值应为{json.dumps(options, ensure_ascii=False)}之一"))
+    if "const" in schema:
+        const_key = json.dumps(schema["const"], sort_keys=True)
+        checks.append(lambda value: None if json.dumps(value, sort_keys=True) == const_key
+                      else _fail(f"取值应为{json.dumps(schema['const'], ensure_ascii=False)}"))
+    checks.extend(_compile_object(schema, where, ignored))
+    checks.extend(_compile_array(schema, where, ignored))
+    checks.extend(_compile_string(schema, where))
+    checks.extend(_compile_number(schema, where))
+    checks.extend(_compile_combinators(schema, where, ignored))
+    return _combine(checks)
+
+
+def format_path(path) -> str:
+    """把("history", 0, "role")格式化为 history[0].role"""
+    text = ""
+    for part in path:
+        text += f"[{part}]" if isinstance(part, int) else (f".{part}" if text else str(part))
+    return text
+
+
+class CompiledSchema:
+    """编译后的JSON Schema(支持常用关键字子集)
+
+    编译时把Schema转换为嵌套的校验函数，校验合法数据时不构造路径和错误信息；
+    不支持的关键字(如$ref、patternProperties)按注解处理、不参与校验，编译时输出警告，
+    其位置记录在ignored_keywords中；Schema结构不合法时报SchemaError。
+    """
+
+    def __init__(self, schema: Dict[str, Any]):
+        self.schema = schema
+        self.ignored_keywords: List[str] = []
+        self._check = _compile(schema or {}, "$", self.ignored_keywords)
+        if self.ignored_keywords:
+            print(f"警告: Schema中不支持的关键字不参与校验: {', '.join(self.ignored_keywords)}")
+
+    @property
+    def trivial(self) -> bool:
+        """Schema为空、任何值都合法"""
+        return self._check is None
+
+    def errors(self, value) -> List[Tuple[tuple, str]]:
+        """返回[(路径, 错误信息), ...]，合法时返回空列表"""
+        if self._check is None:
+            return []
+        return self._check(value) or []
+
+    def is_valid(self, value) -> bool:
+        return self._check is None or not self._check(value)
+
+
+_compiled_cache: Dict[str, CompiledSchema] = {}
+_compiled_cache_lock = threading.Lock()
+
+
+def compile_schema(schema: Optional[Dict[str, Any]]) -> CompiledSchema:
+    """编译Schema，相同内容的Schema在进程内只编译一次"""
+    key = json.dumps(schema or {}, sort_keys=True, ensure_ascii=False)
+    with _compiled_cache_lock:
+        compiled = _compiled_cache.get(key)
+    if compiled is None:
+        compiled = CompiledSchema(schema or {})
+        with _compiled_cache_lock:
+            _compiled_cache[key] = compiled
+    return compiled
+
+
+class EntryValidator:
+    """按项目的input_schema/result_schema校验数据条目
+
+    Result中的id由数据管理器统一分配(整数)，不按Schema校验。
+    """
+
+    def __init__(self, input_schema: Optional[Dict[str, Any]], result_schema: Optional[Dict[str, Any]]):
+        self.input = compile_schema(input_schema)
+        self.result = compile_schema(_without_id(result_schema))
+
+    @property
+    def trivial(self) -> bool:
+        return self.input.trivial and self.result.trivial
+
+    @property
+    def ignored_keywords(self) -> List[str]:
+        """不参与校验的不支持关键字位置，如 Input.$ref"""
+        return ([f"Input{path[1:]}" for path in self.input.ignored_keywords]
+                + [f"Result{path[1:]}" for path in self.result.ignored_keywords])
+
+    def validate(self, entry) -> List[str]:
+        """返回条目的错误信息列表，合法时返回空列表"""
+        if not isinstance(entry, dict):
+            return ["条目不是JSON对象"]
+        errors = []
+        for name, compiled in (("Input", self.input), ("Result", self.result)):
+            if name not in entry:
+                errors.append(f"{name}: 缺少字段")
+                continue
+            for path, message in compiled.errors(entry[name]):
+                errors.append(f"{format_path((name,) + path)}: {message}")
+        return errors[:MAX_ERRORS_PER_RECORD]
+
+    def validate_batch(self, entries: List[Dict[str, Any]]) -> Dict[int, List[str]]:
+        """批量校验，返回{位置: 错误信息列表}，只包含不合法的条目"""
+        if self.trivial:
+            return {position: ["条目不是JSON对象"] for position, entry in enumerate(entries)
+                    if not isinstance(entry, dict)}
+        input_check, result_check = self.input._check, self.result._check
+        invalid = {}
+        for position, entry in enumerate(entries):
+            # 快速路径：合法条目只执行校验函数，不构造错误信息
+            if (type(entry) is dict and "Input" in entry and "Result" in entry
+                    and (input_check is None or not input_check(entry["Input"]))
+                    and (result_check is None or not result_check(entry["Result"]))):
+                continue
+            invalid[position] = self.validate(entry)
+        return invalid
+
+
+def _without_id(schema):
+    if not isinstance(schema, dict) or "id" not in schema.get("properties", {}):
+        return schema
+    schema = dict(schema)
+    schema["properties"] = {key: value for key, value in schema["properties"].items() if key != "id"}
+    if "required" in schema:
+        schema["required"] = [key for key in schema["required"] if key != "id"]
+    return schema
+
+
+def count_errors(counts: Dict[str, int], errors: List[str]):
+    """把一条记录的错误按错误类型(去掉数组下标)累加到counts中，用于流式统计"""
+    for error in errors:
+        key = re.sub(r"\[\d+\]", "[]", error)
+        counts[key] = counts.get(key, 0) + 1
+
+
+def top_errors(counts: Dict[str, int], top: int = 20) -> List[Tuple[str, int]]:
+    """返回counts中最常见的top种错误类型"""
+    return sorted(counts.items(), key=lambda item: -item[1])[:top]
+
+
+def summarize_errors(invalid: Dict[int, List[str]], top: int = 20) -> List[Tuple[str, int]]:
+    """按错误类型(去掉数组下标)统计出现次数，返回最常见的top种"""
+    counts = {}
+    for errors in invalid.values():
+        count_errors(counts, errors)
+    return top_errors(counts, top)
@@ -0,0 +1,440 @@
+import os
+import re
+import json
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from indexes import extract_tag_text, required_literals
+from lazy_records import LazyRecordList
+from storage import (NO_KEY, COMPACT_MIN_STALE_LINES, JsonlSplitStore, _copy_mode, _fsync_dir, file_signature,
+                     split_lock)
+
+# 支持的存储引擎
+STORAGE_BACKENDS = ("jsonl", "sqlite")
+# 为Result中的这些字段建立生成列和索引，按字段过滤(filter_by_field)时走索引
+SQLITE_INDEXED_FIELDS = ("intent",)
+# 批量读取时每条SQL语句包含的条数(不超过SQLite的参数个数上限)
+SQLITE_FETCH_BATCH = 500
+# 写入时等待其他连接释放锁的秒数
+SQLITE_BUSY_TIMEOUT = 30
+# 可以直接拼入SQL的字段名
+_FIELD_NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    pos INTEGER NOT NULL,
+    live INTEGER NOT NULL DEFAULT 1,
+    input TEXT,
+    result TEXT,
+    record TEXT,
+    rid GENERATED ALWAYS AS (json_extract(result, '$.id')) VIRTUAL
+);
+CREATE INDEX IF NOT EXISTS records_live_pos ON records(pos) WHERE live = 1;
+CREATE INDEX IF NOT EXISTS records_live_rid ON records(rid, pos) WHERE live = 1;
+CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(tag_text, body, tokenize = 'trigram');
+"""
+
+
+def _encode(record) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """拆分为(input, result, record)三列；数据正好是 {"Input", "Result"} 时record列为空"""
+    input_text = json.dumps(record["Input"], ensure_ascii=False) if "Input" in record else None
+    result_text = json.dumps(record["Result"], ensure_ascii=False) if "Result" in record else None
+    if list(record) == ["Input", "Result"]:
+        return input_text, result_text, None
+    return input_text, result_text, json.dumps(record, ensure_ascii=False)
+
+
+def _decode(input_text, result_text, record_text) -> Dict[str, Any]:
+    if record_text is not None:
+        return json.loads(record_text)
+    return {"Input": json.loads(input_text), "Result": json.loads(result_text)}
+
+
+def _fts_phrase(text: str) -> str:
+    """FTS5查询中的短语(双引号转义)"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _field_column(field: str) -> str:
+    return f"f_{field}"
+
+
+def _ensure_schema(conn):
+    conn.executescript(_SCHEMA)
+    columns = {row[1] for row in conn.execute("PRAGMA table_xinfo(records)")}
+    for field in SQLITE_INDEXED_FIELDS:
+        column = _field_column(field)
+        if column not in columns:
+            conn.execute(f"ALTER TABLE records ADD COLUMN {column} "
+                         f"GENERATED ALWAYS AS (json_extract(result, '$.{field}')) VIRTUAL")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS records_{column} ON records({column})")
+
+
+def _insert(conn, records: Iterable[Dict[str, Any]], start_pos: int) -> int:
+    """从start_pos开始依次追加数据，返回写入条数(需要在写事务中调用)"""
+    # 在写事务中行号不会被其他连接占用，直接指定行号，数据表和全文索引都可以批量写入
+    next_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM records").fetchone()[0]
+    count = 0
+    batch = []
+    for record in records:
+        batch.append((next_seq + count, start_pos + count, record))
+        count += 1
+        if len(batch) >= SQLITE_FETCH_BATCH:
+            _insert_batch(conn, batch)
+            batch = []
+    if batch:
+        _insert_batch(conn, batch)
+    return count
+
+
+def _insert_batch(conn, batch):
+    conn.executemany("INSERT INTO records(seq, pos, input, result, record) VALUES (?, ?, ?, ?, ?)",
+                     [(seq, pos, *_encode(record)) for seq, pos, record in batch])
+    conn.executemany("INSERT INTO records_fts(rowid, tag_text, body) VALUES (?, ?, ?)",
+                     [(seq, extract_tag_text(record), json.dumps(record, ensure_ascii=False))
+                      for seq, _, record in batch])
+
+
+class SqliteSplitStore:
+    """单个数据集(train/val)的SQLite存储，接口与JsonlSplitStore相同
+
+    数据保存在 <split>_data.sqlite：Input/Result为JSON列，Result.id和SQLITE_INDEXED_FIELDS中的字段为带索引的生成列，
+    FTS5(trigram)表保存标签文本和序列化文本，供标签/正则过滤预筛。
+    与JSONL存储一样，已写入的行内容不再改变：修改是把原行标记为失效并插入沿用原顺序(pos)的新行，删除只标记失效，
+    因此按需读取的数据列表(SqliteRecordList)不需要长事务也能读到一致的内容。
+    失效行过多时重写(压缩)，重写写入同目录的临时数据库后rename替换，已打开的连接仍读取旧文件。
+    使用回滚日志模式(不使用WAL)，写入提交后数据库文件的大小/修改时间随之变化，可以作为版本签名。
+    """
+
+    def __init__(self, data_dir: str, split: str):
+        self.data_dir = data_dir
+        self.split = split
+        self.path = os.path.join(data_dir, f"{split}_data.sqlite")
+        # 与JsonlSplitStore保持相同的属性，SQLite存储没有旧格式文件
+        self.legacy_path = os.path.join(data_dir, f"{split}_data.json")
+        # 总行数(含失效行)与有效数据条数，用于判断是否需要压缩
+        self.line_count = 0
+        self.live_count = 0
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def migrate_legacy(self) -> bool:
+        return False
+
+    def signature(self) -> Tuple[int, Optional[int]]:
+        """数据库文件的(字节数, 修改时间ns)，每次提交写入都会改变它"""
+        return file_signature(self.path)
+
+    def lock(self):
+        """数据集的写锁(见storage.split_lock)，与JSONL存储共用同一个锁文件"""
+        return split_lock(self.data_dir, self.split)
+
+    def is_large(self) -> bool:
+        # SQLite存储总是按需读取(见load)
+        return False
+
+    @contextmanager
+    def _transaction(self, path=None):
+        path = path or self.path
+        conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+        try:
+            _ensure_schema(conn)
+            conn.execute("BEGIN IMMEDIATE")
+            before = os.stat(path).st_mtime_ns
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        # 修改时间的精度有限，同一时钟周期内的两次提交大小可能相同，保证每次提交后修改时间都增大，签名随之变化
+        stat = os.stat(path)
+        if stat.st_mtime_ns <= before:
+            os.utime(path, ns=(stat.st_atime_ns, before + 1))
+
+    def create(self):
+        """创建空的数据库文件"""
+        with self._transaction():
+            pass
+        self.line_count = 0
+        self.live_count = 0
+
+    def _count(self):
+        if not self.exists():
+            self.line_count = self.live_count = 0
+            return
+        conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT)
+        try:
+            self.line_count, self.live_count = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(live), 0) FROM records").fetchone()
+        finally:
+            conn.close()
+
+    def load(self) -> "SqliteRecordList":
+        """按有效数据的顺序读取各行的位置和id，数据本身在访问时才读取"""
+        if not self.exists():
+            self.create()
+        records = SqliteRecordList(self.path)
+        self._count()
+        return records
+
+    def append(self, records: List[Dict[str, Any]]):
+        """将新数据追加到数据集末尾"""
+        if not records:
+            return
+        with self.lock(), self._transaction() as conn:
+            start = conn.execute("SELECT COALESCE(MAX(pos), 0) + 1 FROM records WHERE live = 1").fetchone()[0]
+            count = _insert(conn, records, start)
+        self.line_count += count
+        self.live_count += count
+
+    def write_updates(self, updates: List[Tuple[Any, Dict[str, Any]]], deletes: Optional[List[Any]] = None):
+        """修改和删除已有数据(语义同JsonlSplitStore.write_updates：删除先于修改，同一id以顺序靠前的条目为准)"""
+        deletes = deletes or []
+        if not updates and not deletes:
+            return
+        first_live = "SELECT seq, pos FROM records WHERE live = 1 AND rid = ? ORDER BY pos LIMIT 1"
+        with self.lock(), self._transaction() as conn:
+            for key in deletes:
+                row = conn.execute(first_live, (key,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE records SET live = 0 WHERE seq = ?", (row[0],))
+                    self.live_count -= 1
+            for key, record in updates:
+                row = conn.execute(first_live, (key,)).fetchone()
+                if row is None:
+                    # 找不到原条目时按新增处理，避免丢失数据
+                    start = conn.execute("SELECT COALESCE(MAX(pos), 0) + 1 FROM records WHERE live = 1").fetchone()[0]
+                    _insert(conn, [record], start)
+                    self.live_count += 1
+                else:
+                    conn.execute("UPDATE records SET live = 0 WHERE seq = ?", (row[0],))
+                    _insert(conn, [record], row[1])
+                self.line_count += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """当前数据库的统计信息(需要先load，之后由各写入方法维护)"""
+        size, mtime_ns = self.signature()
+        return {"count": self.live_count, "lines": self.line_count, "bytes": size, "mtime_ns": mtime_ns}
+
+    def needs_compaction(self) -> bool:
+        """失效行是否多到需要压缩"""
+        stale = self.line_count - self.live_count
+        return stale > COMPACT_MIN_STALE_LINES and stale > self.live_count
+
+    def rewrite(self, records: Iterable[Dict[str, Any]]):
+        """用给定数据重写整个数据库(压缩)：写入同目录的临时数据库，成功后rename替换"""
+        with self.lock():
+            self._rewrite(records)
+
+    def _rewrite(self, records: Iterable[Dict[str, Any]]):
+        fd, tmp_path = tempfile.mkstemp(dir=self.data_dir, prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+        os.close(fd)
+        try:
+            _copy_mode(tmp_path, self.path)
+            with self._transaction(tmp_path) as conn:
+                count = _insert(conn, records, 1)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            for path in (tmp_path, tmp_path + "-journal"):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        _fsync_dir(self.data_dir)
+        self.line_count = count
+        self.live_count = count
+
+
+class SqliteRecordList(LazyRecordList):
+    """按需读取的SQLite数据列表，接口同LazyRecordList
+
+    只在内存中保存有效数据按顺序排列的行号(seq)和整数id，访问时按行号读取(批量访问时每次读取SQLITE_FETCH_BATCH条)。
+    行内容写入后不再改变(见SqliteSplitStore)，所以读取到的总是打开时的数据；copy()得到的列表共享只读连接。
+    标签、正则和字段过滤在数据库中预筛(match_tags/match_regex/match_field)，内存中新增或修改的条目在Python中判断。
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=SQLITE_BUSY_TIMEOUT,
+                                     check_same_thread=False)
+        # 多个会话的列表共享同一个连接
+        self._lock = threading.Lock()
+        with self._lock:
+            rows = self._conn.execute("SELECT seq, rid FROM records WHERE live = 1 ORDER BY pos")
+            for seq, rid in rows:
+                self._refs.append(seq * 2)
+                if type(rid) is int and NO_KEY < rid < 2 ** 63:
+                    self._keys.append(rid)
+                else:
+                    self._keys.append(NO_KEY)
+                    if rid is not None:
+                        self._other_keys[seq * 2] = rid
+
+    def _fetch(self, seqs: List[int], sql: str) -> Dict[int, Any]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(seqs), SQLITE_FETCH_BATCH):
+                batch = seqs[start:start + SQLITE_FETCH_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                for row in self._conn.execute(sql.format(placeholders), batch):
+                    found[row[0]] = row[1:]
+        return found
+
+    def _load_many(self, positions) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """按顺序批量读取多个位置的数据"""
+        positions = list(positions)
+        for start in range(0, len(positions), SQLITE_FETCH_BATCH):
+            batch = positions[start:start + SQLITE_FETCH_BATCH]
+            seqs = [self._refs[pos] >> 1 for pos in batch if self._refs[pos] >= 0]
+            rows = self._fetch(seqs, "SELECT seq, input, result, record FROM records WHERE seq IN ({})")
+            for pos in batch:
+                ref = self._refs[pos]
+                yield pos, self._objects[-ref - 1] if ref < 0 else _decode(*rows[ref >> 1])
+
+    def _get(self, pos):
+        ref = self._refs[pos]
+        if ref < 0:
+            return self._objects[-ref - 1]
+        with self._lock:
+            row = self._conn.execute("SELECT input, result, record FROM records WHERE seq = ?", (ref >> 1,)).fetchone()
+        return _decode(*row)
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return self.items_at(range(*pos.indices(len(self))))
+        return self._get(pos)
+
+    def __iter__(self):
+        for _, item in self._load_many(range(len(self))):
+            yield item
+
+    def items_at(self, positions) -> List[Dict[str, Any]]:
+        """批量读取多个位置的数据"""
+        return [item for _, item in self._load_many(positions)]
+
+    def iter_texts(self) -> Iterator[Tuple[int, str]]:
+        for start in range(0, len(self), SQLITE_FETCH_BATCH):
+            batch = range(start, min(len(self), start + SQLITE_FETCH_BATCH))
+            seqs = [self._refs[pos] >> 1 for pos in batch if self._refs[pos] >= 0]
+            bodies = self._fetch(seqs, "SELECT rowid, body FROM records_fts WHERE rowid IN ({})")
+            for pos in batch:
+                ref = self._refs[pos]
+                if ref >= 0:
+                    yield pos, bodies[ref >> 1][0]
+                else:
+                    yield pos, json.dumps(self._objects[-ref - 1], ensure_ascii=False)
+
+    def _positions(self, seqs, predicate: Callable[[Dict[str, Any]], bool]) -> List[int]:
+        """数据库中命中的行号集合seqs对应的位置，加上内存中满足predicate的条目的位置"""
+        return [pos for pos, ref in enumerate(self._refs)
+                if (ref >> 1 in seqs if ref >= 0 else predicate(self._objects[-ref - 1]))]
+
+    def match_tags(self, tags: List[str]) -> List[int]:
+        """标签文本(extract_tag_text)中同时包含所有标签的位置
+
+        不少于3个字符的标签先用FTS5 trigram索引预筛，再用instr在小写标签文本上精确判断，结果与逐条子串匹配一致。
+        """
+        tags = [tag.lower() for tag in tags]
+        conditions = ["instr(tag_text, ?) > 0"] * len(tags)
+        params = list(tags)
+        long_tags = [tag for tag in tags if len(tag) >= 3]
+        if long_tags:
+            conditions.insert(0, "records_fts MATCH ?")
+            params.insert(0, " AND ".join(f"tag_text : {_fts_phrase(tag)}" for tag in long_tags))
+        with self._lock:
+            seqs = {row[0] for row in self._conn.execute(
+                f"SELECT rowid FROM records_fts WHERE {' AND '.join(conditions)}", params)}
+        return self._positions(seqs, lambda item: all(tag in extract_tag_text(item) for tag in tags))
+
+    def match_regex(self, regex) -> List[int]:
+        """序列化文本中能匹配正则的位置：用正则中必须出现的字面量在FTS5索引上预筛候选，再对候选执行完整正则"""
+        literals = required_literals(regex)
+        sql = "SELECT rowid, body FROM records_fts"
+        params = []
+        if literals:
+            sql += " WHERE records_fts MATCH ?"
+            params.append(" AND ".join(f"body : {_fts_phrase(literal)}" for literal in literals))
+        with self._lock:
+            seqs = {rowid for rowid, body in self._conn.execute(sql, params) if regex.search(body)}
+        return self._positions(seqs, lambda item: regex.search(json.dumps(item, ensure_ascii=False)) is not None)
+
+    def match_field(self, field: str, value) -> Optional[List[int]]:
+        """Result中字段等于value的位置；SQLITE_INDEXED_FIELDS中的字段使用生成列索引
+
+        字段名不能直接用于SQL或value不是标量时返回None，由调用方逐条判断。
+        """
+        if not _FIELD_NAME.fullmatch(field) or not (value is None or isinstance(value, (str, int, float))):
+            return None
+        column = _field_column(field) if field in SQLITE_INDEXED_FIELDS else f"json_extract(result, '$.{field}')"
+        sql = f"SELECT seq FROM records WHERE {column} IS ?"
+        if isinstance(value, str):
+            # json_extract对对象/数组返回JSON文本，不能与字符串相等
+            sql += f" AND json_type(result, '$.{field}') = 'text'"
+        with self._lock:
+            seqs = {row[0] for row in self._conn.execute(sql, (value,))}
+        return self._positions(seqs, lambda item: isinstance(item.get("Result"), dict)
+                               and item["Result"].get(field) == value)
+
+
+def open_split_store(data_dir: str, split: str):
+    """打开数据集的存储：存在 <split>_data.sqlite 时使用SQLite存储，否则使用JSONL存储"""
+    if os.path.exists(os.path.join(data_dir, f"{split}_data.sqlite")):
+        return SqliteSplitStore(data_dir, split)
+    return JsonlSplitStore(data_dir, split)
+
+
+def storage_backend(data_dir: str) -> str:
+    """项目当前使用的存储引擎"""
+    return "sqlite" if isinstance(open_split_store(data_dir, "train"), SqliteSplitStore) else "jsonl"
+
+
+def migrate_storage(manager, backend: str, callback=None) -> Dict[str, Any]:
+    """把当前项目的数据迁移到另一种存储引擎(jsonl/sqlite)
+
+    先保存未保存的修改，再把每个数据集流式写入新格式；新格式的文件都写好后才把原文件改名为 .bak 备份，
+    中途失败时原数据保持不变。callback(message, progress)接收进度。完成后重新加载数据。
+    """
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"不支持的存储引擎: {backend}")
+    if not manager.current_project:
+        raise ValueError("请先选择项目")
+    report = {"backend": backend, "train": 0, "val": 0}
+    with manager._write_lock:
+        manager.save_data()
+        if storage_backend(manager.data_dir) == backend:
+            return report
+        total = len(manager.train_data) + len(manager.val_data) or 1
+        done = [0]
+
+        def counted(records, split):
+            name = "训练集" if split == "train" else "验证集"
+            for record in records:
+                done[0] += 1
+                report[split] += 1
+                if callback and done[0] % 1000 == 0:
+                    callback(f"{name}: 已迁移{report[split]}条", min(1.0, done[0] / total))
+                yield record
+
+        for split in ("train", "val"):
+            target = SqliteSplitStore(manager.data_dir, split) if backend == "sqlite" else JsonlSplitStore(manager.data_dir, split)
+            target.rewrite(counted(manager.train_data if split == "train" else manager.val_data, split))
+        for split in ("train", "val"):
+            source = manager.stores[split]
+            if os.path.exists(source.path):
+                os.replace(source.path, source.path + ".bak")
+            index_path = getattr(source, "index_path", None)
+            if index_path and os.path.exists(index_path):
+                os.remove(index_path)
+        manager._init_stores()
+        manager.load_data()
+    if callback:
+        callback("迁移完成", 1.0)
+    print(f"已将项目 {manager.current_project} 迁移为{backend}存储: 训练集{report['train']}条, 验证集{report['val']}条")
+    return report
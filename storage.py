@@ -0,0 +1,841 @@
+import os
+import sys
+import json
+import stat
+import time
+import hashlib
+import tempfile
+import threading
+import uuid
+from array import array
+from contextlib import contextmanager
+from typing import List, Dict, Any, Tuple, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows没有fcntl，文件锁只在进程内互斥
+    fcntl = None
+
+# 操作行的标记字段，普通数据行不包含该字段
+OP_KEY = "__op__"
+# 进程的umask：mkstemp创建的临时文件权限固定为0600，新建的文件按它恢复为普通open的权限
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+# 项目元数据文件，保存id分配器等状态
+META_FILE = "meta.json"
+# 过期行数超过该值且超过有效数据条数时自动压缩
+COMPACT_MIN_STALE_LINES = 1000
+# meta.json中保存数据集统计信息(条数、文件大小、修改时间、Schema哈希)的键
+STATS_KEY = "stats"
+# 数据文件超过该大小时按需读取(偏移索引+内存映射，见lazy_records.py)，不再一次性解析全部数据
+LAZY_LOAD_MIN_BYTES = 64 * 1024 * 1024
+# 偏移索引文件的格式版本，格式变化时旧索引自动重建
+INDEX_VERSION = 1
+# 偏移索引中id不是int64整数(或没有id)的占位值
+NO_KEY = -2 ** 63
+# 回放时操作行超过该数量后改用字典查找位置，少量操作直接在键数组上扫描
+INDEX_DICT_MIN_OPS = 64
+
+
+def record_key(record):
+    """获取数据条目在存储中的定位键(Result.id)，无法作为键时返回None"""
+    result = record.get("Result") if isinstance(record, dict) else None
+    if not isinstance(result, dict):
+        return None
+    key = result.get("id")
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _fsync_dir(dir_path):
+    """同步目录项，保证rename在断电后依然生效(部分平台不支持，忽略错误)"""
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _copy_mode(tmp_path: str, path: str):
+    """让替换目标文件的临时文件沿用目标文件的权限，目标不存在时使用umask决定的默认权限"""
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    os.chmod(tmp_path, mode)
+
+
+@contextmanager
+def atomic_open(path: str, mode: str = 'w'):
+    """原子写文件：写入同目录临时文件，成功后fsync并rename覆盖目标文件，失败时删除临时文件"""
+    dir_path = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        _copy_mode(tmp_path, path)
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else 'utf-8') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(dir_path)
+
+
+def atomic_write_text(path: str, text: str):
+    """原子写入文本文件"""
+    with atomic_open(path) as f:
+        f.write(text)
+
+
+def atomic_write_json(path: str, obj: Any):
+    """原子写入JSON文件"""
+    atomic_write_text(path, json.dumps(obj, ensure_ascii=False, indent=2))
+
+
+def iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """逐行读取JSONL文件，只读不写
+
+    文件末尾没有换行符、无法解析的行(崩溃留下的残行，或其他进程正在追加的行)被跳过，
+    由下一次追加写入在文件锁内修复(见repair_jsonl_tail)；缺少换行符的完整末行照常返回。
+    文件中间的损坏行仍然抛出异常。
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        for raw in f:
+            if not raw.strip():
+                continue
+            try:
+                obj = json.loads(raw)
+            except ValueError:
+                if raw.endswith(b"\n"):
+                    raise
+                break
+            yield obj
+
+
+def repair_jsonl_tail(path: str):
+    """修复文件末尾(丢弃未写完的残行，给缺少换行符的完整末行补上换行符)，只读取最后一行
+
+    会截断文件，只能在持有数据文件的写锁时调用(见_locked_append)，否则可能截掉其他会话或进程正在追加的行。
+    """
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return
+    if size == 0:
+        return
+    with open(path, 'rb') as f:
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        # 向前找到最后一行的起点
+        start = size
+        while start > 0:
+            chunk_start = max(0, start - 65536)
+            f.seek(chunk_start)
+            newline = f.read(start - chunk_start).rfind(b"\n")
+            if newline >= 0:
+                start = chunk_start + newline + 1
+                break
+            start = chunk_start
+        f.seek(start)
+        last = f.read()
+    if not last.strip():
+        return
+    try:
+        json.loads(last)
+    except ValueError:
+        print(f"检测到 {path} 末尾有未写完的行，已截断丢弃")
+        os.truncate(path, start)
+        return
+    with open(path, 'ab') as f:
+        f.write(b"\n")
+
+
+def load_project_meta(data_dir: str) -> Dict[str, Any]:
+    """读取项目元数据文件(meta.json)，不存在时返回空字典"""
+    path = os.path.join(data_dir, META_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_project_meta(data_dir: str, meta: Dict[str, Any]):
+    """原子写入项目元数据文件"""
+    atomic_write_json(os.path.join(data_dir, META_FILE), meta)
+
+
+def schema_hash(input_schema: Dict[str, Any], result_schema: Dict[str, Any]) -> str:
+    """项目Schema的哈希，用于判断统计信息、缓存等是否对应当前Schema"""
+    text = json.dumps([input_schema or {}, result_schema or {}], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def file_signature(path: str) -> Tuple[int, Optional[int]]:
+    """文件的(字节数, 修改时间ns)，文件不存在时为(0, None)"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 0, None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def save_project_stats(data_dir: str, stats: Dict[str, Any]) -> bool:
+    """把统计信息写入meta.json，与已保存的内容相同时不写入；返回是否写入
+
+    读-改-写在meta_lock内完成，不会用旧内容覆盖其他会话同时分配的next_id。
+    """
+    with meta_lock(data_dir):
+        meta = load_project_meta(data_dir)
+        saved = dict(meta.get(STATS_KEY, {}))
+        saved.pop("updated_at", None)
+        if saved == stats:
+            return False
+        meta[STATS_KEY] = dict(stats, updated_at=time.time())
+        save_project_meta(data_dir, meta)
+        return True
+
+
+def load_project_stats(data_dir: str, splits=("train", "val"), store_factory=None) -> Dict[str, Any]:
+    """读取项目统计信息，只需读取meta.json和stat数据文件
+
+    文件大小或修改时间与记录不一致(统计信息缺失、外部修改了文件、写入统计前崩溃)的数据集
+    会重新加载计数，并把结果写回meta.json。store_factory(data_dir, split)创建数据集的存储，默认为JsonlSplitStore。
+    """
+    stats = dict(load_project_meta(data_dir).get(STATS_KEY, {}))
+    stale = False
+    for split in splits:
+        store = (store_factory or JsonlSplitStore)(data_dir, split)
+        split_stats = stats.get(split)
+        if (isinstance(split_stats, dict) and not os.path.exists(store.legacy_path)
+                and (split_stats.get("bytes"), split_stats.get("mtime_ns")) == store.signature()):
+            continue
+        if store.is_large():
+            store.load_index()
+        else:
+            store.load()
+        stats[split] = store.stats()
+        stale = True
+    config_path = os.path.join(data_dir, "config.json")
+    if "schema_hash" not in stats and os.path.exists(config_path):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        stats["schema_hash"] = schema_hash(config.get("input_schema", {}), config.get("result_schema", {}))
+        stale = True
+    if stale:
+        stats.pop("updated_at", None)
+        save_project_stats(data_dir, stats)
+        stats = load_project_meta(data_dir).get(STATS_KEY, stats)
+    return stats
+
+
+class _FileLock:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        # 当前持有线程的重入深度，以及持有flock的锁文件句柄
+        self.depth = 0
+        self.file = None
+
+
+_file_locks: Dict[str, _FileLock] = {}
+_file_locks_guard = threading.Lock()
+
+
+@contextmanager
+def file_lock(path: str):
+    """对锁文件path加排他锁
+
+    进程内同一路径共享一把可重入锁(同一线程可以嵌套获取)，有fcntl时最外层同时对锁文件加flock，与其他进程互斥。
+    锁文件单独存放、从不被替换，数据文件被rename替换(重写、迁移)时锁依然有效。
+    """
+    key = os.path.abspath(path)
+    with _file_locks_guard:
+        lock = _file_locks.get(key)
+        if lock is None:
+            lock = _file_locks[key] = _FileLock(key)
+    with lock.lock:
+        if lock.depth == 0 and fcntl is not None:
+            lock.file = open(key, 'ab')
+            fcntl.flock(lock.file.fileno(), fcntl.LOCK_EX)
+        lock.depth += 1
+        try:
+            yield
+        finally:
+            lock.depth -= 1
+            if lock.depth == 0 and lock.file is not None:
+                # 关闭句柄即释放flock
+                lock.file.close()
+                lock.file = None
+
+
+def meta_lock(data_dir: str):
+    """meta.json的读-改-写锁(锁文件 meta.json.lock)，id分配器和统计信息的更新都在锁内完成"""
+    return file_lock(os.path.join(data_dir, META_FILE + ".lock"))
+
+
+def split_lock(data_dir: str, split: str):
+    """数据集的写锁(锁文件 <split>_data.lock)，各存储引擎共用，迁移存储引擎时也不会变化"""
+    return file_lock(os.path.join(data_dir, f"{split}_data.lock"))
+
+
+@contextmanager
+def _locked_append(path: str, lock):
+    """在lock(数据文件的file_lock)内以追加方式打开文件，先修复末尾的残行，保证新内容从完整的行开始"""
+    with lock, open(path, 'ab') as f:
+        repair_jsonl_tail(path)
+        yield f
+
+
+def _append_lines(path: str, lines: str, lock, sync: bool = True):
+    """在文件锁内追加写入，sync=True时fsync"""
+    with _locked_append(path, lock) as f:
+        f.write(lines.encode("utf-8"))
+        f.flush()
+        if sync:
+            os.fsync(f.fileno())
+
+
+class WriteAheadLog:
+    """会话级预写日志
+
+    记录已发生但尚未持久化到数据文件的修改(如 modify_item)，保存数据后清空，加载项目时回放，
+    避免进程崩溃或Streamlit重跑导致修改丢失。每个管理器(会话)写自己的 wal-<owner>.jsonl，
+    保存时只清空自己的日志，也只回放自己的日志，不会删除或提交其他会话未保存的修改。
+    日志文件存在期间所属会话一直对它持有flock；会话结束或进程崩溃后锁随之释放，
+    其他会话加载项目时接管这些无人持有的日志(见adopt_orphans)，旧版本的项目级 wal.jsonl 也这样接管。
+    每条记录只flush到操作系统而不逐条fsync，批量编辑时开销很小。
+    """
+
+    def __init__(self, data_dir: str, owner: Optional[str] = None):
+        self.data_dir = data_dir
+        self.owner = owner or uuid.uuid4().hex[:12]
+        self.path = os.path.join(data_dir, f"wal-{self.owner}.jsonl")
+        # 持有flock的日志文件句柄，首次追加时打开
+        self._file = None
+
+    def _open(self):
+        while self._file is None:
+            f = open(self.path, 'ab')
+            if fcntl is None:
+                self._file = f
+                break
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                same = os.stat(self.path).st_ino == os.fstat(f.fileno()).st_ino
+            except FileNotFoundError:
+                same = False
+            if same:
+                self._file = f
+            else:
+                # 打开后、加锁前文件被其他会话当作遗留日志接管并删除，重新创建
+                f.close()
+        return self._file
+
+    def append(self, entry: Dict[str, Any]):
+        """追加一条日志"""
+        f = self._open()
+        f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+        f.flush()
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """读取本会话的全部日志"""
+        return list(iter_jsonl(self.path))
+
+    def clear(self):
+        """清空本会话的日志"""
+        if self._file is not None and fcntl is not None:
+            # 删除后再释放锁，其他会话不会把已清空的日志当作遗留日志接管
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._file.close()
+            self._file = None
+            return
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def adopt_orphans(self) -> int:
+        """接管项目目录中无人持有的其他日志，返回接管的记录数
+
+        崩溃或已结束的会话留下的 wal-*.jsonl(对其加flock成功即无人持有)和旧版本的 wal.jsonl，
+        其中的记录追加到本会话的日志并fsync后删除原文件，随后与本会话的日志一起回放。
+        没有fcntl时无法判断其他会话是否还在运行，只接管旧版本的 wal.jsonl。
+        """
+        adopted = 0
+        for name in sorted(os.listdir(self.data_dir)):
+            path = os.path.join(self.data_dir, name)
+            legacy = name == "wal.jsonl"
+            if path == self.path or not (legacy or (name.startswith("wal-") and name.endswith(".jsonl"))):
+                continue
+            if fcntl is None and not legacy:
+                continue
+            with open(path, 'ab') as f:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        # 所属会话还在运行
+                        continue
+                entries = list(iter_jsonl(path))
+                if entries:
+                    own = self._open()
+                    own.write("".join(json.dumps(entry, ensure_ascii=False) + "\n"
+                                      for entry in entries).encode("utf-8"))
+                    own.flush()
+                    os.fsync(own.fileno())
+                    adopted += len(entries)
+                os.remove(path)
+        if adopted:
+            print(f"已接管其他会话遗留的{adopted}条预写日志")
+        return adopted
+
+
+class _Replay:
+    """按顺序回放JSONL数据行和操作行
+
+    同一id以首次出现的条目为准；删除用None占位，最后统一移除，
+    重复id的后续位置单独记录，删除首个条目后由下一个接替。
+    """
+
+    def __init__(self):
+        self.records = []
+        self.positions = {}
+        self.duplicates = {}
+        self.deleted = 0
+
+    def add(self, record):
+        self._index(record_key(record), len(self.records))
+        self.records.append(record)
+
+    def _index(self, key, pos):
+        if key is None:
+            return
+        if key not in self.positions:
+            self.positions[key] = pos
+        else:
+            self.duplicates.setdefault(key, []).append(pos)
+
+    def _unindex(self, key):
+        rest = self.duplicates.get(key)
+        if rest:
+            self.positions[key] = rest.pop(0)
+        else:
+            self.positions.pop(key, None)
+
+    def apply(self, op):
+        key = op.get("id")
+        pos = self.positions.get(key) if key is not None else None
+        if op[OP_KEY] == "set":
+            record = op["record"]
+            if pos is None:
+                # 找不到原条目时按新增处理，避免丢失数据
+                self.add(record)
+                return
+            self.records[pos] = record
+            new_key = record_key(record)
+            if new_key != key:
+                self._unindex(key)
+                self._index(new_key, pos)
+        elif op[OP_KEY] == "del":
+            if pos is not None:
+                self.records[pos] = None
+                self.deleted += 1
+                self._unindex(key)
+        else:
+            print(f"未知的存储操作: {op[OP_KEY]}")
+
+    def result(self):
+        if self.deleted:
+            return [record for record in self.records if record is not None]
+        return self.records
+
+
+def _index_key(key):
+    """偏移索引键数组中保存的值：int64范围内的整数id原样保存，其余为NO_KEY"""
+    if type(key) is int and NO_KEY < key < 2 ** 63:
+        return key
+    return NO_KEY
+
+
+def _index_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+def _tail_hex(f, covered):
+    """已覆盖部分最后32个字节，用于确认文件只是在末尾追加了内容"""
+    start = max(0, covered - 32)
+    f.seek(start)
+    return f.read(covered - start).hex()
+
+
+class RecordIndex:
+    """数据文件的偏移索引，保存在 <split>_data.jsonl.idx
+
+    按回放后的顺序记录每条有效数据所在行的位置refs和整数id keys(array，每条16字节)，
+    其余的id保存在other_keys {ref: id}。ref = 行起始偏移*2 + 标记位，标记位为1表示该行不是数据本身的
+    json.dumps(ensure_ascii=False)文本(操作行，或外部工具写入的其他格式)，需要解析后才能得到数据和它的序列化文本。
+    索引记录建立时文件的(inode, 字节数, 修改时间)和已覆盖的字节数，文件只在末尾追加了内容时只扫描新增的行。
+    同一id以数组中第一个有效位置为准，与_Replay一致(重复id又修改id的极端情况除外)。
+    """
+
+    def __init__(self):
+        self.refs = array('q')
+        self.keys = array('q')
+        self.other_keys = {}
+        self.signature = None
+        self.covered = 0
+        self.line_count = 0
+        self.tail = ""
+        # 回放操作行时使用，操作较多时才构建: id -> 第一个有效位置，以及出现过多次的id
+        self._positions = None
+        self._duplicates = set()
+        self._ops = 0
+        self._removed = 0
+
+    def __len__(self):
+        return len(self.refs)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["RecordIndex"]:
+        """读取索引文件，不存在或格式不符时返回None"""
+        index = cls()
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                if header.get("version") != INDEX_VERSION or header.get("byteorder") != sys.byteorder:
+                    return None
+                count = header["count"]
+                index.refs.frombytes(f.read(count * 8))
+                index.keys.frombytes(f.read(count * 8))
+            index.other_keys = {ref: key for ref, key in header["other_keys"]}
+            index.signature = header["signature"]
+            index.covered = header["covered"]
+            index.line_count = header["line_count"]
+            index.tail = header["tail"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if len(index.refs) != count or len(index.keys) != count:
+            return None
+        return index
+
+    def save(self, path: str):
+        """原子写入索引文件：一行JSON头部，随后是refs和keys的原始字节"""
+        header = {
+            "version": INDEX_VERSION, "byteorder": sys.byteorder, "count": len(self.refs),
+            "signature": self.signature, "covered": self.covered, "line_count": self.line_count,
+            "tail": self.tail, "other_keys": [[ref, key] for ref, key in self.other_keys.items()]
+        }
+        with atomic_open(path, 'wb') as f:
+            f.write(json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.refs.tofile(f)
+            self.keys.tofile(f)
+
+    def key_at(self, pos: int):
+        """位置pos处数据的id"""
+        key = self.keys[pos]
+        return key if key != NO_KEY else self.other_keys.get(self.refs[pos])
+
+    def add(self, ref: int, key):
+        """在末尾添加一条数据"""
+        pos = len(self.refs)
+        index_key = _index_key(key)
+        self.refs.append(ref)
+        self.keys.append(index_key)
+        if key is not None and index_key == NO_KEY:
+            self.other_keys[ref] = key
+        self._placed(key, pos)
+
+    def find(self, key) -> Optional[int]:
+        """id对应的第一个有效位置，找不到时返回None"""
+        if key is None:
+            return None
+        if self._positions is not None:
+            return self._positions.get(key)
+        return self._scan(key)
+
+    def _scan(self, key):
+        found = None
+        if _index_key(key) != NO_KEY:
+            try:
+                found = self.keys.index(key)
+            except ValueError:
+                pass
+        for ref, other in self.other_keys.items():
+            if other == key:
+                pos = self.refs.index(ref)
+                if found is None or pos < found:
+                    found = pos
+        return found
+
+    def _placed(self, key, pos):
+        if self._positions is None or key is None:
+            return
+        current = self._positions.get(key)
+        if current is None:
+            self._positions[key] = pos
+        else:
+            self._duplicates.add(key)
+            self._positions[key] = min(current, pos)
+
+    def _moved(self, key):
+        """key原来的第一个位置被删除或改为其他id后，重新确定它的位置"""
+        if self._positions is None:
+            return
+        if key in self._duplicates:
+            pos = self._scan(key)
+            if pos is not None:
+                self._positions[key] = pos
+                return
+        self._positions.pop(key, None)
+
+    def _apply(self, op, ref):
+        self._ops += 1
+        if self._positions is None and self._ops > INDEX_DICT_MIN_OPS:
+            self._positions = {}
+            for pos in range(len(self.refs)):
+                if self.refs[pos] >= 0:
+                    self._placed(self.key_at(pos), pos)
+        key = op.get("id")
+        pos = self.find(key)
+        if op[OP_KEY] == "set":
+            new_key = record_key(op["record"])
+            if pos is None:
+                # 找不到原条目时按新增处理，避免丢失数据
+                self.add(ref, new_key)
+                return
+            self.other_keys.pop(self.refs[pos], None)
+            index_key = _index_key(new_key)
+            self.refs[pos] = ref
+            self.keys[pos] = index_key
+            if new_key is not None and index_key == NO_KEY:
+                self.other_keys[ref] = new_key
+            if new_key != key:
+                self._moved(key)
+                self._placed(new_key, pos)
+        elif op[OP_KEY] == "del":
+            if pos is not None:
+                # 先标记为-1，扫描结束后统一移除，避免逐条移动数组
+                self.other_keys.pop(self.refs[pos], None)
+                self.refs[pos] = -1
+                self.keys[pos] = NO_KEY
+                self._removed += 1
+                self._moved(key)
+        else:
+            print(f"未知的存储操作: {op[OP_KEY]}")
+
+    def update(self, path: str) -> bool:
+        """使索引与数据文件一致，返回索引是否有变化
+
+        文件未变化时直接返回；同一文件只在末尾追加了内容(已覆盖部分的最后几个字节不变)时只扫描新增的行，
+        否则(压缩重写、外部修改)重新扫描整个文件。扫描时每行解析一次，数据行同时检查是否为规范的序列化文本。
+        """
+        signature = _index_signature(path)
+        if signature == self.signature:
+            return False
+        start = 0
+        if self.signature and signature and signature[0] == self.signature[0] and signature[1] >= self.covered:
+            with open(path, 'rb') as f:
+                if _tail_hex(f, self.covered) == self.tail:
+                    start = self.covered
+        if start == 0:
+            self.__init__()
+        if signature:
+            offset = start
+            with open(path, 'rb') as f:
+                f.seek(start)
+                for raw in f:
+                    line = raw[:-1] if raw.endswith(b"\n") else raw
+                    if not line.strip():
+                        offset += len(raw)
+                        continue
+                    try:
+                        obj = json.loads(line)
+                    except ValueError:
+                        if line is not raw:
+                            raise
+                        # 没有换行符的残行(其他进程正在写入或崩溃残留)，不纳入索引，下次更新时再处理
+                        break
+                    line_start = offset
+                    offset += len(raw)
+                    self.line_count += 1
+                    if OP_KEY in obj:
+                        self._apply(obj, line_start * 2 + 1)
+                    else:
+                        canonical = json.dumps(obj, ensure_ascii=False).encode("utf-8") == line
+                        self.add(line_start * 2 + (0 if canonical else 1), record_key(obj))
+                self.covered = offset
+                self.tail = _tail_hex(f, offset)
+        self._finish()
+        self.signature = signature
+        return True
+
+    def _finish(self):
+        if self._removed:
+            refs, keys = array('q'), array('q')
+            for ref, key in zip(self.refs, self.keys):
+                if ref >= 0:
+                    refs.append(ref)
+                    keys.append(key)
+            self.refs, self.keys = refs, keys
+        self._positions = None
+        self._duplicates = set()
+        self._ops = 0
+        self._removed = 0
+
+
+class JsonlSplitStore:
+    """单个数据集(train/val)的追加写JSONL存储
+
+    每行保存一条数据，新增数据直接追加到文件末尾，无需重写整个数据集；
+    对已有数据的修改以 {"__op__": "set", "id": ..., "record": ...} 操作行追加，
+    删除以 {"__op__": "del", "id": ...} 操作行追加，加载时按顺序回放(同一id以首次出现的条目为准)。过期行过多时重写文件(压缩)。
+    追加写入后fsync，重写通过临时文件+rename原子完成，崩溃不会留下截断的文件。
+    旧版本的 <split>_data.json 会在首次加载时自动迁移为 <split>_data.jsonl。
+    """
+
+    def __init__(self, data_dir: str, split: str):
+        self.data_dir = data_dir
+        self.split = split
+        self.path = os.path.join(data_dir, f"{split}_data.jsonl")
+        self.legacy_path = os.path.join(data_dir, f"{split}_data.json")
+        # 大文件的偏移索引(见RecordIndex)
+        self.index_path = self.path + ".idx"
+        # 文件总行数与有效数据条数，用于判断是否需要压缩
+        self.line_count = 0
+        self.live_count = 0
+
+    def exists(self) -> bool:
+        """数据文件(新格式或旧格式)是否存在"""
+        return os.path.exists(self.path) or os.path.exists(self.legacy_path)
+
+    def migrate_legacy(self) -> bool:
+        """将旧版本的JSON数组文件迁移为JSONL格式，原文件重命名为 .bak 备份"""
+        if os.path.exists(self.path) or not os.path.exists(self.legacy_path):
+            return False
+        with open(self.legacy_path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        self.rewrite(records)
+        os.replace(self.legacy_path, self.legacy_path + ".bak")
+        print(f"已将 {self.legacy_path} 迁移为 {self.path}")
+        return True
+
+    def load(self) -> List[Dict[str, Any]]:
+        """读取全部数据，按顺序回放操作行"""
+        self.migrate_legacy()
+        replay = _Replay()
+        self.line_count = 0
+        for obj in iter_jsonl(self.path):
+            self.line_count += 1
+            if OP_KEY in obj:
+                replay.apply(obj)
+            else:
+                replay.add(obj)
+        records = replay.result()
+        self.live_count = len(records)
+        return records
+
+    def signature(self) -> Tuple[int, Optional[int]]:
+        """数据文件的(字节数, 修改时间ns)，任何写入都会改变它"""
+        return file_signature(self.path)
+
+    def lock(self):
+        """数据集的写锁(见split_lock)，各写入方法内部都会获取；需要"读签名-写入-发布"整体互斥时由调用方持有"""
+        return split_lock(self.data_dir, self.split)
+
+    def is_large(self) -> bool:
+        """数据文件是否大到应该按需读取(见lazy_records.py)"""
+        return file_signature(self.path)[0] >= LAZY_LOAD_MIN_BYTES
+
+    def load_index(self) -> RecordIndex:
+        """读取偏移索引并扫描文件中新增的部分，同步行数统计；不会解析已建立索引的数据行"""
+        self.migrate_legacy()
+        index = RecordIndex.load(self.index_path) or RecordIndex()
+        if index.update(self.path):
+            index.save(self.index_path)
+        self.line_count = index.line_count
+        self.live_count = len(index)
+        return index
+
+    def append(self, records: List[Dict[str, Any]]):
+        """将新数据追加到文件末尾"""
+        if not records:
+            return
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        _append_lines(self.path, lines, self.lock())
+        self.line_count += len(records)
+        self.live_count += len(records)
+
+    def write_updates(self, updates: List[Tuple[Any, Dict[str, Any]]], deletes: Optional[List[Any]] = None):
+        """以操作行的形式追加已有数据的删除和修改
+
+        updates为(原id, 修改后的条目)列表，deletes为被删除条目的id列表。
+        删除先于修改写入，这样重复id的条目被删除后，修改会落到接替它的条目上。
+        """
+        deletes = deletes or []
+        if not updates and not deletes:
+            return
+        lines = "".join(json.dumps({OP_KEY: "del", "id": key}, ensure_ascii=False) + "\n" for key in deletes)
+        lines += "".join(
+            json.dumps({OP_KEY: "set", "id": key, "record": record}, ensure_ascii=False) + "\n"
+            for key, record in updates
+        )
+        _append_lines(self.path, lines, self.lock())
+        self.line_count += len(updates) + len(deletes)
+        self.live_count -= len(deletes)
+
+    def stats(self) -> Dict[str, Any]:
+        """当前数据文件的统计信息(需要先load，之后由各写入方法维护)"""
+        size, mtime_ns = self.signature()
+        return {"count": self.live_count, "lines": self.line_count, "bytes": size, "mtime_ns": mtime_ns}
+
+    def needs_compaction(self) -> bool:
+        """过期行是否多到需要压缩"""
+        stale = self.line_count - self.live_count
+        return stale > COMPACT_MIN_STALE_LINES and stale > self.live_count
+
+    def rewrite(self, records: List[Dict[str, Any]]):
+        """用给定数据原子地重写整个文件(压缩)，大文件同时写出偏移索引"""
+        with self.lock():
+            self._rewrite(records)
+
+    def _rewrite(self, records: List[Dict[str, Any]]):
+        index = RecordIndex()
+        offset = 0
+        with atomic_open(self.path, 'wb') as f:
+            for record in records:
+                line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                f.write(line)
+                index.add(offset * 2, record_key(record))
+                offset += len(line)
+        self.line_count = len(index)
+        self.live_count = len(index)
+        if offset >= LAZY_LOAD_MIN_BYTES:
+            with open(self.path, 'rb') as f:
+                index.tail = _tail_hex(f, offset)
+            index.covered = offset
+            index.line_count = len(index)
+            index.signature = _index_signature(self.path)
+            index.save(self.index_path)
+        elif os.path.exists(self.index_path):
+            os.remove(self.index_path)
+
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# 模块都在仓库根目录，直接运行pytest时也能导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """在临时目录中运行(数据管理器使用相对路径data/)"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def manager(workdir):
+    """带有简单Schema的空项目"""
+    from data_manager import UniversalDataManager
+    creator = UniversalDataManager()
+    creator.create_project("demo",
+                           {"type": "object", "properties": {"query": {"type": "string"}}, "required": ["query"]},
+                           {"type": "object", "properties": {"intent": {"type": "string"}}})
+    return UniversalDataManager(project_name="demo")
+
+
+def make_entries(count, start=0):
+    return [{"Input": {"query": f"问题{i}"}, "Result": {"intent": f"意图{i}"}} for i in range(start, start + count)]
@@ -0,0 +1,62 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from data_export import export_records, history_to_messages, to_chat_record
+
+
+def records(count, skip_every=0, fail_at=None):
+    for i in range(count):
+        if i == fail_at:
+            raise RuntimeError("读取失败")
+        record = {"Input": {"query": f"q{i}"}, "Result": {"id": i, "response": f"r{i}"}}
+        if skip_every and i % skip_every == 0:
+            del record["Result"]["response"]
+        yield record
+
+
+def read_jsonl(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_history_formats():
+    assert history_to_messages([{"user": "u", "assistant": "a"}, {"role": "user", "content": "u2"}]) == [
+        {"role": "user", "content": "u"}, {"role": "assistant", "content": "a"}, {"role": "user", "content": "u2"}]
+    assert history_to_messages(["u", "a"]) == [{"role": "user", "content": "u"}, {"role": "assistant", "content": "a"}]
+    assert to_chat_record({"Input": {"query": "q"}, "Result": {}}) is None
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_jsonl_gzip_roundtrip(tmp_path, workers):
+    report = export_records(records(25), str(tmp_path), fmt="jsonl", compress=True, workers=workers, batch_size=4)
+    (file,) = report["files"]
+    assert file["path"].endswith(".jsonl.gz")
+    assert [row["Result"]["id"] for row in read_jsonl(file["path"])] == list(range(25))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_chat_shards_count_written_records(tmp_path, workers):
+    report = export_records(records(100, skip_every=3), str(tmp_path), fmt="chat", shard_size=10,
+                            workers=workers, batch_size=7, system_prompt="sys")
+    assert report["records"] == 66
+    assert report["skipped"] == 34
+    assert [file["records"] for file in report["files"]] == [10] * 6 + [6]
+    assert sorted(os.listdir(tmp_path)) == [f"export-{shard:05d}.jsonl" for shard in range(7)]
+    first = read_jsonl(report["files"][0]["path"])[0]
+    assert [message["role"] for message in first["messages"]] == ["system", "user", "assistant"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_failed_export_removes_written_shards(tmp_path, workers):
+    with pytest.raises(RuntimeError):
+        export_records(records(100, fail_at=55), str(tmp_path), shard_size=10, workers=workers, batch_size=5)
+    assert os.listdir(tmp_path) == []
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        export_records([], str(tmp_path), fmt="xml")
@@ -0,0 +1,79 @@
+import gzip
+import io
+import json
+
+import pytest
+
+import data_import
+from conftest import make_entries
+from data_import import detect_format, import_dataset, iter_json_array_rows
+
+ROWS = [
+    {"q": "a]b,c", "n": 12345, "f": -1.5e10},
+    [],
+    {"nested": {"x": [1, {"y": "\\\"}"}]}, "中文": "值"},
+    "字符串, ]",
+    1234567890,
+    None,
+    True,
+]
+
+
+@pytest.mark.parametrize("read_size", [1, 2, 3, 5, 8, 64])
+def test_json_array_read_boundaries(monkeypatch, read_size):
+    monkeypatch.setattr(data_import, "JSON_READ_SIZE", read_size)
+    text = " \n[ " + " ,\n ".join(json.dumps(row, ensure_ascii=False) for row in ROWS) + " ]\n"
+    assert list(iter_json_array_rows(io.StringIO(text))) == ROWS
+
+
+def test_number_split_at_read_boundary(monkeypatch):
+    # 数字恰好被读取边界截断(12|345)时不能解析为12
+    monkeypatch.setattr(data_import, "JSON_READ_SIZE", 3)
+    assert list(iter_json_array_rows(io.StringIO("[12345]"))) == [12345]
+
+
+def test_empty_array(monkeypatch):
+    monkeypatch.setattr(data_import, "JSON_READ_SIZE", 1)
+    assert list(iter_json_array_rows(io.StringIO(" [ ] "))) == []
+
+
+@pytest.mark.parametrize("text, message", [
+    ('{"a": 1}', "顶层必须是数组"),
+    ("[1, 2", "没有结束"),
+    ("[1 2]", "缺少逗号"),
+    ('[{"a": }]', "不合法"),
+])
+def test_json_array_errors(monkeypatch, text, message):
+    monkeypatch.setattr(data_import, "JSON_READ_SIZE", 2)
+    with pytest.raises(ValueError, match=message):
+        list(iter_json_array_rows(io.StringIO(text)))
+
+
+def test_detect_format():
+    assert detect_format("a.ndjson") == "jsonl"
+    assert detect_format("a.JSON.gz") == "json"
+    assert detect_format("a.tsv") == "csv"
+    with pytest.raises(ValueError):
+        detect_format("a.txt")
+
+
+def test_import_jsonl_gz_with_mapping(manager, workdir):
+    path = workdir / "rows.jsonl.gz"
+    rows = [{"text": f"问题{i}", "label": f"意图{i}"} for i in range(5)] + [{"text": 1, "label": "x"}]
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write("\n".join(json.dumps(row, ensure_ascii=False) for row in rows))
+    report = import_dataset(manager, str(path), columns={"text": "Input.query", "label": "Result.intent"},
+                            chunk_size=2)
+    assert report["imported"] == 5
+    assert report["invalid"] == 1
+    assert [item["Input"]["query"] for item in manager.train_data] == [f"问题{i}" for i in range(5)]
+    assert [item["Result"]["id"] for item in manager.train_data] == [1, 2, 3, 4, 5]
+
+
+def test_import_dry_run_does_not_write(manager, workdir):
+    manager.add_generated_data(make_entries(2))
+    path = workdir / "rows.json"
+    path.write_text(json.dumps(make_entries(3, start=10), ensure_ascii=False), encoding="utf-8")
+    report = import_dataset(manager, str(path), dry_run=True)
+    assert report["imported"] == 3
+    assert len(manager.train_data) == 2
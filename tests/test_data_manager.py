@@ -0,0 +1,58 @@
+from conftest import make_entries
+from data_manager import UniversalDataManager
+
+
+def reopen():
+    return UniversalDataManager(project_name="demo")
+
+
+def test_add_modify_delete_persist(manager):
+    manager.add_generated_data(make_entries(3))
+    assert [item["Result"]["id"] for item in manager.train_data] == [1, 2, 3]
+    manager.modify_item("train", 2, {"Result.intent": "改"})
+    manager.delete_item(1)
+    manager.save_data()
+    other = reopen()
+    assert [(item["Result"]["id"], item["Result"]["intent"]) for item in other.train_data] == [(2, "改"), (3, "意图2")]
+
+
+def test_ids_not_reused_after_delete(manager):
+    manager.add_generated_data(make_entries(2))
+    manager.delete_item(2)
+    manager.save_data()
+    manager.add_generated_data(make_entries(1))
+    assert [item["Result"]["id"] for item in reopen().train_data] == [1, 3]
+
+
+def test_unsaved_modification_replayed_from_wal(manager):
+    manager.add_generated_data(make_entries(2))
+    manager.modify_item("train", 1, {"Result.intent": "未保存"})
+    # 模拟会话崩溃：日志文件的锁随句柄关闭释放
+    manager.wal._file.close()
+    assert reopen().get_item(1)["Result"]["intent"] == "未保存"
+
+
+def test_sessions_copy_on_write(manager):
+    manager.add_generated_data(make_entries(2))
+    other = reopen()
+    other.modify_item("train", 1, {"Result.intent": "其他会话"})
+    assert manager.get_item(1)["Result"]["intent"] == "意图0"
+
+
+def test_filters_share_indexes_until_modified(manager):
+    manager.add_generated_data(make_entries(20))
+    first, second = reopen(), reopen()
+    assert len(first.filter_by_regex("train", "问题1[0-9]")) == 10
+    assert first._get_trigram_index("train") is second._get_trigram_index("train")
+    first.modify_item("train", 5, {"Result.intent": "特殊标签"})
+    assert len(first.filter_by_tags("train", ["特殊标签"])) == 1
+    assert second.filter_by_tags("train", ["特殊标签"]) == []
+    assert len(second.filter_by_regex("train", "问题1[0-9]")) == 10
+
+
+def test_regex_prefilter_matches_full_scan(manager):
+    manager.add_generated_data(make_entries(30))
+    manager.delete_item(3)
+    manager.modify_item("train", 12, {"Input.query": "问题99"})
+    expected = [item for item in manager.train_data if "问题1" in item["Input"]["query"]]
+    assert manager.filter_by_regex("train", "问题1") == expected
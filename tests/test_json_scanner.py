@@ -0,0 +1,72 @@
+import pytest
+
+from json_scanner import JsonScanner, scan_json
+
+
+def values(text):
+    return [item.value for item in scan_json(text)]
+
+
+def test_values_inside_prose_and_code_fences():
+    text = '说明文字 {"a": 1} 中间\n```json\n[1, 2]\n```\n结尾{"b": "}"}'
+    assert values(text) == [{"a": 1}, [1, 2], {"b": "}"}]
+
+
+def test_offsets_point_at_value():
+    text = 'xx {"a": [1]} yy'
+    (item,) = scan_json(text)
+    assert text[item.start:item.end] == '{"a": [1]}'
+
+
+def test_brackets_and_escapes_inside_strings():
+    text = r'{"s": "a\"]}[{b", "t": "\\"}'
+    assert values(text) == [{"s": 'a"]}[{b', "t": "\\"}]
+
+
+def test_outer_prose_brackets_fall_back_to_nested_values():
+    text = '(见[附录 {"x": 1} 和 {"y": 2}])'
+    assert values(text) == [{"x": 1}, {"y": 2}]
+
+
+def test_unmatched_closer_ignored():
+    assert values('] } {"a": 1}') == [{"a": 1}]
+
+
+def test_mismatched_bracket_keeps_closed_children():
+    assert values('{"a": [1, {"b": 2}}') == [{"b": 2}]
+
+
+def test_quote_in_prose_does_not_swallow_brackets():
+    # 括号内说明文字中的引号没有闭合，遇到换行后恢复括号跟踪
+    text = '[他说"你好\n{"a": 1}]'
+    assert values(text) == [{"a": 1}]
+
+
+def test_unclosed_outer_bracket_emits_closed_children_on_finish():
+    scanner = JsonScanner()
+    assert scanner.feed('[{"a": 1}, {"b": 2}, {"c"') == []
+    assert [item.value for item in scanner.finish()] == [{"a": 1}, {"b": 2}]
+
+
+def test_deep_nesting_does_not_recurse():
+    text = "[" * 5000 + '{"a": 1}'
+    assert values(text) == [{"a": 1}]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_incremental_feed_matches_single_pass(size):
+    text = '前言 {"q": "a\\"}b", "n": [1, 2, {"x": null}]} 后记 [true, "]"] {"bad": }'
+    scanner = JsonScanner()
+    found = []
+    for i in range(0, len(text), size):
+        found.extend(scanner.feed(text[i:i + size]))
+    found.extend(scanner.finish())
+    assert found == scan_json(text)
+    assert scanner.slice(found[0].start, found[0].end) == text[found[0].start:found[0].end]
+
+
+def test_on_close_reports_nested_objects_before_outer_closes():
+    closed = []
+    scanner = JsonScanner(on_close=lambda start, end: closed.append(scanner.slice(start, end)))
+    scanner.feed('[{"Input": {}, "Result": {"id": 1}}, ')
+    assert '{"Input": {}, "Result": {"id": 1}}' in closed
@@ -0,0 +1,81 @@
+import pytest
+
+from schema_validator import EntryValidator, SchemaError, compile_schema, summarize_errors
+
+
+def errors(schema, value):
+    return [message for _, message in compile_schema(schema).errors(value)]
+
+
+def test_trivial_schema():
+    assert compile_schema({}).trivial
+    assert compile_schema(None).is_valid({"any": 1})
+
+
+def test_type_checks_distinguish_bool_and_integer():
+    assert compile_schema({"type": "integer"}).is_valid(3)
+    assert compile_schema({"type": "integer"}).is_valid(3.0)
+    assert not compile_schema({"type": "integer"}).is_valid(True)
+    assert compile_schema({"type": ["string", "null"]}).is_valid(None)
+
+
+def test_nested_paths():
+    schema = {"type": "object", "required": ["history"],
+              "properties": {"history": {"type": "array", "items": {
+                  "type": "object", "properties": {"role": {"enum": ["user", "assistant"]}}}}}}
+    paths = [path for path, _ in compile_schema(schema).errors({"history": [{"role": "user"}, {"role": "x"}]})]
+    assert paths == [("history", 1, "role")]
+    assert errors(schema, {}) == ["缺少必填字段"]
+
+
+def test_additional_properties_false():
+    schema = {"type": "object", "properties": {"a": {}}, "additionalProperties": False}
+    assert compile_schema(schema).is_valid({"a": 1})
+    assert not compile_schema(schema).is_valid({"a": 1, "b": 2})
+
+
+@pytest.mark.parametrize("value, multiple, valid", [
+    (10, 5, True),
+    (7, 5, False),
+    (0.3, 0.1, True),
+    (0.35, 0.1, False),
+    (float("nan"), 0.5, False),
+    (float("inf"), 2, False),
+    (1e308, 1e-308, False),
+])
+def test_multiple_of(value, multiple, valid):
+    assert compile_schema({"multipleOf": multiple}).is_valid(value) is valid
+
+
+def test_string_and_combinators():
+    assert errors({"type": "string", "minLength": 2, "pattern": "^a"}, "b") != []
+    assert compile_schema({"anyOf": [{"type": "string"}, {"type": "integer"}]}).is_valid(1)
+    assert not compile_schema({"oneOf": [{"type": "number"}, {"type": "integer"}]}).is_valid(1)
+    assert not compile_schema({"not": {"type": "null"}}).is_valid(None)
+
+
+@pytest.mark.parametrize("schema", [
+    {"type": "strng"},
+    {"properties": []},
+    {"required": "a"},
+    {"enum": "a"},
+    "object",
+])
+def test_invalid_schema_raises(schema):
+    with pytest.raises(SchemaError):
+        compile_schema(schema)
+
+
+def test_unsupported_keywords_are_reported():
+    validator = EntryValidator({"type": "object", "properties": {"a": {"$ref": "#/x"}}}, {})
+    assert validator.ignored_keywords == ["Input.a.$ref"]
+
+
+def test_entry_validator_ignores_result_id():
+    validator = EntryValidator({"type": "object"},
+                               {"type": "object", "required": ["id", "intent"],
+                                "properties": {"id": {"type": "string"}, "intent": {"type": "string"}}})
+    assert validator.validate({"Input": {}, "Result": {"id": 3, "intent": "x"}}) == []
+    invalid = validator.validate_batch([{"Input": {}, "Result": {"id": 1}}, "bad", {"Input": {}}])
+    assert sorted(invalid) == [0, 1, 2]
+    assert summarize_errors(invalid)[0][1] == 1
@@ -0,0 +1,119 @@
+import json
+import os
+
+from storage import OP_KEY, JsonlSplitStore, WriteAheadLog, iter_jsonl, repair_jsonl_tail
+
+
+def write_lines(path, objects, tail=""):
+    with open(path, "w", encoding="utf-8") as f:
+        for obj in objects:
+            f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        f.write(tail)
+
+
+def record(key, text="x"):
+    return {"Input": {"query": text}, "Result": {"id": key}}
+
+
+def test_replay_set_and_del(tmp_path):
+    store = JsonlSplitStore(str(tmp_path), "train")
+    write_lines(store.path, [
+        record(1), record(2), record(3),
+        {OP_KEY: "set", "id": 2, "record": record(2, "改")},
+        {OP_KEY: "del", "id": 1},
+    ])
+    records = store.load()
+    assert [(r["Result"]["id"], r["Input"]["query"]) for r in records] == [(2, "改"), (3, "x")]
+    assert store.line_count == 5
+    assert store.live_count == 2
+
+
+def test_replay_duplicate_ids_first_wins(tmp_path):
+    store = JsonlSplitStore(str(tmp_path), "train")
+    write_lines(store.path, [
+        record(1, "a"), record(1, "b"),
+        {OP_KEY: "set", "id": 1, "record": record(1, "a2")},
+        # 删除首个条目后由下一个重复条目接替，之后的修改落在它上面
+        {OP_KEY: "del", "id": 1},
+        {OP_KEY: "set", "id": 1, "record": record(1, "b2")},
+    ])
+    assert [r["Input"]["query"] for r in store.load()] == ["b2"]
+
+
+def test_replay_set_changes_id_and_unknown_id_appends(tmp_path):
+    store = JsonlSplitStore(str(tmp_path), "train")
+    write_lines(store.path, [
+        record(1),
+        {OP_KEY: "set", "id": 1, "record": record(5)},
+        {OP_KEY: "set", "id": 9, "record": record(9)},
+        {OP_KEY: "del", "id": 1},
+    ])
+    assert [r["Result"]["id"] for r in store.load()] == [5, 9]
+
+
+def test_append_and_write_updates_roundtrip(tmp_path):
+    store = JsonlSplitStore(str(tmp_path), "train")
+    store.append([record(1), record(2), record(3)])
+    store.write_updates([(3, record(3, "改"))], deletes=[2])
+    reloaded = JsonlSplitStore(str(tmp_path), "train").load()
+    assert [(r["Result"]["id"], r["Input"]["query"]) for r in reloaded] == [(1, "x"), (3, "改")]
+
+
+def test_rewrite_compacts(tmp_path):
+    store = JsonlSplitStore(str(tmp_path), "train")
+    store.append([record(i) for i in range(5)])
+    store.write_updates([], deletes=[0, 1])
+    store.rewrite(store.load())
+    with open(store.path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
+    assert store.line_count == store.live_count == 3
+
+
+def test_torn_tail_skipped_then_repaired(tmp_path):
+    path = str(tmp_path / "data.jsonl")
+    write_lines(path, [record(1)], tail='{"Input": {"que')
+    assert [r["Result"]["id"] for r in iter_jsonl(path)] == [1]
+    repair_jsonl_tail(path)
+    with open(path, encoding="utf-8") as f:
+        assert f.read().endswith("}\n")
+
+
+def test_complete_last_line_without_newline(tmp_path):
+    path = str(tmp_path / "data.jsonl")
+    write_lines(path, [record(1)], tail=json.dumps(record(2)))
+    assert [r["Result"]["id"] for r in iter_jsonl(path)] == [1, 2]
+    repair_jsonl_tail(path)
+    assert [r["Result"]["id"] for r in iter_jsonl(path)] == [1, 2]
+    with open(path, encoding="utf-8") as f:
+        assert f.read().endswith("\n")
+
+
+def test_legacy_json_migrated(tmp_path):
+    legacy = tmp_path / "train_data.json"
+    legacy.write_text(json.dumps([record(1), record(2)]), encoding="utf-8")
+    store = JsonlSplitStore(str(tmp_path), "train")
+    assert [r["Result"]["id"] for r in store.load()] == [1, 2]
+    assert os.path.exists(store.path)
+    assert os.path.exists(str(legacy) + ".bak")
+
+
+def test_wal_sessions_do_not_adopt_live_logs(tmp_path):
+    first = WriteAheadLog(str(tmp_path))
+    second = WriteAheadLog(str(tmp_path))
+    first.append({"op": "delete", "split": "train", "id": 1})
+    assert second.adopt_orphans() == 0
+    assert first.entries() == [{"op": "delete", "split": "train", "id": 1}]
+    first.clear()
+    assert not os.path.exists(first.path)
+
+
+def test_wal_adopts_orphaned_and_legacy_logs(tmp_path):
+    crashed = WriteAheadLog(str(tmp_path))
+    crashed.append({"op": "delete", "split": "train", "id": 1})
+    # 模拟会话崩溃：文件句柄关闭后锁随之释放
+    crashed._file.close()
+    write_lines(str(tmp_path / "wal.jsonl"), [{"op": "delete", "split": "val", "id": 2}])
+    wal = WriteAheadLog(str(tmp_path))
+    assert wal.adopt_orphans() == 2
+    assert sorted(entry["id"] for entry in wal.entries()) == [1, 2]
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(wal.path)]